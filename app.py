@@ -1,25 +1,33 @@
 # === CÁC THƯ VIỆN CẦN THIẾT ===
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-from datetime import datetime, timedelta
+from datetime import datetime
+import os
+import re
 import time
 import warnings
-import numpy as np
-import requests
-from io import BytesIO
-import zipfile
+from cafef_parser import DEFAULT_PARSE_WORKERS
+from indicators import calculate_ma, calculate_ema, calculate_bollinger_bands, calculate_rsi
+from indicator_cache import IndicatorCache
+from dataset_registry import DatasetRegistry, MarketDataset
+from downsampling import DEFAULT_POINT_BUDGET
+from charts import build_stock_figure
+from outliers import (detect_outliers_iqr, detect_outliers_zscore, detect_outliers_rolling, remove_outliers,
+                      market_anomalies, DEFAULT_ROLLING_WINDOW, RETURN_COLUMN)
+from screener import FIELDS, OPERATORS, PRESETS, latest_indicator_matrix, run_screen
+from correlation import returns_matrix, top_correlated
+from trading_calendar import session_cutoff
+from instrumentation import PipelineTrace, start_trace, stage
+from vnstock_fetch import DEFAULT_MAX_WORKERS, DEFAULT_RATE_PER_SEC
+from market_store import read_manifest, manifest_date, is_snapshot_current, snapshot_version, slice_ticker
+from ingest import (Reporter, ProgressHandle, VNSTOCK_AVAILABLE, VNSTOCK_STORE_DIR, fetch_vnstock_single,
+                    fetch_vnstock_market, load_cafef_market)
 
 # Tắt warnings
 warnings.filterwarnings('ignore')
 
-# Try import vnstock3
-try:
-    from vnstock3 import Vnstock
-    VNSTOCK_AVAILABLE = True
-except ImportError:
-    VNSTOCK_AVAILABLE = False
+# Kiểm tra vnstock3 (xem ingest.py)
+if not VNSTOCK_AVAILABLE:
     st.warning("⚠️ vnstock3 chưa cài đặt. Sử dụng nguồn dữ liệu CafeF.")
 
 # === CẤU HÌNH TRANG WEB ===
@@ -31,8 +39,7 @@ st.set_page_config(
 )
 
 # === CUSTOM CSS ===
-st.markdown("""
-    <style>
+PAGE_CSS = """
     @import url('https://fonts.googleapis.com/css2?family=Space+Grotesk:wght@400;500;600;700&family=Inter:wght@400;500;600;700&display=swap');
     
     * {
@@ -154,8 +161,19 @@ st.markdown("""
         border-color: rgba(185, 87, 206, 0.5);
         transform: translateY(-3px);
     }
-    </style>
-    """, unsafe_allow_html=True)
+"""
+
+@st.cache_resource
+def minified_css():
+    """CSS rút gọn (bỏ comment, khoảng trắng thừa), dựng 1 lần cho mỗi process.
+    Khối <style> vẫn phải gửi lại mỗi lần rerun nên càng nhỏ càng đỡ tốn băng thông."""
+    css = re.sub(r'/\*.*?\*/', '', PAGE_CSS, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    return f"<style>{css.replace(';}', '}').strip()}</style>"
+
+st.markdown(minified_css(), unsafe_allow_html=True)
 
 # === HEADER ===
 st.markdown("""
@@ -165,375 +183,172 @@ st.markdown("""
     </div>
     """, unsafe_allow_html=True)
 
-# === PHẦN 1: HÀM TẢI DỮ LIỆU ===
-
-def process_cafef_zip(zip_content, date_info):
-    """Xử lý file ZIP từ CafeF với validation tốt hơn"""
-    try:
-        with zipfile.ZipFile(zip_content) as z:
-            # Liệt kê tất cả files
-            all_files = z.namelist()
-            st.info(f"📦 Tổng số files trong ZIP: {len(all_files)}")
-            
-            csv_files = [f for f in all_files if f.lower().endswith('.csv')]
-            
-            if not csv_files:
-                st.error(f"⚠️ Không tìm thấy file CSV trong archive")
-                st.info(f"📁 Files tìm thấy: {', '.join(all_files[:10])}...")
-                return None
-            
-            st.info(f"📂 Tìm thấy {len(csv_files)} file CSV, đang xử lý...")
-            
-            all_data = []
-            processed_files = 0
-            error_files = 0
-            
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            for idx, csv_file in enumerate(csv_files):
-                try:
-                    status_text.text(f"⏳ Đang xử lý file {idx+1}/{len(csv_files)}: {csv_file[:50]}...")
-                    progress_bar.progress((idx + 1) / len(csv_files))
-                    
-                    with z.open(csv_file) as f:
-                        # Thử nhiều encoding
-                        encodings = ['utf-8', 'utf-8-sig', 'latin1', 'cp1252', 'iso-8859-1']
-                        df = None
-                        
-                        for encoding in encodings:
-                            try:
-                                f.seek(0)
-                                df = pd.read_csv(f, encoding=encoding, on_bad_lines='skip')
-                                break
-                            except (UnicodeDecodeError, pd.errors.ParserError):
-                                continue
-                        
-                        if df is None or df.empty:
-                            error_files += 1
-                            continue
-                        
-                        # Debug: Hiển thị columns của file đầu tiên
-                        if idx == 0:
-                            st.info(f"🔍 Cột trong file mẫu: {', '.join(df.columns.tolist()[:10])}")
-                        
-                        # Mapping cột - mở rộng hơn
-                        column_mapping = {
-                            # Tiếng Việt
-                            'Mã CK': '<Ticker>', 'Mã': '<Ticker>', 'TICKER': '<Ticker>', 'Ma': '<Ticker>',
-                            'Ngày': '<DTYYYYMMDD>', 'Thời gian': '<DTYYYYMMDD>', 'NGAY': '<DTYYYYMMDD>',
-                            'ThoiGian': '<DTYYYYMMDD>', 'Thoi gian': '<DTYYYYMMDD>',
-                            'Mở cửa': '<Open>', 'Giá mở cửa': '<Open>', 'OPEN': '<Open>', 'GiaMoCua': '<Open>',
-                            'Cao nhất': '<High>', 'Giá cao nhất': '<High>', 'HIGH': '<High>', 'GiaCaoNhat': '<High>',
-                            'Thấp nhất': '<Low>', 'Giá thấp nhất': '<Low>', 'LOW': '<Low>', 'GiaThapNhat': '<Low>',
-                            'Đóng cửa': '<Close>', 'Giá đóng cửa': '<Close>', 'CLOSE': '<Close>', 'GiaDongCua': '<Close>',
-                            'Đ.Cửa': '<Close>', 'DC': '<Close>',
-                            'KLGD': '<Volume>', 'Khối lượng': '<Volume>', 'KL': '<Volume>', 'VOLUME': '<Volume>',
-                            'KhoiLuong': '<Volume>', 'Khoi luong': '<Volume>',
-                            # Tiếng Anh
-                            'Code': '<Ticker>', 'Symbol': '<Ticker>', 'Ticker': '<Ticker>',
-                            'TradingDate': '<DTYYYYMMDD>', 'Date': '<DTYYYYMMDD>', 
-                            'Time': '<DTYYYYMMDD>', 'DateTime': '<DTYYYYMMDD>',
-                            'Open': '<Open>', 'OpenPrice': '<Open>',
-                            'High': '<High>', 'HighPrice': '<High>',
-                            'Low': '<Low>', 'LowPrice': '<Low>',
-                            'Close': '<Close>', 'ClosePrice': '<Close>',
-                            'Volume': '<Volume>', 'TotalVolume': '<Volume>', 'Vol': '<Volume>'
-                        }
-                        
-                        # Đổi tên cột
-                        df = df.rename(columns=column_mapping)
-                        
-                        # Kiểm tra có đủ cột cần thiết không
-                        if '<Ticker>' not in df.columns or '<Close>' not in df.columns:
-                            error_files += 1
-                            continue
-                        
-                        # Xử lý cột ngày
-                        if '<DTYYYYMMDD>' in df.columns:
-                            df['<DTYYYYMMDD>'] = pd.to_datetime(df['<DTYYYYMMDD>'], errors='coerce')
-                        else:
-                            error_files += 1
-                            continue
-                        
-                        # Lọc các cột cần thiết
-                        required_cols = ['<Ticker>', '<DTYYYYMMDD>', '<Open>', '<High>', '<Low>', '<Close>', '<Volume>']
-                        
-                        # Thêm các cột thiếu với giá trị mặc định
-                        for col in required_cols:
-                            if col not in df.columns:
-                                if col == '<Open>':
-                                    df[col] = df['<Close>']
-                                elif col in ['<High>', '<Low>']:
-                                    df[col] = df['<Close>']
-                                elif col == '<Volume>':
-                                    df[col] = 0
-                        
-                        df = df[required_cols]
-                        
-                        # Kiểm tra có dữ liệu hợp lệ không
-                        if len(df) > 0:
-                            all_data.append(df)
-                            processed_files += 1
-                        else:
-                            error_files += 1
-                        
-                except Exception as e:
-                    error_files += 1
-                    if idx < 5:  # Chỉ hiển thị lỗi 5 file đầu
-                        st.warning(f"⚠️ Lỗi file {csv_file}: {str(e)[:100]}")
-                    continue
-            
-            progress_bar.empty()
-            status_text.empty()
-            
-            st.info(f"📊 Xử lý: {processed_files} thành công, {error_files} lỗi")
-            
-            if all_data:
-                st.info("🔄 Đang gộp và làm sạch dữ liệu...")
-                combined_df = pd.concat(all_data, ignore_index=True)
-                
-                st.info(f"📦 Tổng bản ghi ban đầu: {len(combined_df):,}")
-                
-                # Làm sạch dữ liệu
-                combined_df = combined_df.dropna(subset=['<DTYYYYMMDD>', '<Close>', '<Ticker>'])
-                st.info(f"✓ Sau khi loại NaN: {len(combined_df):,}")
-                
-                combined_df['<Ticker>'] = combined_df['<Ticker>'].astype(str).str.strip().str.upper()
-                combined_df = combined_df[combined_df['<Ticker>'] != '']
-                combined_df = combined_df[combined_df['<Ticker>'] != 'NAN']
-                st.info(f"✓ Sau khi loại ticker rỗng: {len(combined_df):,}")
-                
-                combined_df = combined_df[combined_df['<Close>'] > 0]
-                st.info(f"✓ Sau khi loại giá <= 0: {len(combined_df):,}")
-                
-                combined_df = combined_df.sort_values(['<Ticker>', '<DTYYYYMMDD>'])
-                combined_df = combined_df.drop_duplicates(subset=['<Ticker>', '<DTYYYYMMDD>'], keep='last')
-                st.info(f"✓ Sau khi loại trùng: {len(combined_df):,}")
-                
-                unique_tickers = len(combined_df['<Ticker>'].unique())
-                total_records = len(combined_df)
-                
-                if total_records > 0:
-                    # Debug: Hiển thị mẫu dữ liệu
-                    st.success(f"✅ Thành công: {unique_tickers} mã, {total_records:,} bản ghi (ngày {date_info})")
-                    
-                    # Hiển thị 5 mã đầu tiên
-                    sample_tickers = sorted(combined_df['<Ticker>'].unique())[:5]
-                    st.info(f"🔍 Mẫu mã: {', '.join(sample_tickers)}")
-                    
-                    # Hiển thị date range
-                    min_date = combined_df['<DTYYYYMMDD>'].min()
-                    max_date = combined_df['<DTYYYYMMDD>'].max()
-                    st.info(f"📅 Khoảng thời gian: {min_date.strftime('%d/%m/%Y')} - {max_date.strftime('%d/%m/%Y')}")
-                    
-                    return combined_df
-                else:
-                    st.error("❌ Không có dữ liệu sau khi làm sạch")
-                    return None
-            else:
-                st.error(f"⚠️ Không có dữ liệu hợp lệ từ {len(csv_files)} files")
-                return None
-                
-    except zipfile.BadZipFile:
-        st.error("❌ File tải về không phải định dạng ZIP hợp lệ")
-    except Exception as e:
-        st.error(f"❌ Lỗi xử lý ZIP: {str(e)}")
-        st.exception(e)
+# === PHẦN 1: HÀM TẢI DỮ LIỆU (xem ingest.py) ===
+class StreamlitProgress(ProgressHandle):
+    """Thanh tiến độ + dòng trạng thái của Streamlit"""
     
-    return None
+    def __init__(self):
+        self.bar = st.progress(0)
+        self.status = st.empty()
+    
+    def update(self, fraction, text=None):
+        self.bar.progress(fraction)
+        if text:
+            self.status.text(text)
+    
+    def close(self):
+        self.bar.empty()
+        self.status.empty()
 
-def download_latest_cafef_data():
-    """Tự động tìm ngày có dữ liệu gần nhất và tải file ZIP từ CafeF"""
-    MAX_DAYS_TO_CHECK = 10
+class StreamlitReporter(Reporter):
+    """Hiển thị thông báo / tiến độ của pipeline tải trên giao diện"""
     
-    st.info("🔍 Đang tìm dữ liệu CafeF mới nhất...")
+    def info(self, message):
+        st.info(message)
     
-    # Vòng lặp tìm ngày có dữ liệu
-    for i in range(1, MAX_DAYS_TO_CHECK + 1):
-        check_date = datetime.now() - timedelta(days=i)
-        date_str_path = check_date.strftime('%Y%m%d')
-        date_str_file = check_date.strftime('%d%m%Y')
-        
-        url = f"https://cafef1.mediacdn.vn/data/ami_data/{date_str_path}/CafeF.SolieuGD.Upto{date_str_file}.zip"
-        
-        try:
-            st.info(f"🔎 Kiểm tra ngày: {check_date.strftime('%d-%m-%Y')} (lùi {i} ngày)...")
-            
-            # Kiểm tra file có tồn tại không
-            response = requests.head(url, timeout=10)
-            
-            st.info(f"📡 HTTP Status: {response.status_code}")
-            
-            if response.status_code == 200:
-                st.success(f"✅ Tìm thấy dữ liệu ngày: {check_date.strftime('%d-%m-%Y')}")
-                
-                # Hiển thị thông tin file
-                if 'content-length' in response.headers:
-                    file_size = int(response.headers['content-length']) / (1024 * 1024)
-                    st.info(f"📦 Kích thước file: {file_size:.2f} MB")
-                
-                # Tải file zip
-                st.info("📥 Đang tải dữ liệu...")
-                
-                download_progress = st.progress(0)
-                download_status = st.empty()
-                
-                with requests.get(url, stream=True, timeout=120) as r:
-                    r.raise_for_status()
-                    
-                    total_size = int(r.headers.get('content-length', 0))
-                    downloaded = 0
-                    chunks = []
-                    
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if chunk:
-                            chunks.append(chunk)
-                            downloaded += len(chunk)
-                            if total_size > 0:
-                                progress = downloaded / total_size
-                                download_progress.progress(progress)
-                                download_status.text(f"⏬ Đã tải: {downloaded/(1024*1024):.1f}/{total_size/(1024*1024):.1f} MB")
-                    
-                    zip_content = BytesIO(b''.join(chunks))
-                
-                download_progress.empty()
-                download_status.empty()
-                
-                st.success("✅ Tải thành công! Đang xử lý...")
-                
-                # Xử lý file zip
-                result = process_cafef_zip(zip_content, check_date.strftime('%d-%m-%Y'))
-                
-                if result is not None:
-                    st.balloons()
-                    return result
-                else:
-                    st.error("❌ Xử lý file thất bại, thử ngày khác...")
-                    continue
-                    
-        except requests.exceptions.Timeout:
-            st.warning(f"⏱️ Timeout khi kiểm tra ngày {check_date.strftime('%d-%m-%Y')}")
-            continue
-        except requests.exceptions.RequestException as e:
-            st.warning(f"🔌 Lỗi kết nối ngày {check_date.strftime('%d-%m-%Y')}: {str(e)[:100]}")
-            continue
-        except Exception as e:
-            st.error(f"❌ Lỗi không xác định: {str(e)}")
-            continue
+    def success(self, message):
+        st.success(message)
     
-    st.error(f"❌ Không tìm thấy dữ liệu trong vòng {MAX_DAYS_TO_CHECK} ngày qua")
-    st.info("💡 Gợi ý: Thử sử dụng vnstock3 API hoặc tăng MAX_DAYS_TO_CHECK")
-    return None
-
-def download_stock_data_vnstock(symbol, days_back=365):
-    """Tải từ vnstock3 API"""
-    if not VNSTOCK_AVAILABLE:
-        return None
-        
-    try:
-        stock = Vnstock().stock(symbol=symbol, source='TCBS')
-        end_date = datetime.now().strftime('%Y-%m-%d')
-        start_date = (datetime.now() - timedelta(days=days_back)).strftime('%Y-%m-%d')
-        
-        df = stock.quote.history(start=start_date, end=end_date, interval='1D')
-        
-        if df is not None and not df.empty:
-            df = df.reset_index()
-            df = df.rename(columns={
-                'time': '<DTYYYYMMDD>', 'open': '<Open>',
-                'high': '<High>', 'low': '<Low>',
-                'close': '<Close>', 'volume': '<Volume>'
-            })
-            df['<Ticker>'] = symbol
-            
-            if not pd.api.types.is_datetime64_any_dtype(df['<DTYYYYMMDD>']):
-                df['<DTYYYYMMDD>'] = pd.to_datetime(df['<DTYYYYMMDD>'])
-            
-            return df[['<Ticker>', '<DTYYYYMMDD>', '<Open>', '<High>', '<Low>', '<Close>', '<Volume>']]
-            
-    except Exception as e:
-        st.error(f"❌ Lỗi vnstock3 cho {symbol}: {str(e)}")
-    return None
+    def warning(self, message):
+        st.warning(message)
+    
+    def error(self, message):
+        st.error(message)
+    
+    def exception(self, exc):
+        st.exception(exc)
+    
+    def progress(self):
+        return StreamlitProgress()
+    
+    def celebrate(self):
+        st.balloons()
 
 def download_stock_data(symbol, days_back=365, data_source='vnstock3'):
     """Tải dữ liệu từ nguồn được chọn"""
     if data_source == 'vnstock3' and VNSTOCK_AVAILABLE:
-        return download_stock_data_vnstock(symbol, days_back)
+        return fetch_vnstock_single(symbol, days_back, reporter=StreamlitReporter())
     elif data_source == 'cafef':
         st.warning("⚠️ CafeF yêu cầu tải toàn bộ thị trường")
         return None
     return None
 
-# === PHẦN 2: CHỈ BÁO KỸ THUẬT ===
-def calculate_ma(data, period):
-    return data['<Close>'].rolling(window=period).mean()
+# === PHẦN 2: CHỈ BÁO KỸ THUẬT (xem indicators.py) ===
 
-def calculate_ema(data, period):
-    return data['<Close>'].ewm(span=period, adjust=False).mean()
+# === PHẦN 3: XỬ LÝ OUTLIERS (xem outliers.py) ===
 
-def calculate_bollinger_bands(data, period=20, std_dev=2):
-    ma = data['<Close>'].rolling(window=period).mean()
-    std = data['<Close>'].rolling(window=period).std()
-    return ma, ma + (std * std_dev), ma - (std * std_dev)
+# === PHẦN 4: CACHE DATA ===
+# Bộ dữ liệu đã tải là MarketDataset chỉ đọc trong cache_resource: mọi session dùng chung 1 bản
+# (cache_data trả về 1 bản sao unpickle cho mỗi lần gọi, tức mỗi session 1 bản sao).
+# Dữ liệu CafeF luôn được mở từ kho dạng memory-map: các process Streamlit dùng chung page cache.
+def prepare_dataset(df, data_source):
+    """Chuẩn bị DataFrame vừa tải thành MarketDataset (None nếu rỗng)"""
+    if df is None or df.empty:
+        return None
+    with stage('prepare', rows_in=len(df)):
+        return MarketDataset.from_frame(df, data_source)
 
-def calculate_rsi(data, period=14):
-    delta = data['<Close>'].diff()
-    gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
-    loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
-    rs = gain / loss
-    return 100 - (100 / (1 + rs))
+@st.cache_resource(ttl=3600)
+def get_master_data(symbols_list, data_source='vnstock3', _max_workers=DEFAULT_MAX_WORKERS, _rate=DEFAULT_RATE_PER_SEC):
+    """Tải nhiều mã song song (đọc kho vnstock3 trước nếu ingest_cli.py đã dựng sẵn)"""
+    # _max_workers / _rate không ảnh hưởng kết quả nên không đưa vào cache key
+    if data_source != 'vnstock3':
+        return None
+    return prepare_dataset(fetch_vnstock_market(symbols_list, max_workers=_max_workers, rate=_rate,
+                                                reporter=StreamlitReporter(), store_root=VNSTOCK_STORE_DIR), 'vnstock3')
 
-# === PHẦN 3: XỬ LÝ OUTLIERS ===
-def detect_outliers_iqr(data, column, multiplier=1.5):
-    Q1 = data[column].quantile(0.25)
-    Q3 = data[column].quantile(0.75)
-    IQR = Q3 - Q1
-    lower = Q1 - multiplier * IQR
-    upper = Q3 + multiplier * IQR
-    return data[(data[column] < lower) | (data[column] > upper)], lower, upper
+@st.cache_resource(ttl=3600)
+def get_cafef_all_exchanges(_workers=1):
+    """Tải dữ liệu từ CafeF (tự động tìm ngày mới nhất)"""
+    # _workers không ảnh hưởng kết quả nên không đưa vào cache key
+    df = load_cafef_market(workers=_workers, reporter=StreamlitReporter())
+    manifest = read_manifest()
+    if df is not None and manifest is not None and manifest['rows'] == len(df):
+        # load_cafef_market luôn ghi kết quả vào kho: bỏ bản trong RAM, map snapshot vừa ghi
+        return get_store_dataset(snapshot_version(manifest), manifest)
+    return prepare_dataset(df, 'cafef')
 
-def detect_outliers_zscore(data, column, threshold=3):
-    z_scores = np.abs((data[column] - data[column].mean()) / data[column].std())
-    return data[z_scores > threshold]
+@st.cache_resource(max_entries=2)
+def get_store_dataset(version, _manifest):
+    """Snapshot trong kho (memory-map), mở 1 lần cho mọi session của process"""
+    with stage('open_snapshot') as open_record:
+        dataset = MarketDataset.from_store(_manifest)
+        open_record.rows_out = len(dataset.df)
+    return dataset
 
-def remove_outliers(data, column, method='iqr', **kwargs):
-    if method == 'iqr':
-        outliers, lower, upper = detect_outliers_iqr(data, column, **kwargs)
-        cleaned = data[(data[column] >= lower) & (data[column] <= upper)]
-    else:
-        outliers = detect_outliers_zscore(data, column, **kwargs)
-        cleaned = data[~data.index.isin(outliers.index)]
-    return cleaned, outliers
+@st.cache_resource
+def get_indicator_cache():
+    """Cache chỉ báo LRU dùng chung cho mọi session của process"""
+    return IndicatorCache()
 
-# === PHẦN 4: CACHE DATA ===
-@st.cache_data(ttl=3600)
-def get_master_data(symbols_list, data_source='vnstock3'):
-    all_data = []
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    
-    for idx, symbol in enumerate(symbols_list):
-        status_text.text(f"⏳ Đang tải {symbol}...")
-        df = download_stock_data(symbol, data_source=data_source)
-        if df is not None:
-            all_data.append(df)
-        progress_bar.progress((idx + 1) / len(symbols_list))
-        time.sleep(0.5)
-    
-    progress_bar.empty()
-    status_text.empty()
-    
-    if all_data:
-        combined_df = pd.concat(all_data, ignore_index=True)
-        st.success(f"✅ Tải thành công {len(all_data)}/{len(symbols_list)} mã!")
-        return combined_df
-    return None
+@st.cache_resource
+def get_dataset_registry():
+    """Các bộ dữ liệu thị trường dùng chung cho mọi session của process"""
+    # Bộ dữ liệu bị bỏ khỏi registry: các chỉ báo tính trên nó không còn dùng được
+    return DatasetRegistry(on_evict=get_indicator_cache().invalidate)
 
-@st.cache_data(ttl=3600)
-def get_cafef_all_exchanges():
-    """Tải dữ liệu từ CafeF (tự động tìm ngày mới nhất)"""
-    return download_latest_cafef_data()
+def cached_indicator(ticker, name, params, slice_key, compute):
+    """Kết quả chỉ báo từ cache theo (phiên bản dữ liệu, mã, chỉ báo, tham số, lát cắt)"""
+    key = (st.session_state.get('data_version'), ticker, name, params, slice_key)
+    return get_indicator_cache().get_or_compute(key, compute)
+
+def run_traced(name, fn, *args, **kwargs):
+    """Chạy 1 lượt tải trong trace mới, lưu trace vào session cho mục Chẩn đoán hiệu năng"""
+    with start_trace(name, track_memory=st.session_state.get('trace_memory', False)) as trace:
+        with stage('total'):
+            result = fn(*args, **kwargs)
+    st.session_state['ingest_trace'] = trace
+    return result
+
+def set_session_data(dataset, data_source):
+    """Gắn session với 1 bộ dữ liệu dùng chung: session chỉ giữ lease (phiên bản) và bộ lọc mã"""
+    # Lease nằm trong session_state: registry không bỏ bộ này cho tới khi session kết thúc / đổi bộ
+    lease = get_dataset_registry().lease(dataset)
+    st.session_state['dataset_lease'] = lease
+    st.session_state['data_version'] = lease.dataset.version
+    st.session_state['ticker_filter'] = None
+    st.session_state['data_source'] = data_source
+
+def clear_session_data():
+    for key in ['dataset_lease', 'data_version', 'ticker_filter', 'data_source']:
+        if key in st.session_state:
+            del st.session_state[key]
+
+def get_session_dataset():
+    """Bộ dữ liệu của session (None nếu chưa tải)"""
+    lease = st.session_state.get('dataset_lease')
+    return None if lease is None else lease.dataset
+
+def get_session_ticker_index():
+    """Chỉ mục mã của session: mọi mã của bộ dữ liệu, hoặc chỉ các mã của LỌC MÃ"""
+    return get_session_dataset().filtered_index(st.session_state.get('ticker_filter'))
+
+def market_scope():
+    """Phần khóa cache của các kết quả toàn thị trường: các mã đang lọc (None: mọi mã)"""
+    ticker_filter = st.session_state.get('ticker_filter')
+    return tuple(ticker_filter) if ticker_filter else None
+
+def autoload_store():
+    """Mở sẵn kho CafeF nếu ingest_cli.py đã dựng cho phiên mới nhất (kiểm tra 1 lần mỗi session).
+
+    Session đang dùng kho được chuyển sang snapshot mới ngay khi manifest đổi (đọc manifest mỗi lượt chạy).
+    """
+    version = st.session_state.get('data_version')
+    on_store = version is not None and version.startswith('store:')
+    if not on_store and (get_session_dataset() is not None or st.session_state.get('store_checked')):
+        return
+    st.session_state['store_checked'] = True
+    manifest = read_manifest()
+    if manifest is None or not is_snapshot_current(manifest) or snapshot_version(manifest) == version:
+        return
+    dataset = run_traced('store', get_store_dataset, snapshot_version(manifest), manifest)
+    ticker_filter = st.session_state.get('ticker_filter')
+    set_session_data(dataset, 'cafef')
+    if on_store:
+        st.session_state['ticker_filter'] = ticker_filter
+
+# Dữ liệu do cron chuẩn bị sẵn: người dùng không phải chờ tải trong trình duyệt
+autoload_store()
 
 # === DANH SÁCH MÃ ===
 DEFAULT_STOCKS = ['FPT', 'VNM', 'VIC', 'VHM', 'HPG', 'TCB', 'VCB', 'BID', 'CTG', 'MBB',
@@ -545,10 +360,7 @@ with st.sidebar:
     
     # RESET BUTTON
     if st.button("🔄 RESET DỮ LIỆU", use_container_width=True, type="secondary"):
-        keys_to_delete = ['data', 'stock_list', 'data_source']
-        for key in keys_to_delete:
-            if key in st.session_state:
-                del st.session_state[key]
+        clear_session_data()
         st.success("✅ Đã xóa dữ liệu!")
         time.sleep(1)
         st.rerun()
@@ -621,11 +433,10 @@ with st.sidebar:
             if st.button("🚀 TẢI DỮ LIỆU", use_container_width=True, type="primary"):
                 if single_stock:
                     with st.spinner(f"⏳ Đang tải {single_stock} từ vnstock3..."):
-                        df = download_stock_data(single_stock, data_source='vnstock3')
-                        if df is not None and not df.empty:
-                            st.session_state['data'] = df
-                            st.session_state['stock_list'] = [single_stock]
-                            st.session_state['data_source'] = 'vnstock3'
+                        dataset = run_traced('vnstock3_single', lambda: prepare_dataset(
+                            download_stock_data(single_stock, data_source='vnstock3'), 'vnstock3'))
+                        if dataset is not None:
+                            set_session_data(dataset, 'vnstock3')
                             st.success(f"✅ Tải thành công {single_stock}!")
                             time.sleep(0.5)
                             st.rerun()
@@ -636,34 +447,50 @@ with st.sidebar:
         
         else:  # Tải nhiều mã
             st.markdown("#### 📦 Tải danh sách phổ biến")
-            st.info(f"Sẽ tải {len(DEFAULT_STOCKS)} mã blue-chip")
             
-            with st.expander("📋 Xem danh sách"):
-                st.write(", ".join(DEFAULT_STOCKS))
+            with st.expander("📋 Xem / sửa danh sách"):
+                watchlist_text = st.text_area(
+                    "Các mã cách nhau bởi dấu phẩy hoặc xuống dòng:",
+                    value=", ".join(DEFAULT_STOCKS),
+                    key="vnstock_watchlist"
+                )
+            watchlist = list(dict.fromkeys(
+                code.strip().upper() for code in watchlist_text.replace('\n', ',').split(',') if code.strip()
+            ))
+            st.info(f"Sẽ tải {len(watchlist)} mã")
+            
+            with st.expander("⚙️ Tốc độ tải"):
+                fetch_workers = st.number_input("Số request đồng thời tối đa:", 1, 32, DEFAULT_MAX_WORKERS)
+                fetch_rate = st.number_input("Giới hạn request/giây:", 0.5, 50.0, DEFAULT_RATE_PER_SEC, 0.5)
             
             if st.button("📥 TẢI DANH SÁCH", use_container_width=True, type="primary"):
-                with st.spinner(f"⏳ Đang tải {len(DEFAULT_STOCKS)} mã..."):
-                    df = get_master_data(DEFAULT_STOCKS, data_source='vnstock3')
-                    if df is not None and not df.empty:
-                        st.session_state['data'] = df
-                        st.session_state['stock_list'] = DEFAULT_STOCKS
-                        st.session_state['data_source'] = 'vnstock3'
-                        st.success(f"✅ Tải thành công {len(DEFAULT_STOCKS)} mã!")
-                        time.sleep(0.5)
-                        st.rerun()
-                    else:
-                        st.error("❌ Lỗi tải dữ liệu")
+                if not watchlist:
+                    st.warning("⚠️ Danh sách mã trống")
+                else:
+                    with st.spinner(f"⏳ Đang tải {len(watchlist)} mã..."):
+                        dataset = run_traced('vnstock3_watchlist', get_master_data, watchlist, data_source='vnstock3',
+                                             _max_workers=int(fetch_workers), _rate=float(fetch_rate))
+                        if dataset is not None:
+                            set_session_data(dataset, 'vnstock3')
+                            st.success(f"✅ Tải thành công {len(dataset.ticker_index)} mã!")
+                            time.sleep(0.5)
+                            st.rerun()
+                        else:
+                            st.error("❌ Lỗi tải dữ liệu")
     
     else:  # CafeF
         st.markdown("### 📦 CAFEF - TẢI DỮ LIỆU")
         
         # Kiểm tra xem đã có dữ liệu chưa
-        has_data = 'data' in st.session_state and st.session_state['data'] is not None
+        has_data = get_session_dataset() is not None
         
         if has_data:
             st.success("✅ Đã có dữ liệu trong bộ nhớ")
-            total_stocks = len(st.session_state['data']['<Ticker>'].unique())
+            total_stocks = len(get_session_dataset().ticker_index)
             st.info(f"📊 Có {total_stocks} mã cổ phiếu")
+            ticker_filter = st.session_state.get('ticker_filter')
+            if ticker_filter:
+                st.info(f"🔍 Đang lọc: {', '.join(ticker_filter)}")
             
             st.markdown("#### 🔍 Tìm kiếm mã cụ thể")
             search_stock = st.text_input(
@@ -675,11 +502,9 @@ with st.sidebar:
             
             if search_stock:
                 if st.button("🔍 LỌC MÃ", use_container_width=True):
-                    df = st.session_state['data']
-                    filtered = df[df['<Ticker>'] == search_stock]
-                    if not filtered.empty:
-                        st.session_state['data'] = filtered
-                        st.session_state['stock_list'] = [search_stock]
+                    # Chỉ lưu bộ lọc, dữ liệu vẫn là bộ dùng chung (không tạo DataFrame mới)
+                    if search_stock in get_session_dataset().ticker_index:
+                        st.session_state['ticker_filter'] = [search_stock]
                         st.success(f"✅ Đã lọc {search_stock}")
                         time.sleep(0.5)
                         st.rerun()
@@ -687,17 +512,19 @@ with st.sidebar:
                         st.error(f"❌ Không tìm thấy {search_stock}")
             
             if st.button("🔄 TẢI LẠI TOÀN BỘ", use_container_width=True, type="secondary"):
-                if 'data' in st.session_state:
-                    del st.session_state['data']
-                if 'stock_list' in st.session_state:
-                    del st.session_state['stock_list']
+                clear_session_data()
                 st.info("Nhấn nút 'TẢI TOÀN THỊ TRƯỜỜNG' để tải lại")
                 st.rerun()
         
         else:  # Chưa có dữ liệu
             st.markdown("#### 📥 Tải toàn thị trường")
             st.info("🔍 Tự động tìm ngày gần nhất (lùi max 10 ngày)")
-            st.warning("⏱️ Quá trình có thể mất 30-90 giây")
+            
+            store_manifest = read_manifest()
+            if store_manifest is not None:
+                st.success(f"💾 Kho: ngày {manifest_date(store_manifest).strftime('%d-%m-%Y')} • {store_manifest['tickers']} mã")
+            else:
+                st.warning("⏱️ Quá trình có thể mất 30-90 giây")
             
             with st.expander("ℹ️ Thông tin"):
                 st.markdown("""
@@ -709,22 +536,26 @@ with st.sidebar:
                 - ✅ Trả về toàn bộ thị trường
                 """)
             
+            parse_workers = st.number_input(
+                "⚙️ Số tiến trình xử lý CSV:",
+                min_value=1,
+                max_value=max(os.cpu_count() or 1, DEFAULT_PARSE_WORKERS),
+                value=DEFAULT_PARSE_WORKERS,
+                help="1 = xử lý tuần tự. Nhiều tiến trình giúp giải nén & parse CSV song song."
+            )
+            
             if st.button("📥 TẢI TOÀN THỊ TRƯỜỜNG", use_container_width=True, type="primary"):
                 with st.spinner("⏳ Đang xử lý..."):
-                    df = get_cafef_all_exchanges()
-                    if df is not None and not df.empty:
-                        st.info(f"✓ Nhận được {len(df)} bản ghi")
-                        st.info(f"✓ Columns: {', '.join(df.columns.tolist())}")
+                    dataset = run_traced('cafef', get_cafef_all_exchanges, _workers=int(parse_workers))
+                    if dataset is not None:
+                        st.info(f"✓ Nhận được {len(dataset.df)} bản ghi")
+                        st.info(f"✓ Columns: {', '.join(dataset.df.columns.tolist())}")
                         
                         # Làm sạch ticker
-                        ticker_series = df['<Ticker>'].dropna().astype(str)
-                        ticker_list = [t.strip() for t in ticker_series.unique() 
-                                     if t.strip() and t.strip().upper() != 'NAN']
+                        ticker_list = [t for t in dataset.ticker_index if t.strip() and t.strip().upper() != 'NAN']
                         
                         if ticker_list:
-                            st.session_state['data'] = df
-                            st.session_state['stock_list'] = sorted(ticker_list)
-                            st.session_state['data_source'] = 'cafef'
+                            set_session_data(dataset, 'cafef')
                             st.success(f"🎉 Lưu thành công {len(ticker_list)} mã!")
                             time.sleep(1)
                             st.rerun()
@@ -735,17 +566,167 @@ with st.sidebar:
     
     st.markdown("---")
 
+# === BỘ LỌC TOÀN THỊ TRƯỜNG ===
+CHART_VIEW = "📈 Biểu đồ"
+SCREENER_VIEW = "🔎 Bộ lọc toàn thị trường"
+CORRELATION_VIEW = "🔗 Tương quan"
+ANOMALY_VIEW = "🚨 Bất thường"
+# Cột dùng để dò bất thường toàn thị trường -> nhãn hiển thị
+ANOMALY_COLUMNS = {'<Close>': 'Giá đóng', RETURN_COLUMN: '% thay đổi', '<Volume>': 'Khối lượng'}
+# Khoảng tính tương quan (số phiên cuối, None = toàn bộ lịch sử)
+CORRELATION_LOOKBACKS = {'3 tháng': 63, '6 tháng': 126, '1 năm': 252, '2 năm': 504, 'Tất cả': None}
+
+def screener_matrix(df, ticker_index, params):
+    """Chỉ báo phiên cuối của mọi mã, cache theo phiên bản dữ liệu + tham số"""
+    return cached_indicator(market_scope(), 'SCREENER', params, None,
+                            lambda: latest_indicator_matrix(df, ticker_index, **dict(params)))
+
+def show_screener(df, ticker_index):
+    """Lọc mọi mã theo điều kiện trên chỉ báo phiên cuối, bấm xem biểu đồ mã đã chọn"""
+    st.markdown("### 🔎 BỘ LỌC TOÀN THỊ TRƯỜNG")
+    
+    preset = st.selectbox("Mẫu điều kiện:", list(PRESETS), key="screener_preset")
+    with st.expander("⚙️ Tham số chỉ báo"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            ma_period = st.number_input("Chu kỳ MA:", 5, 200, 20, key="screener_ma")
+        with col2:
+            ema_period = st.number_input("Chu kỳ EMA:", 5, 200, 12, key="screener_ema")
+        with col3:
+            volume_period = st.number_input("Số phiên KL trung bình:", 5, 100, 20, key="screener_volume")
+    
+    # Mỗi mẫu 1 bảng điều kiện riêng (đổi mẫu thì nạp lại điều kiện của mẫu đó)
+    conditions_df = pd.DataFrame(PRESETS[preset], columns=['Cột', 'Toán tử', 'Vế phải', 'Hệ số'])
+    conditions_df['Vế phải'] = conditions_df['Vế phải'].astype(str)
+    edited = st.data_editor(
+        conditions_df,
+        num_rows="dynamic",
+        use_container_width=True,
+        hide_index=True,
+        key=f"screener_conditions_{preset}",
+        column_config={
+            'Cột': st.column_config.SelectboxColumn(options=list(FIELDS), required=True),
+            'Toán tử': st.column_config.SelectboxColumn(options=OPERATORS, required=True),
+            'Vế phải': st.column_config.TextColumn(help="Số (vd. 30) hoặc tên cột (vd. VolAvg)", required=True),
+            'Hệ số': st.column_config.NumberColumn(help="Nhân với vế phải khi vế phải là cột", default=1.0),
+        }
+    )
+    latest_only = st.checkbox("Chỉ mã có giao dịch ở phiên mới nhất", value=True, key="screener_latest_only")
+    
+    params = (('ma_period', int(ma_period)), ('ema_period', int(ema_period)), ('volume_period', int(volume_period)))
+    conditions = [tuple(row) for row in edited.dropna(subset=['Cột', 'Toán tử', 'Vế phải']).itertuples(index=False)]
+    start = time.perf_counter()
+    latest, previous = screener_matrix(df, ticker_index, params)
+    try:
+        result = run_screen(latest, previous, conditions, latest_session_only=latest_only)
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        return
+    st.caption(f"⚡ {len(result):,}/{len(latest):,} mã thỏa điều kiện · {(time.perf_counter() - start) * 1000:.0f} ms")
+    
+    if result.empty:
+        st.info("Không có mã nào thỏa mọi điều kiện")
+        return
+    
+    display_df = result.rename(columns=FIELDS)
+    display_df['Date'] = display_df['Date'].dt.strftime('%d/%m/%Y')
+    st.dataframe(display_df.rename(columns={'Date': '📅 Ngày'}).round(2), use_container_width=True, height=450)
+    
+    chart_link(result.index.tolist(), key="screener_pick")
+
+def show_correlation(df, ticker_index, stock_code):
+    """Các mã có lợi suất ngày tương quan mạnh nhất với mã đang chọn"""
+    st.markdown(f"### 🔗 MÃ TƯƠNG QUAN NHẤT VỚI **{stock_code}**")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        lookback = st.select_slider("⏱️ Khoảng tính:", options=list(CORRELATION_LOOKBACKS), value='1 năm', key="corr_lookback")
+    with col2:
+        top_k = st.number_input("Số mã:", 5, 50, 10, key="corr_k")
+    with col3:
+        min_periods = st.number_input("Số phiên chung tối thiểu:", 10, 252, 40, key="corr_min_periods")
+    
+    start = time.perf_counter()
+    # Ma trận lợi suất dựng 1 lần cho mỗi bộ dữ liệu, các khoảng tính chỉ là lát cắt theo ngày
+    matrix = cached_indicator(market_scope(), 'RETURNS', (), None, lambda: returns_matrix(df, ticker_index))
+    window = matrix.last_sessions(CORRELATION_LOOKBACKS[lookback])
+    peers = top_correlated(window, stock_code, int(top_k), min(int(min_periods), len(window.dates)))
+    st.caption(f"⚡ {len(window.tickers):,} mã × {len(window.dates):,} phiên · {(time.perf_counter() - start) * 1000:.0f} ms")
+    
+    if peers.empty:
+        st.info(f"Không đủ phiên chung để tính tương quan với {stock_code}")
+        return
+    
+    peers = peers.rename(columns={'corr': '📈 Tương quan', 'cov': 'Hiệp phương sai', 'n': 'Số phiên chung'})
+    st.dataframe(peers.style.format({'📈 Tương quan': '{:.3f}', 'Hiệp phương sai': '{:.2e}'}),
+                 use_container_width=True, height=400)
+    chart_link(peers.index.tolist(), key="corr_pick")
+
+def show_anomalies(df, ticker_index):
+    """Các mã có phiên cuối nằm ngoài ngưỡng trượt của chính mã đó"""
+    st.markdown("### 🚨 BẤT THƯỜNG TOÀN THỊ TRƯỜNG (PHIÊN CUỐI)")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        column = st.selectbox("Dữ liệu:", list(ANOMALY_COLUMNS), format_func=ANOMALY_COLUMNS.get,
+                              index=1, key="anomaly_column")
+    with col2:
+        method = st.radio("Phương pháp:", ["IQR", "Z-Score"], horizontal=True, key="anomaly_method")
+    with col3:
+        window = st.slider("Cửa sổ (phiên):", 20, 250, DEFAULT_ROLLING_WINDOW, 5, key="anomaly_window")
+    with col4:
+        if method == "IQR":
+            level = st.slider("IQR Multiplier:", 1.0, 5.0, 3.0, 0.1, key="anomaly_iqr")
+        else:
+            level = st.slider("Z-Score:", 2.0, 6.0, 3.0, 0.1, key="anomaly_zscore")
+    latest_only = st.checkbox("Chỉ mã có giao dịch ở phiên mới nhất", value=True, key="anomaly_latest_only")
+    
+    params = (column, method, int(window), float(level), latest_only)
+    start = time.perf_counter()
+    result = cached_indicator(market_scope(), 'ANOMALY', params, None, lambda: market_anomalies(
+        df, ticker_index, column, 'iqr' if method == "IQR" else 'zscore', int(window),
+        multiplier=level, threshold=level, latest_session_only=latest_only))
+    st.caption(f"⚡ {len(result):,}/{len(ticker_index):,} mã bất thường · {(time.perf_counter() - start) * 1000:.0f} ms")
+    
+    if result.empty:
+        st.info("Không có mã nào vượt ngưỡng ở phiên cuối")
+        return
+    
+    display_df = result.rename(columns={'Date': '📅 Ngày', 'value': ANOMALY_COLUMNS[column],
+                                        'lower': 'Ngưỡng dưới', 'upper': 'Ngưỡng trên', 'score': 'Độ lệch'})
+    display_df['📅 Ngày'] = display_df['📅 Ngày'].dt.strftime('%d/%m/%Y')
+    st.dataframe(display_df.round(2), use_container_width=True, height=450)
+    
+    chart_link(result.index.tolist(), key="anomaly_pick")
+
+def chart_link(tickers, key):
+    """Chọn 1 mã trong danh sách kết quả rồi chuyển sang biểu đồ của mã đó"""
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        pick = st.selectbox("Xem biểu đồ mã:", tickers, key=key)
+    with col2:
+        st.markdown("<br>", unsafe_allow_html=True)
+        if st.button("📈 XEM BIỂU ĐỒ", use_container_width=True, key=f"{key}_go"):
+            # Widget chọn mã đã được tạo ở lượt này: đặt mã chờ, áp dụng ở đầu lượt sau
+            st.session_state['pending_stock'] = pick
+            st.rerun()
+
 # === PHẦN 3: ĐIỀU KHIỂN BIỂU ĐỒ (CHỈ HIỆN KHI CÓ DỮ LIỆU) ===
-if 'data' in st.session_state and st.session_state['data'] is not None:
+if get_session_dataset() is not None:
+    # Mã chọn từ bộ lọc: phải gán trước khi tạo selectbox / radio tương ứng
+    pending_stock = st.session_state.pop('pending_stock', None)
+    if pending_stock is not None:
+        st.session_state['stock_selector'] = pending_stock
+        st.session_state['view_mode'] = CHART_VIEW
+    
     with st.sidebar:
         st.markdown("### 📊 ĐIỀU KHIỂN BIỂU ĐỒ")
         
-        df = st.session_state['data']
+        ticker_index = get_session_ticker_index()
+        df = get_session_dataset().df
         
-        # Làm sạch ticker list
-        ticker_series = df['<Ticker>'].dropna().astype(str)
-        ticker_list = sorted([t.strip() for t in ticker_series.unique() 
-                            if t.strip() and t.strip().upper() != 'NAN'])
+        # Làm sạch ticker list (chỉ mục đã sắp xếp theo mã, không cần quét lại cột <Ticker>)
+        ticker_list = [t for t in ticker_index if t.strip() and t.strip().upper() != 'NAN']
         
         if not ticker_list:
             st.error("❌ Không có mã hợp lệ")
@@ -811,6 +792,10 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
             else:
                 zscore_threshold = st.slider("Z-Score:", 2.0, 4.0, 3.0, 0.1)
             
+            # Ngưỡng tính từ N phiên trước đó thay vì toàn bộ lịch sử
+            rolling_outlier = st.checkbox("Cửa sổ trượt", value=False)
+            outlier_window = st.slider("Cửa sổ (phiên):", 20, 250, DEFAULT_ROLLING_WINDOW, 5) if rolling_outlier else None
+            
             remove_outlier = st.checkbox("Loại bỏ Outliers")
         
         st.markdown("---")
@@ -818,232 +803,182 @@ if 'data' in st.session_state and st.session_state['data'] is not None:
         # Cài đặt chart
         st.markdown("#### ⚙️ Cài đặt")
         chart_height = st.slider("Chiều cao:", 500, 1000, 700, 50)
+        chart_points = st.slider("Số điểm tối đa / đường:", 500, 5000, DEFAULT_POINT_BUDGET, 250,
+                                 help="Khoảng thời gian dài được giảm điểm (LTTB, gộp nến) trước khi vẽ")
+        
+        cache_stats = get_indicator_cache().stats()
+        st.caption(f"🧮 Cache chỉ báo: {cache_stats['hits']:,} hit / {cache_stats['misses']:,} miss · "
+                   f"{cache_stats['entries']} mục ({cache_stats['bytes'] / 1024 / 1024:.1f} MB)")
+    
+    view_mode = st.radio("Chế độ xem:", [CHART_VIEW, SCREENER_VIEW, CORRELATION_VIEW, ANOMALY_VIEW], horizontal=True,
+                         label_visibility="collapsed", key="view_mode")
     
-    stock_data = df[df['<Ticker>'] == stock_code].sort_values(by='<DTYYYYMMDD>').copy()
+    # Đo thời gian từng bước hiển thị của lượt chạy này (xem mục Chẩn đoán hiệu năng)
+    render_trace = PipelineTrace('render')
     
-    if not stock_data.empty:
-        original_data = stock_data.copy()
-        outliers_data = None
+    if view_mode == SCREENER_VIEW:
+        with render_trace.stage('screener', rows_in=len(ticker_index)):
+            show_screener(df, ticker_index)
+    elif view_mode == CORRELATION_VIEW:
+        with render_trace.stage('correlation', rows_in=len(df)):
+            show_correlation(df, ticker_index, stock_code)
+    elif view_mode == ANOMALY_VIEW:
+        with render_trace.stage('anomalies', rows_in=len(ticker_index)):
+            show_anomalies(df, ticker_index)
+    else:
+        # Lát cắt liên tục theo chỉ mục mã, dữ liệu đã sắp xếp theo ngày
+        with render_trace.stage('slice', rows_in=len(df)) as slice_record:
+            stock_data = slice_ticker(df, ticker_index, stock_code).copy()
+            slice_record.rows_out = len(stock_data)
         
-        if show_outliers:
-            if outlier_method == "IQR":
-                outliers_data, lower, upper = detect_outliers_iqr(stock_data, '<Close>', multiplier=iqr_multiplier)
-                if remove_outlier:
-                    stock_data, _ = remove_outliers(stock_data, '<Close>', method='iqr', multiplier=iqr_multiplier)
-            else:
-                outliers_data = detect_outliers_zscore(stock_data, '<Close>', threshold=zscore_threshold)
+        if not stock_data.empty:
+            original_data = stock_data.copy()
+            outliers_data = None
+            outlier_key = None
+            
+            if show_outliers:
+                with render_trace.stage('outliers', rows_in=len(stock_data)):
+                    if outlier_method == "IQR":
+                        method, params = 'iqr', {'multiplier': iqr_multiplier}
+                    else:
+                        method, params = 'zscore', {'threshold': zscore_threshold}
+                    if outlier_window is not None:
+                        outliers_data, _ = detect_outliers_rolling(stock_data, '<Close>', method, outlier_window, **params)
+                    elif method == 'iqr':
+                        outliers_data, lower, upper = detect_outliers_iqr(stock_data, '<Close>', **params)
+                    else:
+                        outliers_data = detect_outliers_zscore(stock_data, '<Close>', **params)
+                    if remove_outlier:
+                        stock_data, _ = remove_outliers(stock_data, '<Close>', method=method, window=outlier_window, **params)
+                        outlier_key = (method, *params.values(), outlier_window)
+            
+            # METRICS
+            latest = stock_data.iloc[-1]
+            prev = stock_data.iloc[-2] if len(stock_data) > 1 else latest
+            
+            price_change = latest['<Close>'] - prev['<Close>']
+            price_change_pct = (price_change / prev['<Close>'] * 100) if prev['<Close>'] != 0 else 0
+            
+            col1, col2, col3, col4, col5 = st.columns(5)
+            
+            with col1:
+                st.metric("💰 GIÁ ĐÓNG", f"{latest['<Close>']:,.2f}", f"{price_change:+,.2f} ({price_change_pct:+.2f}%)")
+            with col2:
+                st.metric("📈 CAO NHẤT", f"{latest['<High>']:,.2f}")
+            with col3:
+                st.metric("📉 THẤP NHẤT", f"{latest['<Low>']:,.2f}")
+            with col4:
+                st.metric("📊 KHỐI LƯỢNG", f"{latest['<Volume>']:,.0f}")
+            with col5:
+                avg_volume = stock_data['<Volume>'].tail(20).mean()
+                volume_change = ((latest['<Volume>'] - avg_volume) / avg_volume * 100) if avg_volume != 0 else 0
+                st.metric("📦 TB 20", f"{avg_volume:,.2f}", f"{volume_change:+.2f}%")
+            
+            if show_outliers and outliers_data is not None and len(outliers_data) > 0:
+                st.warning(f"⚠️ Phát hiện {len(outliers_data)} outliers ({outlier_method})")
                 if remove_outlier:
-                    stock_data, _ = remove_outliers(stock_data, '<Close>', method='zscore', threshold=zscore_threshold)
-        
-        # METRICS
-        latest = stock_data.iloc[-1]
-        prev = stock_data.iloc[-2] if len(stock_data) > 1 else latest
-        
-        price_change = latest['<Close>'] - prev['<Close>']
-        price_change_pct = (price_change / prev['<Close>'] * 100) if prev['<Close>'] != 0 else 0
-        
-        col1, col2, col3, col4, col5 = st.columns(5)
-        
-        with col1:
-            st.metric("💰 GIÁ ĐÓNG", f"{latest['<Close>']:,.2f}", f"{price_change:+,.2f} ({price_change_pct:+.2f}%)")
-        with col2:
-            st.metric("📈 CAO NHẤT", f"{latest['<High>']:,.2f}")
-        with col3:
-            st.metric("📉 THẤP NHẤT", f"{latest['<Low>']:,.2f}")
-        with col4:
-            st.metric("📊 KHỐI LƯỢNG", f"{latest['<Volume>']:,.0f}")
-        with col5:
-            avg_volume = stock_data['<Volume>'].tail(20).mean()
-            volume_change = ((latest['<Volume>'] - avg_volume) / avg_volume * 100) if avg_volume != 0 else 0
-            st.metric("📦 TB 20", f"{avg_volume:,.2f}", f"{volume_change:+.2f}%")
-        
-        if show_outliers and outliers_data is not None and len(outliers_data) > 0:
-            st.warning(f"⚠️ Phát hiện {len(outliers_data)} outliers ({outlier_method})")
-            if remove_outlier:
-                st.info(f"✅ Đã loại bỏ {len(outliers_data)} outliers")
-        
-        st.markdown("---")
-        st.markdown(f"### 📈 Phân tích: **{stock_code}**")
-        
-        time_range = st.select_slider("⏱️ Thời gian:", options=['1 tháng', '3 tháng', '6 tháng', '1 năm', 'Tất cả'], value='3 tháng')
-        
-        if time_range != 'Tất cả':
-            days_map = {'1 tháng': 30, '3 tháng': 90, '6 tháng': 180, '1 năm': 365}
-            cutoff_date = datetime.now() - timedelta(days=days_map[time_range])
-            stock_data = stock_data[stock_data['<DTYYYYMMDD>'] >= cutoff_date]
-            if outliers_data is not None and not outliers_data.empty:
-                outliers_data = outliers_data[outliers_data['<DTYYYYMMDD>'] >= cutoff_date]
-        
-        if show_ma:
-            stock_data['MA'] = calculate_ma(stock_data, ma_period)
-        if show_ema:
-            stock_data['EMA'] = calculate_ema(stock_data, ema_period)
-        if show_bb:
-            stock_data['BB_MA'], stock_data['BB_Upper'], stock_data['BB_Lower'] = calculate_bollinger_bands(stock_data)
-        if show_rsi:
-            stock_data['RSI'] = calculate_rsi(stock_data)
-        
-        # === PHẦN SỬA LỖI HIỂN THỊ NGÀY ===
-        st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-        
-        rows = 3 if show_rsi else 2
-        row_heights = [0.6, 0.2, 0.2] if show_rsi else [0.7, 0.3]
-        subplot_titles = [f'💹 {stock_code}', '📊 Volume', '📉 RSI'] if show_rsi else [f'💹 {stock_code}', '📊 Volume']
-        
-        fig = make_subplots(rows=rows, cols=1, shared_xaxes=True, vertical_spacing=0.03, subplot_titles=subplot_titles, row_heights=row_heights)
-        
-        # Biểu đồ chính
-        if chart_type == "Nến Nhật":
-            fig.add_trace(go.Candlestick(
-                x=stock_data['<DTYYYYMMDD>'],
-                open=stock_data['<Open>'],
-                high=stock_data['<High>'],
-                low=stock_data['<Low>'],
-                close=stock_data['<Close>'],
-                name="Giá",
-                increasing_line_color='#5994ce',
-                decreasing_line_color='#b957ce'
-            ), row=1, col=1)
-        else:
-            fig.add_trace(go.Scatter(
-                x=stock_data['<DTYYYYMMDD>'],
-                y=stock_data['<Close>'],
-                name="Giá",
-                line=dict(color='#5994ce', width=2.5),
-                fill='tozeroy',
-                fillcolor='rgba(89, 148, 206, 0.1)'
-            ), row=1, col=1)
-        
-        # Outliers
-        if show_outliers and outliers_data is not None and not outliers_data.empty:
-            fig.add_trace(go.Scatter(
-                x=outliers_data['<DTYYYYMMDD>'],
-                y=outliers_data['<Close>'],
-                mode='markers',
-                name='Outliers',
-                marker=dict(color='#ff4444', size=12, symbol='x', line=dict(color='#ffffff', width=2))
-            ), row=1, col=1)
-        
-        # MA
-        if show_ma and 'MA' in stock_data.columns:
-            fig.add_trace(go.Scatter(
-                x=stock_data['<DTYYYYMMDD>'],
-                y=stock_data['MA'],
-                name=f'MA{ma_period}',
-                line=dict(color='#ffa502', width=2.5)
-            ), row=1, col=1)
-        
-        # EMA
-        if show_ema and 'EMA' in stock_data.columns:
-            fig.add_trace(go.Scatter(
-                x=stock_data['<DTYYYYMMDD>'],
-                y=stock_data['EMA'],
-                name=f'EMA{ema_period}',
-                line=dict(color='#5c58bb', width=2.5)
-            ), row=1, col=1)
-        
-        # Bollinger Bands
-        if show_bb and 'BB_Upper' in stock_data.columns:
-            fig.add_trace(go.Scatter(x=stock_data['<DTYYYYMMDD>'], y=stock_data['BB_Upper'], name='BB Upper', line=dict(color='rgba(185, 87, 206, 0.5)', width=1, dash='dash'), showlegend=False), row=1, col=1)
-            fig.add_trace(go.Scatter(x=stock_data['<DTYYYYMMDD>'], y=stock_data['BB_MA'], name='BB Mid', line=dict(color='rgba(185, 87, 206, 0.8)', width=1.5), showlegend=False), row=1, col=1)
-            fig.add_trace(go.Scatter(x=stock_data['<DTYYYYMMDD>'], y=stock_data['BB_Lower'], name='BB Lower', line=dict(color='rgba(185, 87, 206, 0.5)', width=1, dash='dash'), fill='tonexty', fillcolor='rgba(185, 87, 206, 0.1)', showlegend=False), row=1, col=1)
-        
-        # Volume
-        colors = ['#5994ce' if row['<Close>'] >= row['<Open>'] else '#b957ce' for index, row in stock_data.iterrows()]
-        fig.add_trace(go.Bar(x=stock_data['<DTYYYYMMDD>'], y=stock_data['<Volume>'], name="Volume", marker_color=colors), row=2, col=1)
-        
-        # RSI
-        if show_rsi and 'RSI' in stock_data.columns:
-            fig.add_trace(go.Scatter(x=stock_data['<DTYYYYMMDD>'], y=stock_data['RSI'], name="RSI", line=dict(color='#5c58bb', width=2)), row=3, col=1)
-            fig.add_hline(y=70, line_dash="dash", line_color="#b957ce", opacity=0.5, row=3, col=1)
-            fig.add_hline(y=30, line_dash="dash", line_color="#5994ce", opacity=0.5, row=3, col=1)
-        
-        fig.update_layout(
-            xaxis_rangeslider_visible=False,
-            height=chart_height,
-            hovermode='x unified',
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            font=dict(color='#ffffff', size=12),
-            showlegend=True,
-            legend=dict(orientation="h", yanchor="bottom", y=1.01, xanchor="right", x=1, bgcolor='rgba(58, 78, 147, 0.8)'),
-            margin=dict(l=10, r=10, t=60, b=10)
-        )
-        
-        for i in range(1, rows + 1):
-            fig.update_xaxes(gridcolor='rgba(92, 88, 187, 0.1)', showgrid=True, zeroline=False, row=i, col=1)
-            fig.update_yaxes(gridcolor='rgba(92, 88, 187, 0.1)', showgrid=True, zeroline=False, row=i, col=1)
-        
-        # === PHẦN SỬA LỖI LỖ TRỐNG (TỰ ĐỘNG CHO CẢ NGÀY LỄ) ===
-        # Lấy ra danh sách tất cả các ngày có trong dữ liệu đang hiển thị
-        all_present_dates = pd.to_datetime(stock_data['<DTYYYYMMDD>'])
-        
-        # Chỉ thực hiện nếu có dữ liệu
-        if not all_present_dates.empty:
-            # Tạo ra một chuỗi ngày liên tục từ ngày đầu đến ngày cuối
-            full_date_range = pd.date_range(start=all_present_dates.min(), end=all_present_dates.max())
+                    st.info(f"✅ Đã loại bỏ {len(outliers_data)} outliers")
             
-            # Tìm những ngày không có trong dữ liệu (chính là ngày nghỉ T7, CN, Lễ)
-            missing_dates = full_date_range.difference(all_present_dates)
+            st.markdown("---")
+            st.markdown(f"### 📈 Phân tích: **{stock_code}**")
             
-            # Cập nhật trục X để "bỏ qua" (ẩn đi) những ngày không có dữ liệu này
-            fig.update_xaxes(rangebreaks=[dict(values=missing_dates)])
-        
-        fig.update_yaxes(title_text="Giá (VNĐ)", row=1, col=1)
-        fig.update_yaxes(title_text="Volume", row=2, col=1)
-        if show_rsi:
-            fig.update_yaxes(title_text="RSI", row=3, col=1, range=[0, 100])
-        
-        st.plotly_chart(fig, use_container_width=True)
-        st.markdown('</div>', unsafe_allow_html=True)
-        # === KẾT THÚC PHẦN SỬA LỖI ===
+            time_range = st.select_slider("⏱️ Thời gian:", options=['1 tháng', '3 tháng', '6 tháng', '1 năm', 'Tất cả'], value='3 tháng')
+            
+            if time_range != 'Tất cả':
+                # Đếm theo phiên giao dịch (khoảng 21 phiên / tháng), không theo ngày lịch
+                sessions_map = {'1 tháng': 21, '3 tháng': 63, '6 tháng': 126, '1 năm': 252}
+                cutoff_date = session_cutoff(datetime.now(), sessions_map[time_range])
+                stock_data = stock_data[stock_data['<DTYYYYMMDD>'] >= cutoff_date]
+                if outliers_data is not None and not outliers_data.empty:
+                    outliers_data = outliers_data[outliers_data['<DTYYYYMMDD>'] >= cutoff_date]
+            
+            # Lát cắt được xác định bởi khoảng ngày, số phiên và cấu hình loại outlier
+            slice_key = (len(stock_data),
+                         str(stock_data['<DTYYYYMMDD>'].iloc[0]) if len(stock_data) else None,
+                         str(stock_data['<DTYYYYMMDD>'].iloc[-1]) if len(stock_data) else None,
+                         outlier_key)
+            with render_trace.stage('indicators', rows_in=len(stock_data)):
+                if show_ma:
+                    stock_data['MA'] = cached_indicator(stock_code, 'MA', (ma_period,), slice_key,
+                                                        lambda: calculate_ma(stock_data, ma_period))
+                if show_ema:
+                    stock_data['EMA'] = cached_indicator(stock_code, 'EMA', (ema_period,), slice_key,
+                                                         lambda: calculate_ema(stock_data, ema_period))
+                if show_bb:
+                    stock_data['BB_MA'], stock_data['BB_Upper'], stock_data['BB_Lower'] = cached_indicator(
+                        stock_code, 'BB', (20, 2), slice_key, lambda: calculate_bollinger_bands(stock_data))
+                if show_rsi:
+                    stock_data['RSI'] = cached_indicator(stock_code, 'RSI', (14,), slice_key,
+                                                         lambda: calculate_rsi(stock_data))
+            
+            # === PHẦN SỬA LỖI HIỂN THỊ NGÀY ===
+            st.markdown('<div class="chart-container">', unsafe_allow_html=True)
+            
+            with render_trace.stage('chart_build', rows_in=len(stock_data)):
+                fig = build_stock_figure(
+                    stock_data, stock_code, chart_type,
+                    show_ma=show_ma, ma_period=ma_period if show_ma else None,
+                    show_ema=show_ema, ema_period=ema_period if show_ema else None,
+                    show_bb=show_bb, show_rsi=show_rsi,
+                    outliers_data=outliers_data if show_outliers else None,
+                    chart_height=chart_height, chart_points=chart_points
+                )
+            if len(stock_data) > chart_points:
+                st.caption(f"🔎 Đã gộp {len(stock_data):,} phiên thành {chart_points:,} điểm để vẽ nhanh hơn")
+            
+            with render_trace.stage('plotly_chart'):
+                st.plotly_chart(fig, use_container_width=True)
+            st.markdown('</div>', unsafe_allow_html=True)
+            # === KẾT THÚC PHẦN SỬA LỖI ===
 
-        st.markdown("---")
-        
-        # BẢNG DỮ LIỆU
-        st.markdown('<div class="data-table-container">', unsafe_allow_html=True)
-        st.markdown("### 📈 DỮ LIỆU CHI TIẾT & THỐNG KÊ")
-        
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            st.markdown(f"""
-                <div class="stats-card">
-                    <h4>📊 Thống kê giá</h4>
-                    <p>TB: {stock_data['<Close>'].mean():,.2f}</p>
-                    <p>Std: {stock_data['<Close>'].std():,.2f}</p>
-                </div>
-            """, unsafe_allow_html=True)
-        
-        with col2:
-            st.markdown(f"""
-                <div class="stats-card">
-                    <h4>📈 Biên độ</h4>
-                    <p>Max: {stock_data['<Close>'].max():,.2f}</p>
-                    <p>Min: {stock_data['<Close>'].min():,.2f}</p>
-                </div>
-            """, unsafe_allow_html=True)
-        
-        with col3:
-            st.markdown(f"""
-                <div class="stats-card">
-                    <h4>💹 Volume TB</h4>
-                    <p>20 ngày: {stock_data['<Volume>'].tail(20).mean():,.2f}</p>
-                    <p>Tổng: {stock_data['<Volume>'].mean():,.2f}</p>
-                </div>
-            """, unsafe_allow_html=True)
-        
-        display_df = stock_data[['<DTYYYYMMDD>', '<Open>', '<High>', '<Low>', '<Close>', '<Volume>']].copy()
-        display_df.columns = ['📅 Ngày', '🔵 Mở', '🔺 Cao', '🔻 Thấp', '⭕ Đóng', '📊 Volume']
-        
-        for col in ['🔵 Mở', '🔺 Cao', '🔻 Thấp', '⭕ Đóng']:
-            display_df[col] = display_df[col].apply(lambda x: f"{x:,.2f}")
-        display_df['📊 Volume'] = display_df['📊 Volume'].apply(lambda x: f"{x:,.2f}")
+            st.markdown("---")
+            
+            # BẢNG DỮ LIỆU
+            st.markdown('<div class="data-table-container">', unsafe_allow_html=True)
+            st.markdown("### 📈 DỮ LIỆU CHI TIẾT & THỐNG KÊ")
+            
+            col1, col2, col3 = st.columns(3)
+            
+            with col1:
+                st.markdown(f"""
+                    <div class="stats-card">
+                        <h4>📊 Thống kê giá</h4>
+                        <p>TB: {stock_data['<Close>'].mean():,.2f}</p>
+                        <p>Std: {stock_data['<Close>'].std():,.2f}</p>
+                    </div>
+                """, unsafe_allow_html=True)
+            
+            with col2:
+                st.markdown(f"""
+                    <div class="stats-card">
+                        <h4>📈 Biên độ</h4>
+                        <p>Max: {stock_data['<Close>'].max():,.2f}</p>
+                        <p>Min: {stock_data['<Close>'].min():,.2f}</p>
+                    </div>
+                """, unsafe_allow_html=True)
+            
+            with col3:
+                st.markdown(f"""
+                    <div class="stats-card">
+                        <h4>💹 Volume TB</h4>
+                        <p>20 ngày: {stock_data['<Volume>'].tail(20).mean():,.2f}</p>
+                        <p>Tổng: {stock_data['<Volume>'].mean():,.2f}</p>
+                    </div>
+                """, unsafe_allow_html=True)
+            
+            display_df = stock_data[['<DTYYYYMMDD>', '<Open>', '<High>', '<Low>', '<Close>', '<Volume>']].copy()
+            display_df.columns = ['📅 Ngày', '🔵 Mở', '🔺 Cao', '🔻 Thấp', '⭕ Đóng', '📊 Volume']
+            
+            for col in ['🔵 Mở', '🔺 Cao', '🔻 Thấp', '⭕ Đóng']:
+                display_df[col] = display_df[col].apply(lambda x: f"{x:,.2f}")
+            display_df['📊 Volume'] = display_df['📊 Volume'].apply(lambda x: f"{x:,.2f}")
+            
+            st.dataframe(display_df.sort_values(by='📅 Ngày', ascending=False).reset_index(drop=True), use_container_width=True, height=450)
+            st.markdown("</div>", unsafe_allow_html=True)
+        else:
+            st.warning(f"⚠️ Không tìm thấy dữ liệu cho {stock_code}")
         
-        st.dataframe(display_df.sort_values(by='📅 Ngày', ascending=False).reset_index(drop=True), use_container_width=True, height=450)
-        st.markdown("</div>", unsafe_allow_html=True)
-    else:
-        st.warning(f"⚠️ Không tìm thấy dữ liệu cho {stock_code}")
+    st.session_state['render_trace'] = render_trace
 else:
     st.markdown("""
         <div class="data-table-container">
@@ -1062,7 +997,7 @@ else:
                 <li>🔄 <strong>Auto fallback:</strong> Chuyển nguồn tự động khi API lỗi</li>
                 <li>📊 <strong>Biểu đồ:</strong> Nến Nhật & Line Chart với hiệu ứng đẹp mắt</li>
                 <li>📈 <strong>Chỉ báo:</strong> MA, EMA, Bollinger Bands, RSI</li>
-                <li>🔬 <strong>Outliers:</strong> Phát hiện bằng IQR hoặc Z-Score</li>
+                <li>🔬 <strong>Outliers:</strong> Phát hiện bằng IQR hoặc Z-Score, toàn lịch sử hoặc cửa sổ trượt</li>
                 <li>🎨 <strong>UI/UX:</strong> Glassmorphism với gradient động</li>
             </ul>
             <br>
@@ -1108,3 +1043,27 @@ else:
         </div>
     """, unsafe_allow_html=True)
 
+# === CHẨN ĐOÁN HIỆU NĂNG ===
+def show_trace(trace, title):
+    """Bảng các bước của 1 trace kèm nút xuất JSON / Prometheus"""
+    st.markdown(f"**{title}** ({trace.created_at})")
+    table = pd.DataFrame([s.to_dict() for s in trace.stages])
+    st.dataframe(table, use_container_width=True, hide_index=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button("⬇️ JSON", trace.to_json(), file_name=f"trace-{trace.name}.json",
+                           mime="application/json", key=f"trace_json_{trace.name}")
+    with col2:
+        st.download_button("⬇️ Prometheus", trace.to_prometheus(), file_name=f"trace-{trace.name}.prom",
+                           mime="text/plain", key=f"trace_prom_{trace.name}")
+
+with st.expander("🩺 Chẩn đoán hiệu năng"):
+    st.checkbox("Đo bộ nhớ chi tiết từng bước (tracemalloc, tải chậm hơn)", key="trace_memory")
+    ingest_trace = st.session_state.get('ingest_trace')
+    render_trace = st.session_state.get('render_trace')
+    if ingest_trace is None and render_trace is None:
+        st.info("Chưa có số liệu: tải dữ liệu hoặc chọn mã để bắt đầu đo")
+    if ingest_trace is not None:
+        show_trace(ingest_trace, f"📥 Lượt tải gần nhất: {ingest_trace.name}")
+    if render_trace is not None:
+        show_trace(render_trace, "📈 Lượt hiển thị gần nhất")
@@ -0,0 +1,182 @@
+# === BENCHMARK OFFLINE: INGEST → LÀM SẠCH → CẮT MÃ → CHỈ BÁO → OUTLIERS → BIỂU ĐỒ ===
+# Chạy: python benchmarks/run_benchmarks.py --scale small full
+# Kết quả ghi vào benchmarks/results/<thời điểm>.json; --compare <file.json> in tỷ lệ so với lần chạy trước.
+import os
+import sys
+import json
+import time
+import zipfile
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.synthetic_cafef import generate_cafef_zip  # noqa: E402
+from cafef_parser import iter_parsed_members, clean_cafef_frame, DEFAULT_PARSE_WORKERS  # noqa: E402
+from market_store import compact_market_frame, prepare_market_frame, slice_ticker  # noqa: E402
+from indicators import (calculate_ma, calculate_ema, calculate_bollinger_bands,  # noqa: E402
+                        calculate_rsi, compute_market_indicators)
+from outliers import (detect_outliers_iqr, detect_outliers_zscore, detect_outliers_rolling,  # noqa: E402
+                      market_anomalies, RETURN_COLUMN)
+from screener import latest_indicator_matrix, run_screen, PRESETS  # noqa: E402
+from correlation import returns_matrix, correlation_matrix, top_correlated  # noqa: E402
+from charts import build_stock_figure  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+# Quy mô: small ~ vài chục mã (vnstock3), full ~ toàn thị trường CafeF
+SCALES = {
+    'small': {'tickers': 50, 'years': 2},
+    'full': {'tickers': 1600, 'years': 10},
+}
+
+
+def timed(fn, repeat=1):
+    """Chạy fn `repeat` lần, trả về (kết quả lần cuối, danh sách thời gian giây)"""
+    runs = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        runs.append(time.perf_counter() - start)
+    return result, runs
+
+
+def ingest(zip_path, workers):
+    with zipfile.ZipFile(zip_path) as z:
+        csv_files = [f for f in z.namelist() if f.lower().endswith('.csv')]
+        frames = [df for _, _, (df, _, _) in iter_parsed_members(z, csv_files, workers) if df is not None]
+    return pd.concat(frames, ignore_index=True)
+
+
+def run_scale(name, tickers, years, repeat, workers, workdir):
+    results = {}
+
+    def record(stage, fn, n=repeat):
+        value, runs = timed(fn, n)
+        results[stage] = {'min': min(runs), 'median': statistics.median(runs), 'runs': len(runs)}
+        print(f"  {stage:<32} {min(runs) * 1000:>10.1f} ms")
+        return value
+
+    zip_path = os.path.join(workdir, f"cafef-{name}.zip")
+    print(f"[{name}] {tickers} mã x {years} năm")
+    (rows, members), gen_runs = timed(lambda: generate_cafef_zip(zip_path, tickers, years))
+    print(f"  (sinh dữ liệu: {rows:,} dòng, {len(members)} file, {gen_runs[0]:.1f} s)")
+
+    raw = record('ingest_serial', lambda: ingest(zip_path, 1), 1)
+    if workers > 1:
+        record(f'ingest_workers_{workers}', lambda: ingest(zip_path, workers), 1)
+    cleaned = record('clean', lambda: clean_cafef_frame(raw.copy()))
+    df, ticker_index = record('compact_prepare', lambda: prepare_market_frame(compact_market_frame(cleaned)))
+
+    rng = np.random.default_rng(0)
+    sample = list(rng.choice(list(ticker_index), size=min(100, len(ticker_index)), replace=False))
+    record('slice_100_tickers', lambda: [slice_ticker(df, ticker_index, t) for t in sample])
+
+    # Mã có lịch sử dài nhất: trường hợp xấu nhất khi chọn "Tất cả"
+    longest = max(ticker_index, key=lambda t: ticker_index[t][1] - ticker_index[t][0])
+    stock_data = slice_ticker(df, ticker_index, longest).copy()
+    record('calculate_ma', lambda: calculate_ma(stock_data, 20))
+    record('calculate_ema', lambda: calculate_ema(stock_data, 12))
+    record('calculate_bollinger_bands', lambda: calculate_bollinger_bands(stock_data))
+    record('calculate_rsi', lambda: calculate_rsi(stock_data))
+    record('compute_market_indicators', lambda: compute_market_indicators(df), 1)
+    latest, previous = record('screener_matrix', lambda: latest_indicator_matrix(df, ticker_index))
+    record('screener_run_presets', lambda: [run_screen(latest, previous, c) for c in PRESETS.values()])
+    returns = record('returns_matrix', lambda: returns_matrix(df, ticker_index))
+    record('top_correlated_1y', lambda: top_correlated(returns.last_sessions(252), longest))
+    record('correlation_matrix', lambda: correlation_matrix(returns), 1)
+    record('detect_outliers_iqr', lambda: detect_outliers_iqr(stock_data, '<Close>'))
+    record('detect_outliers_zscore', lambda: detect_outliers_zscore(stock_data, '<Close>'))
+    record('detect_outliers_rolling_iqr', lambda: detect_outliers_rolling(stock_data, '<Close>', 'iqr', 60))
+    record('market_anomalies_iqr', lambda: market_anomalies(df, ticker_index, RETURN_COLUMN, 'iqr', 60))
+    record('market_anomalies_zscore', lambda: market_anomalies(df, ticker_index, RETURN_COLUMN, 'zscore', 60))
+
+    stock_data['MA'] = calculate_ma(stock_data, 20)
+    stock_data['EMA'] = calculate_ema(stock_data, 12)
+    stock_data['BB_MA'], stock_data['BB_Upper'], stock_data['BB_Lower'] = calculate_bollinger_bands(stock_data)
+    stock_data['RSI'] = calculate_rsi(stock_data)
+    fig = record('chart_build', lambda: build_stock_figure(
+        stock_data, longest, show_ma=True, ma_period=20, show_ema=True, ema_period=12,
+        show_bb=True, show_rsi=True))
+    payload = record('chart_to_json', lambda: fig.to_json())
+
+    return {
+        'tickers': tickers,
+        'years': years,
+        'rows': int(rows),
+        'rows_clean': int(len(df)),
+        'chart_points': int(len(stock_data)),
+        'chart_json_bytes': len(payload),
+        'results': results,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(current, baseline_path):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\nSo với {os.path.basename(baseline_path)} (commit {baseline.get('commit')}):")
+    for scale, data in current['scales'].items():
+        old = baseline.get('scales', {}).get(scale)
+        if old is None:
+            continue
+        print(f"[{scale}]")
+        for stage, res in data['results'].items():
+            if stage in old['results']:
+                before = old['results'][stage]['min']
+                ratio = res['min'] / before if before else float('nan')
+                print(f"  {stage:<32} {before * 1000:>10.1f} → {res['min'] * 1000:>10.1f} ms  (x{ratio:.2f})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline với dữ liệu CafeF giả lập")
+    parser.add_argument('--scale', nargs='+', default=['small'], choices=sorted(SCALES))
+    parser.add_argument('--tickers', type=int, help="Ghi đè số mã của quy mô đã chọn")
+    parser.add_argument('--years', type=float, help="Ghi đè số năm lịch sử")
+    parser.add_argument('--repeat', type=int, default=5, help="Số lần lặp cho các bước nhanh")
+    parser.add_argument('--workers', type=int, default=DEFAULT_PARSE_WORKERS, help="Số tiến trình parse song song")
+    parser.add_argument('--output', default=None, help="File JSON kết quả (mặc định benchmarks/results/<thời điểm>.json)")
+    parser.add_argument('--compare', default=None, help="File JSON của lần chạy trước để so sánh")
+    args = parser.parse_args(argv)
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'scales': {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for scale in args.scale:
+            tickers = args.tickers or SCALES[scale]['tickers']
+            years = args.years or SCALES[scale]['years']
+            report['scales'][scale] = run_scale(scale, tickers, years, args.repeat, args.workers, workdir)
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nĐã ghi kết quả: {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
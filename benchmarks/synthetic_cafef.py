@@ -0,0 +1,114 @@
+# === SINH FILE ZIP CAFEF GIẢ LẬP (CHẠY OFFLINE) ===
+# Archive giống file Upto của CafeF: mỗi sàn 1 hoặc nhiều file CSV, trộn các biến thể header
+# (<Ticker>..., tiếng Việt, tiếng Anh) và encoding mà cafef_parser phải xử lý.
+import os
+import sys
+import zipfile
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Biến thể header: (tên, cột theo thứ tự REQUIRED_COLS, encoding, định dạng ngày)
+HEADER_VARIANTS = [
+    ('raw', ['<Ticker>', '<DTYYYYMMDD>', '<Open>', '<High>', '<Low>', '<Close>', '<Volume>'], 'utf-8', '%Y%m%d'),
+    ('vi', ['Mã CK', 'Ngày', 'Giá mở cửa', 'Giá cao nhất', 'Giá thấp nhất', 'Giá đóng cửa', 'Khối lượng'],
+     'utf-8', '%Y-%m-%d'),
+    ('vi_ascii', ['Ma', 'ThoiGian', 'GiaMoCua', 'GiaCaoNhat', 'GiaThapNhat', 'GiaDongCua', 'KhoiLuong'],
+     'cp1252', '%Y-%m-%d'),
+    ('en', ['Symbol', 'TradingDate', 'OpenPrice', 'HighPrice', 'LowPrice', 'ClosePrice', 'TotalVolume'],
+     'latin1', '%Y-%m-%d'),
+]
+
+EXCHANGES = ['HSX', 'HNX', 'UPCOM']
+
+
+def make_tickers(n_tickers, seed=0):
+    """n_tickers mã 3 chữ cái ngẫu nhiên, không trùng, theo thứ tự alphabet"""
+    rng = np.random.default_rng(seed)
+    letters = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+    codes = set()
+    while len(codes) < n_tickers:
+        codes.update(''.join(c) for c in rng.choice(letters, size=(n_tickers, 3)))
+    return sorted(codes)[:n_tickers]
+
+
+def make_market_frame(n_tickers, years, end=None, seed=0):
+    """Lịch sử OHLCV giả lập theo ngày làm việc; mã niêm yết sau có lịch sử ngắn hơn"""
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp(end or pd.Timestamp.now().normalize())
+    dates = pd.bdate_range(end=end, periods=int(years * 252))
+    frames = []
+    for ticker in make_tickers(n_tickers, seed):
+        start = int(rng.integers(0, max(1, len(dates) // 3)))
+        n = len(dates) - start
+        close = np.maximum(1.0, 20 * np.exp(np.cumsum(rng.normal(0, 0.02, n))))
+        spread = close * rng.uniform(0, 0.03, n)
+        open_ = close + rng.uniform(-1, 1, n) * spread
+        frames.append(pd.DataFrame({
+            'ticker': ticker,
+            'date': dates[start:],
+            'open': np.round(open_, 2),
+            'high': np.round(np.maximum(open_, close) + spread, 2),
+            'low': np.round(np.maximum(0.1, np.minimum(open_, close) - spread), 2),
+            'close': np.round(close, 2),
+            'volume': rng.integers(0, 5_000_000, n),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def write_cafef_zip(path, market, members_per_exchange=2, seed=0):
+    """Ghi market ra archive: chia mã theo sàn rồi theo member, mỗi member 1 biến thể header/encoding"""
+    rng = np.random.default_rng(seed)
+    tickers = market['ticker'].unique()
+    exchange_of = dict(zip(tickers, rng.choice(EXCHANGES, size=len(tickers), p=[0.3, 0.2, 0.5])))
+    members = []
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+        variant_idx = 0
+        for exchange in EXCHANGES:
+            exchange_tickers = [t for t in tickers if exchange_of[t] == exchange]
+            for part, chunk in enumerate(np.array_split(np.array(exchange_tickers), members_per_exchange)):
+                if len(chunk) == 0:
+                    continue
+                name, columns, encoding, date_format = HEADER_VARIANTS[variant_idx % len(HEADER_VARIANTS)]
+                variant_idx += 1
+                frame = market[market['ticker'].isin(chunk)]
+                out = pd.DataFrame({
+                    columns[0]: frame['ticker'].to_numpy(),
+                    columns[1]: frame['date'].dt.strftime(date_format).to_numpy(),
+                    columns[2]: frame['open'].to_numpy(),
+                    columns[3]: frame['high'].to_numpy(),
+                    columns[4]: frame['low'].to_numpy(),
+                    columns[5]: frame['close'].to_numpy(),
+                    columns[6]: frame['volume'].to_numpy(),
+                })
+                member = f"CafeF.{exchange}.Upto.{part + 1}.{name}.csv"
+                z.writestr(member, out.to_csv(index=False).encode(encoding))
+                members.append({'member': member, 'variant': name, 'encoding': encoding, 'rows': int(len(out))})
+    return members
+
+
+def generate_cafef_zip(path, n_tickers=200, years=2, members_per_exchange=2, seed=0):
+    """Sinh archive giả lập tại `path`. Trả về (số dòng, danh sách member)."""
+    market = make_market_frame(n_tickers, years, seed=seed)
+    members = write_cafef_zip(path, market, members_per_exchange, seed)
+    return len(market), members
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sinh file ZIP CafeF giả lập")
+    parser.add_argument('output', help="Đường dẫn file .zip")
+    parser.add_argument('--tickers', type=int, default=200)
+    parser.add_argument('--years', type=float, default=2)
+    parser.add_argument('--members-per-exchange', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rows, members = generate_cafef_zip(args.output, args.tickers, args.years, args.members_per_exchange, args.seed)
+    print(f"{args.output}: {rows:,} dòng, {len(members)} file CSV, {os.path.getsize(args.output) / 1024 / 1024:.1f} MB")
+    for m in members:
+        print(f"  {m['member']:<40} {m['encoding']:<10} {m['rows']:>10,}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
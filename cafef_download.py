@@ -0,0 +1,360 @@
+# === KẾT NỐI HTTP TỚI CAFEF CDN ===
+# Dò nhiều ngày song song trên 1 requests.Session dùng chung (keep-alive),
+# tổng thời gian dò chỉ bằng round-trip chậm nhất thay vì tổng tất cả.
+# File ZIP được giữ trong thư mục tải kèm ETag / Last-Modified / kích thước: tải lại cùng url chỉ là
+# 1 GET có điều kiện (304 -> dùng bản đã có), kết nối đứt giữa chừng thì tải tiếp bằng Range.
+# Mỗi url có 1 file khóa: nhiều process (worker Streamlit, cron) tải cùng url lần lượt chứ không
+# cùng ghi vào 1 file .part; người đến sau thường chỉ còn 1 GET có điều kiện. File ZIP đang được
+# xử lý (fetch_archive) giữ thêm khóa dùng chung `.use`: lần tải khác không dọn được nó.
+import os
+import json
+import time
+import errno
+import hashlib
+import zipfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+PROBE_TIMEOUT = 10
+MAX_PROBE_WORKERS = 10
+
+DOWNLOAD_TIMEOUT = 120
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Số lần tải tiếp (Range) ngay trong 1 lần gọi khi kết nối bị đứt
+MAX_RESUME_ATTEMPTS = 3
+# Số file ZIP hoàn chỉnh giữ lại trong thư mục tải
+KEEP_DOWNLOADED_ARCHIVES = 2
+# Chờ khóa trên Windows (msvcrt không có khóa chờ vô hạn)
+LOCK_POLL_INTERVAL = 0.2
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """requests.Session dùng chung cho toàn process (connection pool đủ cho các luồng dò song song)"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_PROBE_WORKERS)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+def _head(session, url, timeout):
+    try:
+        return session.head(url, timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        return e
+
+
+def head_many(urls, timeout=PROBE_TIMEOUT, max_workers=MAX_PROBE_WORKERS):
+    """Gửi HEAD song song cho tất cả url. Trả về dict url -> Response hoặc exception."""
+    session = get_http_session()
+    results = {}
+    if not urls:
+        return results
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as executor:
+        futures = {executor.submit(_head, session, url, timeout): url for url in urls}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    return results
+
+
+def find_newest_available(candidates, timeout=PROBE_TIMEOUT, max_workers=MAX_PROBE_WORKERS):
+    """Dò song song các ứng viên (key, url) xếp từ mới đến cũ.
+
+    Ứng viên mới nhất trả về HTTP 200 thắng ngay khi mọi ứng viên mới hơn nó đã trả lời,
+    không chờ các ngày cũ hơn. Trả về ((key, url, response) hoặc None, dict url -> kết quả đã nhận).
+    """
+    session = get_http_session()
+    results = {}
+    if not candidates:
+        return None, results
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(candidates)))
+    try:
+        futures = {executor.submit(_head, session, url, timeout): url for _, url in candidates}
+        next_idx = 0
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            # Tiến con trỏ qua các ứng viên mới nhất đã có kết quả
+            while next_idx < len(candidates) and candidates[next_idx][1] in results:
+                key, url = candidates[next_idx]
+                response = results[url]
+                if isinstance(response, requests.Response) and response.status_code == 200:
+                    return (key, url, response), results
+                next_idx += 1
+        return None, results
+    finally:
+        # Không chờ các ngày cũ hơn còn đang dò
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# === TẢI FILE CÓ ĐIỀU KIỆN / TẢI TIẾP ===
+class IncompleteDownload(requests.exceptions.RequestException):
+    """File tải về thiếu byte hoặc không phải ZIP hoàn chỉnh (phần đã tải được giữ để lần sau tải tiếp)"""
+
+
+def _download_paths(url, download_dir):
+    """(file ZIP, file đang tải dở, file metadata, file khóa tải) của url trong thư mục tải"""
+    name = url.rstrip('/').rsplit('/', 1)[-1]
+    path = os.path.join(download_dir, f"{hashlib.sha1(url.encode('utf-8')).hexdigest()[:10]}-{name}")
+    return path, path + '.part', path + '.json', path + '.lock'
+
+
+def _try_lock(fd, blocking, shared=False):
+    """Khóa fd (độc quyền, hoặc dùng chung nếu shared); False nếu blocking=False và khóa đang bị giữ.
+
+    Windows (msvcrt) không có khóa dùng chung: shared cũng là khóa độc quyền.
+    """
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if blocking else fcntl.LOCK_NB))
+            return True
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EACCES, errno.EWOULDBLOCK):
+                return False
+            raise
+    while True:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(LOCK_POLL_INTERVAL)
+
+
+def _open_locked(lock_path, blocking, shared=False):
+    """fd của lock_path đã khóa; None nếu blocking=False và khóa đang bị giữ"""
+    while True:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            locked = _try_lock(fd, blocking, shared)
+            # File khóa có thể đã bị _prune_downloads xóa trong lúc chờ: khóa lại trên file mới
+            same_file = locked and os.path.exists(lock_path) and os.fstat(fd).st_ino == os.stat(lock_path).st_ino
+        except BaseException:
+            os.close(fd)
+            raise
+        if same_file:
+            return fd
+        os.close(fd)
+        if not locked:
+            return None
+
+
+@contextmanager
+def _exclusive_lock(lock_path, blocking=True):
+    """Giữ khóa độc quyền trên lock_path (giữa các process và các luồng).
+    Yield False nếu blocking=False và khóa đang bị giữ."""
+    fd = _open_locked(lock_path, blocking)
+    if fd is None:
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        # Đóng fd là nhả khóa
+        os.close(fd)
+
+
+def _read_meta(meta_path, url):
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return meta if meta.get('url') == url else {}
+
+
+def _write_meta(meta_path, meta):
+    tmp_path = f"{meta_path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, meta_path)
+
+
+def _remove(*paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _is_complete(path, meta):
+    return bool(meta.get('complete')) and os.path.exists(path) and os.path.getsize(path) == meta.get('length')
+
+
+def _request_headers(path, part_path, meta):
+    """Header cho GET: có điều kiện nếu đã có file hoàn chỉnh, Range nếu có phần tải dở"""
+    # identity: số byte nhận được khớp Content-Length / Content-Range, không bị giải nén ngầm
+    headers = {'Accept-Encoding': 'identity'}
+    validator = meta.get('etag') or meta.get('last_modified')
+    if _is_complete(path, meta):
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+    elif validator and os.path.exists(part_path) and os.path.getsize(part_path) > 0:
+        headers['Range'] = f"bytes={os.path.getsize(part_path)}-"
+        # File trên server đã đổi thì server trả 200 (cả file) thay vì 206
+        headers['If-Range'] = validator
+    return headers
+
+
+def _expected_length(response, offset):
+    """Tổng kích thước file theo Content-Range (206) hoặc Content-Length (200), None nếu không rõ"""
+    if response.status_code == 206:
+        # Content-Range: bytes <start>-<end>/<total>
+        unit_range, _, total = response.headers.get('Content-Range', '').partition('/')
+        start = unit_range.replace('bytes', '').strip().split('-')[0]
+        if not start.isdigit() or int(start) != offset or not total.isdigit():
+            raise IncompleteDownload(f"Content-Range không khớp: {response.headers.get('Content-Range')!r}")
+        return int(total)
+    length = response.headers.get('Content-Length')
+    return int(length) if length and length.isdigit() else None
+
+
+def _prune_downloads(download_dir, keep):
+    """Chỉ giữ `keep` file ZIP hoàn chỉnh mới nhất (kèm metadata), bỏ các phần tải dở cũ hơn.
+
+    Bỏ qua file mà process khác đang giữ khóa: đang tải / kiểm tra (`.lock`) hoặc đang xử lý (`.use`).
+    """
+    entries = []
+    for name in os.listdir(download_dir):
+        if name.endswith('.zip') or name.endswith('.zip.part'):
+            path = os.path.join(download_dir, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                continue
+    entries.sort(reverse=True)
+    for _, path in entries[keep:]:
+        base = path[:-len('.part')] if path.endswith('.part') else path
+        with _exclusive_lock(base + '.lock', blocking=False) as locked, \
+                _exclusive_lock(base + '.use', blocking=False) as unused:
+            if not (locked and unused):
+                continue
+            _remove(path, base + '.json')
+            if not os.path.exists(base) and not os.path.exists(base + '.part'):
+                try:
+                    _remove(base + '.lock', base + '.use')
+                except OSError:
+                    # Windows không xóa được file đang mở; để lại file khóa rỗng
+                    pass
+
+
+@contextmanager
+def fetch_archive(url, download_dir, on_progress=None, timeout=DOWNLOAD_TIMEOUT,
+                  max_resumes=MAX_RESUME_ATTEMPTS, keep=KEEP_DOWNLOADED_ARCHIVES):
+    """Tải file ZIP về download_dir, dùng lại / tải tiếp bản đã có nếu được; file được giữ
+    (không bị lần tải khác dọn đi) cho tới hết khối with.
+
+    on_progress(số byte đã có, tổng số byte hoặc None). Kích thước và bản ghi cuối của ZIP
+    được kiểm tra trước khi trả về. Yield (đường dẫn file, trạng thái, số byte đã truyền),
+    trạng thái: 'cached' (server trả 304), 'downloaded' hoặc 'resumed'.
+    Lỗi mạng / IncompleteDownload được raise cho caller (phần tải dở được giữ lại).
+    Các lần tải cùng url (kể cả từ process khác) chạy lần lượt; phần xử lý trong khối with thì không.
+    """
+    os.makedirs(download_dir, exist_ok=True)
+    path, part_path, meta_path, lock_path = _download_paths(url, download_dir)
+    with _exclusive_lock(lock_path):
+        result = _download_locked(url, path, part_path, meta_path, on_progress, timeout, max_resumes)
+        # Lấy khóa dùng chung trước khi nhả khóa tải: không có lúc nào file không được giữ
+        in_use = _open_locked(path + '.use', blocking=True, shared=True)
+        _prune_downloads(download_dir, keep)
+    try:
+        yield result
+    finally:
+        os.close(in_use)
+
+
+def download_archive(url, download_dir, **kwargs):
+    """Như fetch_archive nhưng chỉ tải: file có thể bị lần tải sau dọn đi bất cứ lúc nào"""
+    with fetch_archive(url, download_dir, **kwargs) as result:
+        return result
+
+
+def _download_locked(url, path, part_path, meta_path, on_progress, timeout, max_resumes):
+    """Phần việc của download_archive khi đã giữ khóa của url"""
+    meta = _read_meta(meta_path, url)
+    session = get_http_session()
+    transferred = 0
+    resumed = False
+    size = expected = error = None
+
+    for _ in range(max_resumes + 1):
+        headers = _request_headers(path, part_path, meta)
+        offset = os.path.getsize(part_path) if 'Range' in headers else 0
+        error = None
+        with session.get(url, headers=headers, stream=True, timeout=timeout) as r:
+            if r.status_code == 304 and _is_complete(path, meta):
+                os.utime(path)
+                return path, 'cached', transferred
+            if r.status_code == 416:
+                # Phần tải dở không còn khớp với file trên server: tải lại từ đầu
+                _remove(part_path, meta_path)
+                meta = {}
+                continue
+            r.raise_for_status()
+            if r.status_code != 206:
+                offset = 0
+            expected = _expected_length(r, offset)
+            resumed = resumed or r.status_code == 206
+            meta = {
+                'url': url,
+                'etag': r.headers.get('ETag'),
+                'last_modified': r.headers.get('Last-Modified'),
+                'length': expected,
+                'complete': False,
+            }
+            # Ghi validator trước khi tải để lần sau biết phần tải dở thuộc phiên bản file nào
+            _write_meta(meta_path, meta)
+
+            size = offset
+            try:
+                with open(part_path, 'ab' if offset else 'wb') as f:
+                    for chunk in r.raw.stream(DOWNLOAD_CHUNK_SIZE, decode_content=False):
+                        f.write(chunk)
+                        size += len(chunk)
+                        transferred += len(chunk)
+                        if on_progress is not None:
+                            on_progress(size, expected)
+            except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError, OSError) as e:
+                error = e
+
+        if size == expected or expected is None and error is None:
+            break
+        if expected is not None and size > expected:
+            _remove(part_path)
+            meta = {}
+    else:
+        raise IncompleteDownload(f"Chỉ nhận được {size or 0:,}/{expected or 0:,} bytes từ {url}: {error}")
+
+    # Kiểm tra kích thước của chính file trên đĩa, không tin số byte đếm được trong lần gọi này
+    actual = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if expected is not None and actual != expected:
+        _remove(part_path, meta_path)
+        raise IncompleteDownload(f"File tải về từ {url} có {actual:,} bytes, cần {expected:,}")
+    if not zipfile.is_zipfile(part_path):
+        _remove(part_path, meta_path)
+        raise IncompleteDownload(f"File tải về từ {url} không phải ZIP hoàn chỉnh")
+    os.replace(part_path, path)
+    meta['length'] = actual
+    meta['complete'] = True
+    _write_meta(meta_path, meta)
+    return path, 'resumed' if resumed else 'downloaded', transferred
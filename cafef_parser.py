@@ -0,0 +1,371 @@
+# === XỬ LÝ FILE CSV TRONG ARCHIVE CAFEF ===
+# Tách riêng khỏi app.py để các process con (ProcessPoolExecutor) có thể import
+# mà không phải chạy lại toàn bộ giao diện Streamlit.
+# Mỗi file chỉ đọc 1 lần: encoding đoán từ BOM / dòng header, kế hoạch đọc (vị trí cột -> tên chuẩn)
+# cache theo header, chỉ đọc các cột cần với kiểu định sẵn, ngày YYYYMMDD đổi bằng số học.
+import os
+import csv
+import time
+import codecs
+import zipfile
+import functools
+import importlib.util
+import multiprocessing
+from io import BytesIO
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Header không giải mã được bằng UTF-8 thì thử lần lượt (latin1 luôn giải mã được)
+FALLBACK_ENCODINGS = ['cp1252', 'latin1']
+
+# pyarrow (có sẵn cùng streamlit) đọc CSV nhanh hơn engine C của pandas; không có thì dùng pandas
+PYARROW_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+
+# Định dạng ngày dạng chuỗi thử theo thứ tự trên vài giá trị đầu (YYYYMMDD dạng số xử lý riêng)
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%Y/%m/%d', '%d-%m-%Y', '%m/%d/%Y', '%Y-%m-%d %H:%M:%S']
+DATE_SAMPLE_SIZE = 20
+
+# Mapping cột - mở rộng hơn
+COLUMN_MAPPING = {
+    # Tiếng Việt
+    'Mã CK': '<Ticker>', 'Mã': '<Ticker>', 'TICKER': '<Ticker>', 'Ma': '<Ticker>',
+    'Ngày': '<DTYYYYMMDD>', 'Thời gian': '<DTYYYYMMDD>', 'NGAY': '<DTYYYYMMDD>',
+    'ThoiGian': '<DTYYYYMMDD>', 'Thoi gian': '<DTYYYYMMDD>',
+    'Mở cửa': '<Open>', 'Giá mở cửa': '<Open>', 'OPEN': '<Open>', 'GiaMoCua': '<Open>',
+    'Cao nhất': '<High>', 'Giá cao nhất': '<High>', 'HIGH': '<High>', 'GiaCaoNhat': '<High>',
+    'Thấp nhất': '<Low>', 'Giá thấp nhất': '<Low>', 'LOW': '<Low>', 'GiaThapNhat': '<Low>',
+    'Đóng cửa': '<Close>', 'Giá đóng cửa': '<Close>', 'CLOSE': '<Close>', 'GiaDongCua': '<Close>',
+    'Đ.Cửa': '<Close>', 'DC': '<Close>',
+    'KLGD': '<Volume>', 'Khối lượng': '<Volume>', 'KL': '<Volume>', 'VOLUME': '<Volume>',
+    'KhoiLuong': '<Volume>', 'Khoi luong': '<Volume>',
+    # Tiếng Anh
+    'Code': '<Ticker>', 'Symbol': '<Ticker>', 'Ticker': '<Ticker>',
+    'TradingDate': '<DTYYYYMMDD>', 'Date': '<DTYYYYMMDD>',
+    'Time': '<DTYYYYMMDD>', 'DateTime': '<DTYYYYMMDD>',
+    'Open': '<Open>', 'OpenPrice': '<Open>',
+    'High': '<High>', 'HighPrice': '<High>',
+    'Low': '<Low>', 'LowPrice': '<Low>',
+    'Close': '<Close>', 'ClosePrice': '<Close>',
+    'Volume': '<Volume>', 'TotalVolume': '<Volume>', 'Vol': '<Volume>'
+}
+
+REQUIRED_COLS = ['<Ticker>', '<DTYYYYMMDD>', '<Open>', '<High>', '<Low>', '<Close>', '<Volume>']
+
+# Khóa trong df.attrs chứa thời gian từng bước parse của 1 file
+PARSE_TIMINGS_ATTR = 'parse_timings'
+
+# Số tiến trình mặc định cho chế độ xử lý song song (có thể đặt qua biến môi trường)
+DEFAULT_PARSE_WORKERS = int(os.environ.get('CAFEF_PARSE_WORKERS', 0)) or max(1, (os.cpu_count() or 1) - 1)
+
+
+def sniff_header(payload):
+    """(encoding, dòng header đã giải mã) từ các byte đầu của file; None nếu file rỗng"""
+    bom = payload.startswith(codecs.BOM_UTF8)
+    start = len(codecs.BOM_UTF8) if bom else 0
+    end = payload.find(b'\n', start)
+    line = payload[start:end if end >= 0 else len(payload)].rstrip(b'\r')
+    if not line.strip():
+        return None
+    for encoding in ['utf-8'] + FALLBACK_ENCODINGS:
+        try:
+            return ('utf-8-sig' if bom else encoding), line.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+
+
+@functools.lru_cache(maxsize=256)
+def header_plan(header_line):
+    """Kế hoạch đọc cho 1 header (cache theo nội dung header): (cột gốc, {vị trí cột: tên chuẩn}).
+
+    Mỗi tên chuẩn lấy cột đầu tiên khớp COLUMN_MAPPING (hoặc đã là tên chuẩn).
+    """
+    raw_columns = [c.strip() for c in next(csv.reader([header_line]))]
+    positions = {}
+    for position, name in enumerate(raw_columns):
+        target = name if name in REQUIRED_COLS else COLUMN_MAPPING.get(name)
+        if target is not None and target not in positions.values():
+            positions[position] = target
+    return raw_columns, positions
+
+
+def _skip_long_rows(row):
+    """Dòng thừa cột bị bỏ như on_bad_lines='skip' của pandas. Dòng thiếu cột pandas giữ lại (NaN)
+    nhưng pyarrow không bù được: báo lỗi để parse_cafef_csv đọc lại bằng pandas."""
+    return 'skip' if row.actual_columns > row.expected_columns else 'error'
+
+
+def _read_pyarrow(payload, encoding, n_columns, positions):
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    names = [f"c{i}" for i in range(n_columns)]
+    column_types = {}
+    for position, target in positions.items():
+        if target == '<Ticker>':
+            column_types[names[position]] = pa.string()
+        elif target != '<DTYYYYMMDD>':
+            column_types[names[position]] = pa.float64()
+    table = pa_csv.read_csv(
+        BytesIO(payload),
+        # Bỏ dòng header (kể cả BOM), đặt tên cột theo vị trí. UTF-8 đọc thẳng, encoding khác
+        # được chuyển mã (nếu không thì mọi file cp1252 / latin1 có mã không phải ASCII bị đọc 2 lần)
+        read_options=pa_csv.ReadOptions(skip_rows=1, column_names=names,
+                                        encoding='utf8' if encoding.startswith('utf-8') else encoding),
+        parse_options=pa_csv.ParseOptions(invalid_row_handler=_skip_long_rows),
+        # strings_can_be_null: mã rỗng / 'NA' thành null như pandas
+        convert_options=pa_csv.ConvertOptions(include_columns=[names[p] for p in positions],
+                                              column_types=column_types, strings_can_be_null=True),
+    )
+    df = table.to_pandas(date_as_object=False)
+    return df.rename(columns={names[p]: target for p, target in positions.items()})
+
+
+def _read_pandas(payload, encoding, positions):
+    # Đọc đủ các cột như header rồi mới lấy cột cần: với usecols, engine C không còn bỏ dòng thừa cột
+    def read(encoding):
+        return pd.read_csv(BytesIO(payload), encoding=encoding, on_bad_lines='skip')
+
+    try:
+        df = read(encoding)
+    except UnicodeDecodeError:
+        # Header là UTF-8 nhưng thân file không phải
+        df = read('latin1')
+    df = df.iloc[:, sorted(positions)]
+    df.columns = [positions[p] for p in sorted(positions)]
+    for col in df.columns:
+        if col not in ('<Ticker>', '<DTYYYYMMDD>') and not pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+
+def _yyyymmdd_to_datetime(values):
+    """Số nguyên YYYYMMDD (float, có thể NaN) -> datetime64[ns]; giá trị không phải ngày hợp lệ -> NaT"""
+    values = np.asarray(values, dtype=np.float64)
+    ok = np.isfinite(values) & (values >= 19000101) & (values <= 22001231) & (values == np.floor(values))
+    v = np.where(ok, values, 19700101).astype(np.int64)
+    month = v // 100 % 100
+    day = v % 100
+    ok &= (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+    months = np.where(ok, (v // 10000 - 1970) * 12 + month - 1, 0).astype('datetime64[M]')
+    dates = months.astype('datetime64[D]') + np.where(ok, day - 1, 0)
+    # Ngày không tồn tại (vd. 20240231) tràn sang tháng sau
+    ok &= dates.astype('datetime64[M]') == months
+    result = dates.astype('datetime64[ns]')
+    result[~ok] = np.datetime64('NaT')
+    return result
+
+
+def parse_trading_dates(series):
+    """Cột ngày của CafeF -> datetime64[ns] không qua đường đoán định dạng chậm của pd.to_datetime.
+
+    Số (hoặc chuỗi 8 chữ số) là YYYYMMDD: pd.to_datetime sẽ hiểu nhầm thành nano giây từ 1970.
+    Chuỗi khác: định dạng đầu tiên trong DATE_FORMATS khớp mọi giá trị mẫu.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.astype('datetime64[ns]')
+    if pd.api.types.is_numeric_dtype(series):
+        return pd.Series(_yyyymmdd_to_datetime(series.to_numpy()), index=series.index)
+    text = series.astype(str).str.strip()
+    sample = text[series.notna()].head(DATE_SAMPLE_SIZE)
+    if sample.str.fullmatch(r'\d{8}').all():
+        return pd.Series(_yyyymmdd_to_datetime(pd.to_numeric(text, errors='coerce').to_numpy()), index=series.index)
+    for date_format in DATE_FORMATS:
+        if pd.to_datetime(sample, format=date_format, errors='coerce').notna().all():
+            return pd.to_datetime(text, format=date_format, errors='coerce')
+    return pd.to_datetime(text, errors='coerce')
+
+
+def parse_cafef_csv(f):
+    """Đọc 1 file CSV của CafeF và chuẩn hóa về schema <Ticker>/<DTYYYYMMDD>/<Open>/...
+
+    Trả về (df, cột gốc). df là None nếu file không hợp lệ; cột gốc là None nếu
+    không đọc được file hoặc file rỗng.
+    """
+    start = time.perf_counter()
+    payload = f.read() if hasattr(f, 'read') else bytes(f)
+    sniffed = sniff_header(payload)
+    if sniffed is None:
+        return None, None
+    encoding, header_line = sniffed
+    raw_columns, positions = header_plan(header_line)
+
+    # Kiểm tra có đủ cột cần thiết không (trước khi đọc thân file)
+    if not {'<Ticker>', '<Close>', '<DTYYYYMMDD>'} <= set(positions.values()):
+        return None, raw_columns
+
+    df = None
+    if PYARROW_AVAILABLE:
+        try:
+            df = _read_pyarrow(payload, encoding, len(raw_columns), positions)
+        except Exception:
+            # Dòng thiếu cột, lỗi kiểu dữ liệu / encoding lạ: đọc lại bằng pandas (ép kiểu mềm hơn)
+            df = None
+    if df is None:
+        df = _read_pandas(payload, encoding, positions)
+    if df.empty:
+        return None, None
+    read_seconds = time.perf_counter() - start
+
+    # Xử lý cột ngày
+    start = time.perf_counter()
+    df['<DTYYYYMMDD>'] = parse_trading_dates(df['<DTYYYYMMDD>'])
+    date_seconds = time.perf_counter() - start
+
+    # Thêm các cột thiếu với giá trị mặc định
+    for col in REQUIRED_COLS:
+        if col not in df.columns:
+            if col in ['<Open>', '<High>', '<Low>']:
+                df[col] = df['<Close>']
+            elif col == '<Volume>':
+                df[col] = 0
+
+    df = df[REQUIRED_COLS]
+
+    # Thời gian từng bước, đi kèm df qua IPC để process cha cộng dồn (xem instrumentation.py)
+    df.attrs[PARSE_TIMINGS_ATTR] = {'read_csv': read_seconds, 'to_datetime': date_seconds}
+    return df, raw_columns
+
+
+def _ranked_codes(values):
+    """(mã số của từng giá trị, các giá trị khác nhau, hạng của từng giá trị khác nhau theo thứ tự tăng)
+
+    factorize là phép băm O(n); chỉ các giá trị khác nhau (vài nghìn) mới cần sắp xếp.
+    """
+    codes, uniques = pd.factorize(values)
+    ranks = np.empty(len(uniques), dtype=np.int64)
+    ranks[np.argsort(uniques, kind='stable')] = np.arange(len(uniques))
+    return codes, uniques, ranks
+
+
+def clean_cafef_frame(df, on_step=None):
+    """Làm sạch dữ liệu đã gộp từ các file CSV: bỏ NaN, ticker rỗng, giá <= 0 và bản ghi trùng.
+
+    Kết quả sắp xếp theo (<Ticker>, <DTYYYYMMDD>); bản ghi trùng giữ dòng xuất hiện sau cùng.
+    Các điều kiện lọc gộp thành 1 mask, thứ tự + loại trùng bằng 1 lần argsort ổn định trên khóa số
+    (hạng mã × số ngày + hạng ngày), nên chỉ sao chép dữ liệu 1 lần ở cuối.
+    on_step(tên bước, số dòng còn lại) được gọi sau mỗi bước ('dropna', 'ticker', 'price', 'sort', 'dedupe').
+    """
+    def report(step, rows):
+        if on_step is not None:
+            on_step(step, int(rows))
+
+    dates = df['<DTYYYYMMDD>'].to_numpy()
+    close = df['<Close>'].to_numpy()
+    keep = pd.notna(dates) & pd.notna(close) & df['<Ticker>'].notna().to_numpy()
+    report('dropna', keep.sum())
+
+    # Chuẩn hóa mã trên các giá trị khác nhau rồi gộp các biến thể (' fpt', 'FPT') về cùng 1 mã
+    raw_codes, raw_tickers = pd.factorize(df['<Ticker>'])
+    normalized = pd.Series(raw_tickers, dtype=object).astype(str).str.strip().str.upper().to_numpy(dtype=object)
+    ticker_codes, tickers, ticker_ranks = _ranked_codes(normalized)
+    valid_ticker = (tickers != '') & (tickers != 'NAN')
+    codes = ticker_codes[raw_codes]
+    keep &= (raw_codes >= 0) & valid_ticker[codes]
+    report('ticker', keep.sum())
+
+    with np.errstate(invalid='ignore'):
+        keep &= close > 0
+    rows = np.flatnonzero(keep)
+    report('price', len(rows))
+
+    date_codes, date_values, date_ranks = _ranked_codes(dates[rows])
+    keys = ticker_ranks[codes[rows]] * len(date_values) + date_ranks[date_codes]
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    report('sort', len(rows))
+
+    # Trong mỗi nhóm khóa bằng nhau (đã ổn định theo thứ tự gốc), giữ dòng cuối
+    last = np.ones(len(keys), dtype=bool)
+    last[:-1] = keys[1:] != keys[:-1]
+    take = rows[order[last]]
+    report('dedupe', len(take))
+
+    columns = {}
+    for col in df.columns:
+        columns[col] = tickers[codes[take]] if col == '<Ticker>' else df[col].to_numpy()[take]
+    return pd.DataFrame(columns, index=df.index[take])
+
+
+def _parse_member_bytes(payload):
+    """Worker: parse nội dung 1 member đã đọc sẵn. Trả về (df, cột gốc, lỗi)."""
+    try:
+        df, raw_columns = parse_cafef_csv(BytesIO(payload))
+        return df, raw_columns, None
+    except Exception as e:
+        return None, None, str(e)
+
+
+# Worker giữ lại handle của archive đã mở để không phải đọc lại central directory cho mỗi member
+_WORKER_ZIPS = {}
+
+
+def _parse_member_from_path(zip_path, csv_file):
+    """Worker: tự mở archive trên đĩa và parse 1 member, không cần truyền nội dung qua IPC."""
+    try:
+        z = _WORKER_ZIPS.get(zip_path)
+        if z is None:
+            z = _WORKER_ZIPS[zip_path] = zipfile.ZipFile(zip_path)
+    except Exception as e:
+        return None, None, str(e)
+    return _parse_member_serial(z, csv_file)
+
+
+def _parse_member_serial(z, csv_file):
+    try:
+        # Giải nén 1 lần vào bộ nhớ: thử lại encoding khác không phải giải nén lại từ đầu
+        start = time.perf_counter()
+        payload = z.read(csv_file)
+        unzip_seconds = time.perf_counter() - start
+        df, raw_columns = parse_cafef_csv(BytesIO(payload))
+        if df is not None:
+            df.attrs[PARSE_TIMINGS_ATTR]['unzip'] = unzip_seconds
+        return df, raw_columns, None
+    except Exception as e:
+        return None, None, str(e)
+
+
+def iter_parsed_members(z, csv_files, workers=1):
+    """Parse lần lượt các member CSV, yield (idx, tên file, (df, cột gốc, lỗi)) theo đúng thứ tự.
+
+    workers <= 1 chạy tuần tự trong process hiện tại. workers > 1 dùng process pool;
+    số member đang chờ được giới hạn để không phải giải nén toàn bộ archive vào RAM cùng lúc.
+    Nếu archive nằm trên đĩa, worker tự mở file theo đường dẫn thay vì nhận bytes từ process cha.
+    """
+    if workers <= 1 or len(csv_files) <= 1:
+        for idx, csv_file in enumerate(csv_files):
+            yield idx, csv_file, _parse_member_serial(z, csv_file)
+        return
+
+    # 'spawn' an toàn hơn 'fork' trong process Streamlit đa luồng
+    ctx = multiprocessing.get_context('spawn')
+    max_pending = workers * 2
+    zip_path = z.filename if isinstance(z.filename, str) and os.path.isfile(z.filename) else None
+    with ProcessPoolExecutor(max_workers=min(workers, len(csv_files)), mp_context=ctx) as executor:
+        pending = deque()
+        members = iter(enumerate(csv_files))
+
+        def submit_next():
+            for idx, csv_file in members:
+                if zip_path is not None:
+                    pending.append((idx, csv_file, executor.submit(_parse_member_from_path, zip_path, csv_file), None))
+                    return
+                try:
+                    payload = z.read(csv_file)
+                except Exception as e:
+                    pending.append((idx, csv_file, None, (None, None, str(e))))
+                    continue
+                pending.append((idx, csv_file, executor.submit(_parse_member_bytes, payload), None))
+                return
+
+        for _ in range(max_pending):
+            submit_next()
+
+        while pending:
+            idx, csv_file, future, result = pending.popleft()
+            if future is not None:
+                result = future.result()
+            submit_next()
+            yield idx, csv_file, result
@@ -0,0 +1,122 @@
+# === DỰNG BIỂU ĐỒ GIÁ ===
+# Tách khỏi app.py để benchmark (benchmarks/) đo được thời gian dựng figure mà không cần Streamlit.
+# plotly chỉ được import khi dựng biểu đồ đầu tiên, trang chào không phải chờ.
+import numpy as np
+
+from downsampling import lttb_rows, ohlc_downsample, DEFAULT_POINT_BUDGET
+from trading_calendar import chart_rangebreaks
+
+
+def build_stock_figure(stock_data, stock_code, chart_type="Nến Nhật", show_ma=False, ma_period=20,
+                       show_ema=False, ema_period=12, show_bb=False, show_rsi=False, outliers_data=None,
+                       chart_height=700, chart_points=DEFAULT_POINT_BUDGET):
+    """Figure nến/line + volume (+ RSI) cho 1 mã; stock_data đã có sẵn các cột chỉ báo cần vẽ"""
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    
+    rows = 3 if show_rsi else 2
+    row_heights = [0.6, 0.2, 0.2] if show_rsi else [0.7, 0.3]
+    subplot_titles = [f'💹 {stock_code}', '📊 Volume', '📉 RSI'] if show_rsi else [f'💹 {stock_code}', '📊 Volume']
+    
+    fig = make_subplots(rows=rows, cols=1, shared_xaxes=True, vertical_spacing=0.03, subplot_titles=subplot_titles, row_heights=row_heights)
+    
+    # Giảm điểm cho khoảng dài: nến/volume gộp OHLC, đường dùng LTTB (khoảng ngắn giữ nguyên)
+    candle_data = ohlc_downsample(stock_data, chart_points)
+    
+    # Biểu đồ chính
+    if chart_type == "Nến Nhật":
+        fig.add_trace(go.Candlestick(
+            x=candle_data['<DTYYYYMMDD>'],
+            open=candle_data['<Open>'],
+            high=candle_data['<High>'],
+            low=candle_data['<Low>'],
+            close=candle_data['<Close>'],
+            name="Giá",
+            increasing_line_color='#5994ce',
+            decreasing_line_color='#b957ce'
+        ), row=1, col=1)
+    else:
+        line_data = lttb_rows(stock_data, '<Close>', chart_points)
+        fig.add_trace(go.Scatter(
+            x=line_data['<DTYYYYMMDD>'],
+            y=line_data['<Close>'],
+            name="Giá",
+            line=dict(color='#5994ce', width=2.5),
+            fill='tozeroy',
+            fillcolor='rgba(89, 148, 206, 0.1)'
+        ), row=1, col=1)
+    
+    # Outliers
+    if outliers_data is not None and not outliers_data.empty:
+        fig.add_trace(go.Scatter(
+            x=outliers_data['<DTYYYYMMDD>'],
+            y=outliers_data['<Close>'],
+            mode='markers',
+            name='Outliers',
+            marker=dict(color='#ff4444', size=12, symbol='x', line=dict(color='#ffffff', width=2))
+        ), row=1, col=1)
+    
+    # MA
+    if show_ma and 'MA' in stock_data.columns:
+        line_data = lttb_rows(stock_data, 'MA', chart_points)
+        fig.add_trace(go.Scatter(
+            x=line_data['<DTYYYYMMDD>'],
+            y=line_data['MA'],
+            name=f'MA{ma_period}',
+            line=dict(color='#ffa502', width=2.5)
+        ), row=1, col=1)
+    
+    # EMA
+    if show_ema and 'EMA' in stock_data.columns:
+        line_data = lttb_rows(stock_data, 'EMA', chart_points)
+        fig.add_trace(go.Scatter(
+            x=line_data['<DTYYYYMMDD>'],
+            y=line_data['EMA'],
+            name=f'EMA{ema_period}',
+            line=dict(color='#5c58bb', width=2.5)
+        ), row=1, col=1)
+    
+    # Bollinger Bands
+    if show_bb and 'BB_Upper' in stock_data.columns:
+        bb_data = lttb_rows(stock_data, 'BB_MA', chart_points)
+        fig.add_trace(go.Scatter(x=bb_data['<DTYYYYMMDD>'], y=bb_data['BB_Upper'], name='BB Upper', line=dict(color='rgba(185, 87, 206, 0.5)', width=1, dash='dash'), showlegend=False), row=1, col=1)
+        fig.add_trace(go.Scatter(x=bb_data['<DTYYYYMMDD>'], y=bb_data['BB_MA'], name='BB Mid', line=dict(color='rgba(185, 87, 206, 0.8)', width=1.5), showlegend=False), row=1, col=1)
+        fig.add_trace(go.Scatter(x=bb_data['<DTYYYYMMDD>'], y=bb_data['BB_Lower'], name='BB Lower', line=dict(color='rgba(185, 87, 206, 0.5)', width=1, dash='dash'), fill='tonexty', fillcolor='rgba(185, 87, 206, 0.1)', showlegend=False), row=1, col=1)
+    
+    # Volume
+    colors = np.where(candle_data['<Close>'].to_numpy() >= candle_data['<Open>'].to_numpy(), '#5994ce', '#b957ce')
+    fig.add_trace(go.Bar(x=candle_data['<DTYYYYMMDD>'], y=candle_data['<Volume>'], name="Volume", marker_color=colors), row=2, col=1)
+    
+    # RSI
+    if show_rsi and 'RSI' in stock_data.columns:
+        rsi_data = lttb_rows(stock_data, 'RSI', chart_points)
+        fig.add_trace(go.Scatter(x=rsi_data['<DTYYYYMMDD>'], y=rsi_data['RSI'], name="RSI", line=dict(color='#5c58bb', width=2)), row=3, col=1)
+        fig.add_hline(y=70, line_dash="dash", line_color="#b957ce", opacity=0.5, row=3, col=1)
+        fig.add_hline(y=30, line_dash="dash", line_color="#5994ce", opacity=0.5, row=3, col=1)
+    
+    fig.update_layout(
+        xaxis_rangeslider_visible=False,
+        height=chart_height,
+        hovermode='x unified',
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='#ffffff', size=12),
+        showlegend=True,
+        legend=dict(orientation="h", yanchor="bottom", y=1.01, xanchor="right", x=1, bgcolor='rgba(58, 78, 147, 0.8)'),
+        margin=dict(l=10, r=10, t=60, b=10)
+    )
+    
+    for i in range(1, rows + 1):
+        fig.update_xaxes(gridcolor='rgba(92, 88, 187, 0.1)', showgrid=True, zeroline=False, row=i, col=1)
+        fig.update_yaxes(gridcolor='rgba(92, 88, 187, 0.1)', showgrid=True, zeroline=False, row=i, col=1)
+    
+    # === PHẦN SỬA LỖI LỖ TRỐNG (TỰ ĐỘNG CHO CẢ NGÀY LỄ) ===
+    # Bỏ T7-CN theo mẫu, chỉ liệt kê các ngày thường không có dữ liệu (lễ, tạm ngừng giao dịch)
+    fig.update_xaxes(rangebreaks=chart_rangebreaks(stock_data['<DTYYYYMMDD>']))
+    
+    fig.update_yaxes(title_text="Giá (VNĐ)", row=1, col=1)
+    fig.update_yaxes(title_text="Volume", row=2, col=1)
+    if show_rsi:
+        fig.update_yaxes(title_text="RSI", row=3, col=1, range=[0, 100])
+    
+    return fig
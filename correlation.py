@@ -0,0 +1,143 @@
+# === MA TRẬN LỢI SUẤT NGÀY × MÃ VÀ TƯƠNG QUAN THEO KHỐI ===
+# Dạng dài <Ticker>/<DTYYYYMMDD> được chuyển 1 lần thành ma trận dày float32 (ngày × mã) kèm
+# mask phiên hợp lệ. Tương quan / hiệp phương sai tính theo từng cặp trên các phiên cả 2 mã
+# đều có dữ liệu (như DataFrame.corr), nhưng bằng vài phép nhân ma trận trên từng khối cột
+# thay vì pivot + lặp theo cặp, nên ~1.600 × 1.600 mã không cần mảng trung gian cỡ n² × ngày.
+import numpy as np
+import pandas as pd
+
+DEFAULT_BLOCK_SIZE = 256
+DEFAULT_MIN_PERIODS = 30
+
+
+class ReturnsMatrix:
+    """Lợi suất ngày (float32, NaN nếu thiếu) của mọi mã trên trục ngày chung của thị trường.
+
+    Lợi suất của 1 mã ở ngày t chỉ hợp lệ khi mã có giá ở cả ngày t và phiên liền trước của
+    thị trường: phiên bị thiếu không được gộp thành lợi suất nhiều ngày.
+    """
+
+    def __init__(self, dates, tickers, values):
+        self.dates = dates
+        self.tickers = tickers
+        self.values = values
+        self.valid = ~np.isnan(values)
+        self._position = {ticker: i for i, ticker in enumerate(tickers)}
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.valid.nbytes + self.dates.nbytes
+
+    def position(self, ticker):
+        return self._position.get(ticker)
+
+    def last_sessions(self, sessions):
+        """Ma trận chỉ gồm `sessions` ngày cuối (view, không sao chép)"""
+        if sessions is None or sessions >= len(self.dates):
+            return self
+        return ReturnsMatrix(self.dates[-sessions:], self.tickers, self.values[-sessions:])
+
+
+def _date_codes(values):
+    """(các ngày khác nhau đã sắp xếp, chỉ số ngày của từng dòng) bằng bincount theo số ngày, O(n)"""
+    days = values.astype('datetime64[D]').astype(np.int64)
+    first = days.min()
+    present = np.bincount(days - first) > 0
+    codes = np.cumsum(present) - 1
+    return (first + np.flatnonzero(present)).astype('datetime64[D]'), codes[days - first]
+
+
+def returns_matrix(df, ticker_index):
+    """Dựng ReturnsMatrix từ df / ticker_index như market_store.prepare_market_frame"""
+    tickers = list(ticker_index)
+    bounds = np.array(list(ticker_index.values()), dtype=np.int64).reshape(-1, 2)
+    lengths = bounds[:, 1] - bounds[:, 0]
+    if len(tickers) == 0:
+        return ReturnsMatrix(np.array([], dtype='datetime64[D]'), tickers, np.empty((0, 0), dtype=np.float32))
+    columns = np.repeat(np.arange(len(tickers)), lengths)
+    # Các đoạn của chỉ mục nối liền nhau từ dòng 0 (prepare_market_frame) -> dùng thẳng các cột
+    contiguous = bounds[0, 0] == 0 and (bounds[1:, 0] == bounds[:-1, 1]).all() and bounds[-1, 1] == len(df)
+    rows = slice(None) if contiguous else np.concatenate([np.arange(start, stop) for start, stop in bounds])
+
+    dates, date_idx = _date_codes(df['<DTYYYYMMDD>'].to_numpy()[rows])
+    close = np.full((len(dates), len(tickers)), np.nan, dtype=np.float32)
+    close[date_idx, columns] = df['<Close>'].to_numpy(dtype=np.float32)[rows]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        values = close[1:] / close[:-1] - 1
+    values[~np.isfinite(values)] = np.nan
+    return ReturnsMatrix(dates[1:], tickers, values)
+
+
+def _pairwise_sums(x, mask, block):
+    """Các tổng theo cặp (n, Σx, Σy, Σx², Σy², Σxy) giữa mọi cột của x và các cột `block`"""
+    xb = x[:, block]
+    mb = mask[:, block]
+    n = mask.T @ mb
+    sum_x = x.T @ mb
+    sum_y = mask.T @ xb
+    sum_xx = (x * x).T @ mb
+    sum_yy = mask.T @ (xb * xb)
+    sum_xy = x.T @ xb
+    return n, sum_x, sum_y, sum_xx, sum_yy, sum_xy
+
+
+def _prepare(matrix):
+    """x float64, 0 ở phiên thiếu, đã trừ trung bình riêng từng mã (giảm sai số triệt tiêu;
+    tương quan / hiệp phương sai không đổi khi dịch từng biến)"""
+    mask = matrix.valid.astype(np.float64)
+    x = np.nan_to_num(matrix.values.astype(np.float64))
+    counts = mask.sum(axis=0)
+    means = np.divide(x.sum(axis=0), counts, out=np.zeros_like(counts), where=counts > 0)
+    x = (x - means) * mask
+    return x, mask
+
+
+def _block_result(sums, min_periods, kind):
+    n, sum_x, sum_y, sum_xx, sum_yy, sum_xy = sums
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = (sum_xy - sum_x * sum_y / n) / (n - 1)
+        if kind == 'cov':
+            result = cov
+        else:
+            var_x = (sum_xx - sum_x * sum_x / n) / (n - 1)
+            var_y = (sum_yy - sum_y * sum_y / n) / (n - 1)
+            result = np.clip(cov / np.sqrt(var_x * var_y), -1.0, 1.0)
+    result[n < max(min_periods, 2)] = np.nan
+    return result
+
+
+def correlation_matrix(matrix, min_periods=DEFAULT_MIN_PERIODS, block_size=DEFAULT_BLOCK_SIZE, kind='corr'):
+    """Ma trận tương quan (kind='corr') hoặc hiệp phương sai (kind='cov') mã × mã, float32.
+
+    Tính theo khối `block_size` cột: bộ nhớ trung gian ~ 6 × số mã × block_size số float64.
+    Cặp có ít hơn `min_periods` phiên chung -> NaN.
+    """
+    x, mask = _prepare(matrix)
+    n_tickers = x.shape[1]
+    result = np.empty((n_tickers, n_tickers), dtype=np.float32)
+    for start in range(0, n_tickers, block_size):
+        block = slice(start, min(start + block_size, n_tickers))
+        result[:, block] = _block_result(_pairwise_sums(x, mask, block), min_periods, kind)
+    return pd.DataFrame(result, index=matrix.tickers, columns=matrix.tickers)
+
+
+def top_correlated(matrix, ticker, k=10, min_periods=DEFAULT_MIN_PERIODS):
+    """k mã tương quan mạnh nhất với `ticker` (chỉ tính 1 cột, không dựng cả ma trận).
+
+    Trả về DataFrame index = mã, cột: corr, cov, n (số phiên chung); rỗng nếu không có mã.
+    """
+    position = matrix.position(ticker)
+    if position is None:
+        return pd.DataFrame(columns=['corr', 'cov', 'n'])
+    x, mask = _prepare(matrix)
+    sums = _pairwise_sums(x, mask, slice(position, position + 1))
+    corr = _block_result(sums, min_periods, 'corr')[:, 0]
+    cov = _block_result(sums, min_periods, 'cov')[:, 0]
+    n = sums[0][:, 0]
+
+    corr[position] = np.nan
+    candidates = np.flatnonzero(~np.isnan(corr))
+    order = candidates[np.argsort(-corr[candidates], kind='stable')][:k]
+    return pd.DataFrame({'corr': corr[order], 'cov': cov[order], 'n': n[order].astype(np.int64)},
+                        index=pd.Index(np.asarray(matrix.tickers, dtype=object)[order], name='Mã'))
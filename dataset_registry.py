@@ -0,0 +1,142 @@
+# === BỘ DỮ LIỆU THỊ TRƯỜNG DÙNG CHUNG GIỮA CÁC SESSION ===
+# Mỗi bộ dữ liệu đã chuẩn bị (compact + sắp xếp + chỉ mục mã) chỉ có 1 bản trong process, các
+# cột được khóa chỉ đọc. Session chỉ giữ phiên bản (dấu vân tay) và bộ lọc mã, không giữ DataFrame:
+# thêm session không thêm bản sao, 2 session tải cùng dữ liệu dùng chung 1 bộ.
+# Bộ mở từ kho (from_store) là memory-map các file cột: nhiều process Streamlit cùng dùng 1 bản
+# trong page cache của hệ điều hành, process mới mở trong vài ms.
+# Session giữ bộ đang dùng qua 1 DatasetLease (lưu trong session_state): registry không bỏ bộ còn
+# lease sống, lease mất khi session kết thúc hoặc chuyển sang bộ khác.
+import weakref
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from indicator_cache import dataset_fingerprint
+from market_store import STORE_DIR, compact_market_frame, prepare_market_frame, open_snapshot, snapshot_version
+
+# Số bộ dữ liệu giữ cùng lúc (vd. snapshot CafeF + vài danh sách vnstock3 khác nhau)
+DEFAULT_MAX_DATASETS = 4
+
+
+def _read_only_frame(df):
+    """DataFrame dùng chung các mảng cột của df (không sao chép) nhưng không ghi được"""
+    columns = {}
+    for col in df.columns:
+        values = df[col].array if isinstance(df[col].dtype, pd.CategoricalDtype) else df[col].to_numpy()
+        if isinstance(values, np.ndarray):
+            values = values.view()
+            values.flags.writeable = False
+        columns[col] = values
+    return pd.DataFrame(columns, index=df.index, copy=False)
+
+
+class MarketDataset:
+    """Bộ dữ liệu chỉ đọc: df sắp xếp theo (<Ticker>, <DTYYYYMMDD>), ticker_index mã -> (start, stop)"""
+
+    def __init__(self, df, ticker_index, version, source=None):
+        self.df = df
+        self.ticker_index = ticker_index
+        self.version = version
+        self.source = source
+
+    @classmethod
+    def from_frame(cls, df, source=None):
+        df, ticker_index = prepare_market_frame(compact_market_frame(df))
+        return cls(_read_only_frame(df), ticker_index, dataset_fingerprint(df), source)
+
+    @classmethod
+    def from_store(cls, manifest, root=STORE_DIR, source='cafef'):
+        """Memory-map snapshot của kho (không đọc dữ liệu vào RAM, phiên bản lấy từ manifest)"""
+        df, ticker_index = open_snapshot(manifest, root)
+        return cls(_read_only_frame(df), ticker_index, snapshot_version(manifest), source)
+
+    @property
+    def nbytes(self):
+        return int(np.sum(self.df.memory_usage(index=True)))
+
+    def filtered_index(self, tickers=None):
+        """Chỉ mục chỉ gồm các mã của bộ lọc (None: mọi mã), vẫn trỏ vào cùng df"""
+        if not tickers:
+            return self.ticker_index
+        return {t: self.ticker_index[t] for t in tickers if t in self.ticker_index}
+
+
+class DatasetLease:
+    """1 session đang dùng 1 bộ dữ liệu (giữ tham chiếu tới bộ đó)"""
+
+    __slots__ = ('dataset', '__weakref__')
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+
+class DatasetRegistry:
+    """Phiên bản -> MarketDataset, LRU giới hạn số bộ, an toàn khi nhiều session gọi cùng lúc.
+
+    Chỉ bỏ các bộ không còn lease nào sống: khi mọi bộ đều đang được dùng, registry tạm giữ quá
+    max_datasets. on_evict(version) được gọi khi 1 bộ bị bỏ (vd. xóa các chỉ báo đã cache trên nó).
+    """
+
+    def __init__(self, max_datasets=DEFAULT_MAX_DATASETS, on_evict=None):
+        self.max_datasets = max_datasets
+        self.on_evict = on_evict
+        self._datasets = OrderedDict()
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def _in_use(self, version):
+        return len(self._leases.get(version, ())) > 0
+
+    def add(self, dataset):
+        """Đăng ký bộ dữ liệu; nếu đã có bộ cùng phiên bản thì trả về bộ đó (bộ mới bị bỏ)"""
+        with self._lock:
+            existing = self._datasets.get(dataset.version)
+            if existing is not None:
+                self._datasets.move_to_end(dataset.version)
+                return existing
+            self._datasets[dataset.version] = dataset
+            evicted = []
+            # Cũ nhất trước, bỏ qua bộ vừa thêm và các bộ còn session dùng
+            for version in list(self._datasets):
+                if len(self._datasets) <= self.max_datasets:
+                    break
+                if version != dataset.version and not self._in_use(version):
+                    del self._datasets[version]
+                    self._leases.pop(version, None)
+                    evicted.append(version)
+        for version in evicted:
+            if self.on_evict is not None:
+                self.on_evict(version)
+        return dataset
+
+    def lease(self, dataset):
+        """Đăng ký bộ dữ liệu cho 1 session; bộ không bị bỏ chừng nào lease trả về còn được giữ"""
+        while True:
+            dataset = self.add(dataset)
+            lease = DatasetLease(dataset)
+            with self._lock:
+                # Bộ có thể vừa bị add() của luồng khác bỏ giữa 2 lần khóa: đăng ký lại
+                if self._datasets.get(dataset.version) is dataset:
+                    self._leases.setdefault(dataset.version, weakref.WeakSet()).add(lease)
+                    return lease
+
+    def publish(self, df, source=None):
+        """Chuẩn bị df thành bộ chỉ đọc rồi đăng ký"""
+        return self.add(MarketDataset.from_frame(df, source))
+
+    def get(self, version):
+        with self._lock:
+            dataset = self._datasets.get(version)
+            if dataset is not None:
+                self._datasets.move_to_end(version)
+            return dataset
+
+    def stats(self):
+        with self._lock:
+            return {
+                'datasets': len(self._datasets),
+                'in_use': sum(self._in_use(v) for v in self._datasets),
+                'bytes': sum(d.nbytes for d in self._datasets.values()),
+            }
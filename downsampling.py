@@ -0,0 +1,68 @@
+# === GIẢM SỐ ĐIỂM VẼ BIỂU ĐỒ (LTTB / GỘP NẾN OHLC) ===
+# Với khoảng "Tất cả", mỗi trace gửi lên trình duyệt toàn bộ lịch sử (kèm 1 bản trục x riêng).
+# Trên màn hình chỉ có vài nghìn pixel nên giảm về ngân sách điểm trước khi dựng figure:
+# đường (giá, MA, EMA, BB, RSI) dùng Largest-Triangle-Three-Buckets, nến/volume gộp OHLC thật.
+import numpy as np
+import pandas as pd
+
+DEFAULT_POINT_BUDGET = 1500
+
+
+def lttb_indices(y, n_out):
+    """Chỉ số các điểm giữ lại theo LTTB (x là thứ tự phiên, y không chứa NaN)"""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.arange(n, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    every = (n - 2) / (n_out - 2)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        # Chọn điểm trong bucket tạo tam giác lớn nhất với điểm đã chọn trước và trung bình bucket sau
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+def lttb_rows(data, column, n_out=DEFAULT_POINT_BUDGET):
+    """Các dòng của data giữ lại khi giảm đường `column` về tối đa n_out điểm.
+
+    Dòng NaN (vd. đoạn đầu của MA) bị bỏ trước khi chọn. Các cột khác của cùng dòng đi kèm,
+    nên 3 đường Bollinger dùng chung 1 lần chọn theo BB_MA và vùng tô giữa chúng vẫn khớp.
+    """
+    if len(data) <= n_out:
+        return data
+    data = data[data[column].notna()]
+    return data.iloc[lttb_indices(data[column].to_numpy(), n_out)]
+
+
+def ohlc_downsample(data, n_out=DEFAULT_POINT_BUDGET):
+    """Gộp các phiên liên tiếp thành tối đa n_out nến: Open đầu, High max, Low min, Close cuối, Volume tổng"""
+    n = len(data)
+    if n <= n_out:
+        return data
+    starts = np.linspace(0, n, n_out + 1).astype(np.int64)[:-1]
+    stops = np.append(starts[1:], n)
+    opens = data['<Open>'].to_numpy(dtype=np.float64)
+    highs = data['<High>'].to_numpy(dtype=np.float64)
+    lows = data['<Low>'].to_numpy(dtype=np.float64)
+    closes = data['<Close>'].to_numpy(dtype=np.float64)
+    volumes = data['<Volume>'].to_numpy(dtype=np.float64)
+    return pd.DataFrame({
+        '<DTYYYYMMDD>': data['<DTYYYYMMDD>'].to_numpy()[starts],
+        '<Open>': opens[starts],
+        '<High>': np.fmax.reduceat(highs, starts),
+        '<Low>': np.fmin.reduceat(lows, starts),
+        '<Close>': closes[stops - 1],
+        '<Volume>': np.add.reduceat(volumes, starts),
+    })
@@ -0,0 +1,97 @@
+# === CACHE KẾT QUẢ CHỈ BÁO (LRU, DÙNG CHUNG GIỮA CÁC SESSION) ===
+# Khóa = (phiên bản dữ liệu, mã, chỉ báo, tham số, lát cắt). Phiên bản là dấu vân tay của
+# bộ dữ liệu nên khi snapshot CafeF / dữ liệu vnstock3 mới thay thế, khóa cũ không bao giờ
+# trúng nữa và được dọn đi.
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def dataset_fingerprint(df):
+    """Dấu vân tay rẻ (O(n) trên cột số, không hash chuỗi) của bộ dữ liệu thị trường"""
+    if df is None or len(df) == 0:
+        return 'empty'
+    dates = df['<DTYYYYMMDD>'].to_numpy()
+    closes = df['<Close>'].to_numpy(dtype=np.float64)
+    volumes = df['<Volume>'].to_numpy(dtype=np.float64)
+    parts = (
+        len(df),
+        df['<Ticker>'].nunique(),
+        str(dates.min()), str(dates.max()),
+        repr(float(np.nansum(closes))),
+        repr(float(np.nansum(closes * np.arange(1, len(closes) + 1)))),
+        repr(float(np.nansum(volumes))),
+    )
+    return '|'.join(str(p) for p in parts)
+
+
+def _nbytes(value):
+    if isinstance(value, tuple):
+        return sum(_nbytes(v) for v in value)
+    if isinstance(value, (pd.Series, pd.DataFrame)):
+        return int(np.sum(value.memory_usage(index=True)))
+    if isinstance(value, np.ndarray) or hasattr(value, 'nbytes'):
+        # ndarray hoặc đối tượng tự báo kích thước (vd. correlation.ReturnsMatrix)
+        return int(value.nbytes)
+    return 64
+
+
+class IndicatorCache:
+    """LRU giới hạn theo số mục và tổng bytes, an toàn khi nhiều session gọi cùng lúc"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, compute):
+        """Trả về kết quả đã lưu cho key, hoặc gọi compute() rồi lưu lại"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        # Tính ngoài lock để session khác không phải chờ
+        value = compute()
+        size = _nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key][0]
+            if size > self.max_bytes:
+                return value
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+        return value
+
+    def invalidate(self, version=None):
+        """Xóa các mục của 1 phiên bản dữ liệu đã bị thay thế (None: xóa hết)"""
+        with self._lock:
+            for key in [k for k in self._entries if version is None or k[0] == version]:
+                _, size = self._entries.pop(key)
+                self._bytes -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+            }
@@ -0,0 +1,344 @@
+# === CHỈ BÁO KỸ THUẬT ===
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+from pandas.api.indexers import BaseIndexer
+
+
+def calculate_ma(data, period):
+    return data['<Close>'].rolling(window=period).mean()
+
+def calculate_ema(data, period):
+    return data['<Close>'].ewm(span=period, adjust=False).mean()
+
+def calculate_bollinger_bands(data, period=20, std_dev=2):
+    ma = data['<Close>'].rolling(window=period).mean()
+    std = data['<Close>'].rolling(window=period).std()
+    return ma, ma + (std * std_dev), ma - (std * std_dev)
+
+def calculate_rsi(data, period=14):
+    delta = data['<Close>'].diff()
+    gain = (delta.where(delta > 0, 0)).rolling(window=period).mean()
+    loss = (-delta.where(delta < 0, 0)).rolling(window=period).mean()
+    rs = gain / loss
+    return 100 - (100 / (1 + rs))
+
+
+# === TÍNH CHỈ BÁO CHO TOÀN THỊ TRƯỜNG ===
+# Dữ liệu toàn thị trường đã sắp xếp theo (<Ticker>, <DTYYYYMMDD>), mỗi mã là 1 đoạn liên tục.
+# Thay vì lặp Python qua ~1.600 mã, mỗi chỉ báo chạy 1 lượt trên cả cột <Close> với cửa sổ
+# bị cắt tại ranh giới mã. Kernel rolling/ewm của pandas reset trạng thái khi cửa sổ bắt đầu
+# đoạn mới, nên kết quả từng mã trùng khớp chính xác với các hàm calculate_* ở trên.
+
+class TickerWindowIndexer(BaseIndexer):
+    """Cửa sổ trượt `window_size` dòng, không vượt qua dòng đầu tiên của mã hiện tại"""
+
+    def get_window_bounds(self, num_values=0, min_periods=None, center=None, closed=None, step=None):
+        end = np.arange(1, num_values + 1, dtype=np.int64)
+        start = np.maximum(end - self.window_size, self.row_group_start).astype(np.int64)
+        return start, end
+
+
+def ticker_group_keys(df):
+    """Khóa nhóm theo dòng (codes của <Ticker>) cho df đã sắp xếp theo mã"""
+    tickers = df['<Ticker>']
+    if isinstance(tickers.dtype, pd.CategoricalDtype):
+        return tickers.cat.codes.to_numpy()
+    return pd.factorize(tickers.to_numpy())[0]
+
+
+def _row_group_start(keys):
+    """Với mỗi dòng: vị trí dòng đầu tiên của mã chứa nó"""
+    n = len(keys)
+    is_start = np.ones(n, dtype=bool)
+    if n > 1:
+        is_start[1:] = keys[1:] != keys[:-1]
+    starts = np.flatnonzero(is_start)
+    return np.repeat(starts, np.diff(np.append(starts, n)))
+
+
+def _grouped_rolling(series, period, row_group_start):
+    indexer = TickerWindowIndexer(window_size=period, row_group_start=row_group_start)
+    return series.rolling(window=indexer, min_periods=period)
+
+
+def grouped_rolling(series, period, keys):
+    """series.rolling(period) không vượt qua ranh giới mã; keys như ticker_group_keys (series có RangeIndex)"""
+    return _grouped_rolling(series, period, _row_group_start(keys))
+
+
+def compute_market_indicators(df, ma_period=20, ema_period=12, bb_period=20, bb_std=2, rsi_period=14):
+    """Tính MA/EMA/Bollinger/RSI cho mọi mã trong 1 lượt vectorized.
+
+    df phải sắp xếp theo (<Ticker>, <DTYYYYMMDD>) (xem market_store.prepare_market_frame).
+    Trả về DataFrame cùng index với df, các cột: MA, EMA, BB_MA, BB_Upper, BB_Lower, RSI.
+    """
+    close = df['<Close>']
+    keys = ticker_group_keys(df)
+    row_group_start = _row_group_start(keys)
+    first_row = row_group_start == np.arange(len(df))
+
+    result = pd.DataFrame(index=df.index)
+    result['MA'] = _grouped_rolling(close, ma_period, row_group_start).mean()
+
+    ema = close.groupby(keys, sort=False).ewm(span=ema_period, adjust=False).mean()
+    result['EMA'] = ema.to_numpy()
+
+    bb_ma = result['MA'] if bb_period == ma_period else _grouped_rolling(close, bb_period, row_group_start).mean()
+    bb_std_values = _grouped_rolling(close, bb_period, row_group_start).std()
+    result['BB_MA'] = bb_ma
+    result['BB_Upper'] = bb_ma + (bb_std_values * bb_std)
+    result['BB_Lower'] = bb_ma - (bb_std_values * bb_std)
+
+    # diff() không được lấy chênh lệch giữa dòng cuối mã trước và dòng đầu mã sau
+    delta = close.diff()
+    delta[first_row] = np.nan
+    gain = _grouped_rolling(delta.where(delta > 0, 0), rsi_period, row_group_start).mean()
+    loss = _grouped_rolling(-delta.where(delta < 0, 0), rsi_period, row_group_start).mean()
+    rs = gain / loss
+    result['RSI'] = 100 - (100 / (1 + rs))
+    return result
+
+
+# === CHỈ BÁO DẠNG LUỒNG (CẬP NHẬT O(1) MỖI PHIÊN MỚI) ===
+# Mỗi đối tượng giữ trạng thái gọn (cửa sổ `period` giá gần nhất + tổng chạy) nên khi có thêm
+# 1 phiên chỉ cần update() thay vì tính lại rolling/ewm trên toàn bộ lịch sử. Kết quả khớp với
+# calculate_* trong sai số dấu phẩy động. Trạng thái lưu/khôi phục được qua state_dict().
+
+
+class _RunningSum:
+    """Tổng chạy có bù sai số (Kahan), cộng/trừ O(1)"""
+
+    def __init__(self, total=0.0, compensation=0.0):
+        self.total = total
+        self.compensation = compensation
+
+    def add(self, value):
+        y = value - self.compensation
+        t = self.total + y
+        self.compensation = (t - self.total) - y
+        self.total = t
+
+
+class _RollingWindow:
+    """Cửa sổ `period` giá trị gần nhất với tổng và tổng bình phương chạy (bỏ qua NaN như pandas)"""
+
+    def __init__(self, period, values=()):
+        self.period = period
+        self.values = deque(maxlen=period)
+        self.sum = _RunningSum()
+        self.sum_sq = _RunningSum()
+        self.nobs = 0
+        for value in values:
+            self.push(value)
+
+    def push(self, value):
+        if len(self.values) == self.period:
+            old = self.values[0]
+            if old == old:
+                self.sum.add(-old)
+                self.sum_sq.add(-old * old)
+                self.nobs -= 1
+        self.values.append(value)
+        if value == value:
+            self.sum.add(value)
+            self.sum_sq.add(value * value)
+            self.nobs += 1
+
+    def mean(self):
+        if self.nobs < self.period:
+            return math.nan
+        return self.sum.total / self.nobs
+
+    def std(self):
+        if self.nobs < self.period or self.nobs < 2:
+            return math.nan
+        var = (self.sum_sq.total - self.sum.total * self.sum.total / self.nobs) / (self.nobs - 1)
+        return math.sqrt(max(var, 0.0))
+
+
+class StreamingMA:
+    def __init__(self, period):
+        self.period = period
+        self.window = _RollingWindow(period)
+
+    def update(self, close):
+        self.window.push(float(close))
+        return self.window.mean()
+
+    def state_dict(self):
+        return {'period': self.period, 'values': list(self.window.values)}
+
+    @classmethod
+    def from_state(cls, state):
+        obj = cls(state['period'])
+        obj.window = _RollingWindow(state['period'], state['values'])
+        return obj
+
+
+class StreamingEMA:
+    """ewm(span, adjust=False).mean() theo đúng công thức đệ quy của pandas (kể cả NaN)"""
+
+    def __init__(self, period):
+        self.period = period
+        self.alpha = 2.0 / (period + 1.0)
+        self.weighted = math.nan
+        self.old_wt = 1.0
+        self.nobs = 0
+
+    def update(self, close):
+        cur = float(close)
+        is_observation = cur == cur
+        self.nobs += int(is_observation)
+        if self.weighted == self.weighted:
+            self.old_wt *= 1.0 - self.alpha
+            if is_observation:
+                if self.weighted != cur:
+                    self.weighted = (self.old_wt * self.weighted + self.alpha * cur) / (self.old_wt + self.alpha)
+                self.old_wt = 1.0
+        elif is_observation:
+            self.weighted = cur
+        return self.weighted if self.nobs >= 1 else math.nan
+
+    def state_dict(self):
+        return {'period': self.period, 'weighted': self.weighted, 'old_wt': self.old_wt, 'nobs': self.nobs}
+
+    @classmethod
+    def from_state(cls, state):
+        obj = cls(state['period'])
+        obj.weighted = state['weighted']
+        obj.old_wt = state['old_wt']
+        obj.nobs = state['nobs']
+        return obj
+
+
+class StreamingBollinger:
+    """MA ± std_dev * std (ddof=1) từ tổng và tổng bình phương chạy"""
+
+    def __init__(self, period=20, std_dev=2):
+        self.period = period
+        self.std_dev = std_dev
+        self.window = _RollingWindow(period)
+
+    def update(self, close):
+        self.window.push(float(close))
+        ma = self.window.mean()
+        std = self.window.std()
+        return ma, ma + (std * self.std_dev), ma - (std * self.std_dev)
+
+    def state_dict(self):
+        return {'period': self.period, 'std_dev': self.std_dev, 'values': list(self.window.values)}
+
+    @classmethod
+    def from_state(cls, state):
+        obj = cls(state['period'], state['std_dev'])
+        obj.window = _RollingWindow(state['period'], state['values'])
+        return obj
+
+
+class StreamingRSI:
+    def __init__(self, period=14):
+        self.period = period
+        self.prev_close = math.nan
+        self.gains = _RollingWindow(period)
+        self.losses = _RollingWindow(period)
+
+    def update(self, close):
+        close = float(close)
+        delta = close - self.prev_close
+        self.prev_close = close
+        # Giống delta.where(delta > 0, 0): NaN (phiên đầu tiên) tính là 0
+        self.gains.push(delta if delta > 0 else 0.0)
+        self.losses.push(-delta if delta < 0 else 0.0)
+        gain = self.gains.mean()
+        loss = self.losses.mean()
+        if gain != gain or loss != loss or (gain == 0 and loss == 0):
+            return math.nan
+        if loss == 0:
+            return 100.0
+        return 100 - (100 / (1 + gain / loss))
+
+    def state_dict(self):
+        return {'period': self.period, 'prev_close': self.prev_close,
+                'gains': list(self.gains.values), 'losses': list(self.losses.values)}
+
+    @classmethod
+    def from_state(cls, state):
+        obj = cls(state['period'])
+        obj.prev_close = state['prev_close']
+        obj.gains = _RollingWindow(state['period'], state['gains'])
+        obj.losses = _RollingWindow(state['period'], state['losses'])
+        return obj
+
+
+class StreamingIndicatorSet:
+    """Bộ chỉ báo dạng luồng của 1 mã, cùng cột đầu ra với compute_market_indicators"""
+
+    def __init__(self, ma_period=20, ema_period=12, bb_period=20, bb_std=2, rsi_period=14):
+        self.ma = StreamingMA(ma_period)
+        self.ema = StreamingEMA(ema_period)
+        self.bb = StreamingBollinger(bb_period, bb_std)
+        self.rsi = StreamingRSI(rsi_period)
+
+    @property
+    def params(self):
+        return {'ma_period': self.ma.period, 'ema_period': self.ema.period,
+                'bb_period': self.bb.period, 'bb_std': self.bb.std_dev, 'rsi_period': self.rsi.period}
+
+    def update(self, close):
+        bb_ma, bb_upper, bb_lower = self.bb.update(close)
+        return {'MA': self.ma.update(close), 'EMA': self.ema.update(close),
+                'BB_MA': bb_ma, 'BB_Upper': bb_upper, 'BB_Lower': bb_lower,
+                'RSI': self.rsi.update(close)}
+
+    def state_dict(self):
+        return {'ma': self.ma.state_dict(), 'ema': self.ema.state_dict(),
+                'bb': self.bb.state_dict(), 'rsi': self.rsi.state_dict()}
+
+    @classmethod
+    def from_state(cls, state):
+        obj = cls.__new__(cls)
+        obj.ma = StreamingMA.from_state(state['ma'])
+        obj.ema = StreamingEMA.from_state(state['ema'])
+        obj.bb = StreamingBollinger.from_state(state['bb'])
+        obj.rsi = StreamingRSI.from_state(state['rsi'])
+        return obj
+
+
+def seed_indicator_states(df, ticker_index, **params):
+    """Dựng trạng thái luồng cho mọi mã từ df đã sắp xếp theo mã.
+
+    Chỉ phát lại đoạn cuối (đủ dài cho cửa sổ lớn nhất) của mỗi mã; riêng EMA phụ thuộc toàn
+    bộ lịch sử nên lấy giá trị cuối từ lượt tính toàn thị trường.
+    """
+    template = StreamingIndicatorSet(**params)
+    tail = max(template.ma.period, template.bb.period, template.rsi.period + 1)
+    closes = df['<Close>'].to_numpy(dtype=np.float64)
+    ema = None
+    if len(df):
+        ema = df['<Close>'].groupby(ticker_group_keys(df), sort=False).ewm(
+            span=template.ema.period, adjust=False).mean().to_numpy()
+
+    states = {}
+    for ticker, (start, stop) in ticker_index.items():
+        state = StreamingIndicatorSet(**params)
+        for close in closes[max(start, stop - tail):stop]:
+            state.ma.update(close)
+            state.bb.update(close)
+            state.rsi.update(close)
+        state.ema.weighted = float(ema[stop - 1])
+        state.ema.nobs = int(np.count_nonzero(closes[start:stop] == closes[start:stop]))
+        states[ticker] = state
+    return states
+
+
+def advance_indicator_states(states, new_rows, **params):
+    """Cập nhật trạng thái với các phiên mới (new_rows đã sắp xếp theo mã, ngày)"""
+    for ticker, close in zip(new_rows['<Ticker>'].astype(str), new_rows['<Close>'].to_numpy(dtype=np.float64)):
+        state = states.get(ticker)
+        if state is None:
+            state = states[ticker] = StreamingIndicatorSet(**params)
+        state.update(close)
+    return states
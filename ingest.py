@@ -0,0 +1,562 @@
+# === PIPELINE TẢI DỮ LIỆU (KHÔNG PHỤ THUỘC STREAMLIT) ===
+# Tải / giải nén / parse / làm sạch dữ liệu CafeF và vnstock3 rồi ghi vào kho trên đĩa.
+# Không gọi st.* trong file này: thông báo và tiến độ đi qua 1 Reporter, app.py truyền
+# StreamlitReporter, ingest_cli.py (chạy từ cron) truyền ConsoleReporter.
+import os
+import time
+import importlib.util
+import logging
+import zipfile
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from cafef_parser import iter_parsed_members, clean_cafef_frame, PARSE_TIMINGS_ATTR
+from trading_calendar import is_trading_day
+from instrumentation import stage, record, step_recorder
+from vnstock_fetch import fetch_vnstock_history, fetch_many, DEFAULT_MAX_WORKERS, DEFAULT_RATE_PER_SEC
+from market_store import (STORE_DIR, read_manifest, manifest_date, is_snapshot_current, load_snapshot,
+                          save_snapshot, append_snapshot, compact_market_frame)
+
+# Chỉ kiểm tra gói có được cài hay không, không import: vnstock3 nặng nên chỉ được nạp ở lần
+# tải đầu tiên (xem fetch_vnstock_history). requests / cafef_download cũng chỉ nạp khi tải CafeF.
+VNSTOCK_AVAILABLE = importlib.util.find_spec('vnstock3') is not None
+
+# Thư mục giữ file ZIP đã tải từ CafeF (kèm ETag / Last-Modified để tải có điều kiện / tải tiếp)
+CAFEF_DOWNLOAD_DIR = os.environ.get('CAFEF_DOWNLOAD_DIR') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'data', 'cafef_downloads')
+
+# Đổi bằng biến môi trường để trỏ tới mirror / server HTTP giả lập khi thử nghiệm
+CAFEF_BASE_URL = os.environ.get('CAFEF_BASE_URL', "https://cafef1.mediacdn.vn/data/ami_data").rstrip('/')
+# File tích lũy toàn bộ lịch sử và file chỉ chứa 1 phiên giao dịch
+CAFEF_UPTO_URL = CAFEF_BASE_URL + "/{path}/CafeF.SolieuGD.Upto{file}.zip"
+CAFEF_DAILY_URL = CAFEF_BASE_URL + "/{path}/CafeF.SolieuGD.{file}.zip"
+# Kho cũ hơn số ngày này thì tải lại file Upto thay vì cập nhật tăng dần
+MAX_INCREMENTAL_DAYS = 10
+
+# Kho riêng cho danh sách mã tải từ vnstock3 (cùng định dạng với kho CafeF)
+VNSTOCK_STORE_DIR = os.environ.get(
+    'VNSTOCK_STORE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'vnstock_store')
+)
+
+logger = logging.getLogger('ingest')
+
+
+# === REPORTER: NƠI NHẬN THÔNG BÁO / TIẾN ĐỘ ===
+class ProgressHandle:
+    """Thanh tiến độ của 1 bước; mặc định không hiển thị gì"""
+
+    def update(self, fraction, text=None):
+        pass
+
+    def close(self):
+        pass
+
+
+class Reporter:
+    """Reporter im lặng: pipeline chạy được mà không cần hiển thị gì"""
+
+    def info(self, message):
+        pass
+
+    def success(self, message):
+        pass
+
+    def warning(self, message):
+        pass
+
+    def error(self, message):
+        pass
+
+    def exception(self, exc):
+        pass
+
+    def progress(self):
+        return ProgressHandle()
+
+    def celebrate(self):
+        pass
+
+
+class _LogProgress(ProgressHandle):
+    """Ghi log mỗi khi tiến độ vượt thêm `step` (tránh 1 dòng log cho mỗi file / mỗi chunk)"""
+
+    def __init__(self, log, step=0.1):
+        self._log = log
+        self._step = step
+        self._next = step
+
+    def update(self, fraction, text=None):
+        if fraction >= self._next or fraction >= 1.0:
+            self._log(f"[{fraction:4.0%}] {text or ''}".rstrip())
+            while self._next <= fraction:
+                self._next += self._step
+
+
+class ConsoleReporter(Reporter):
+    """Ghi thông báo qua logging (dùng cho ingest_cli.py / cron)"""
+
+    def __init__(self, log=logger):
+        self.log = log
+
+    def info(self, message):
+        self.log.info(message)
+
+    def success(self, message):
+        self.log.info(message)
+
+    def warning(self, message):
+        self.log.warning(message)
+
+    def error(self, message):
+        self.log.error(message)
+
+    def exception(self, exc):
+        self.log.error("Lỗi không mong đợi", exc_info=exc)
+
+    def progress(self):
+        return _LogProgress(self.log.info)
+
+
+def _reporter(reporter):
+    return reporter if reporter is not None else Reporter()
+
+
+# === CAFEF ===
+def process_cafef_zip(zip_content, date_info, workers=1, reporter=None):
+    """Xử lý file ZIP từ CafeF với validation tốt hơn (workers > 1: parse song song)"""
+    reporter = _reporter(reporter)
+    try:
+        with zipfile.ZipFile(zip_content) as z:
+            # Liệt kê tất cả files
+            all_files = z.namelist()
+            reporter.info(f"📦 Tổng số files trong ZIP: {len(all_files)}")
+
+            csv_files = [f for f in all_files if f.lower().endswith('.csv')]
+
+            if not csv_files:
+                reporter.error(f"⚠️ Không tìm thấy file CSV trong archive")
+                reporter.info(f"📁 Files tìm thấy: {', '.join(all_files[:10])}...")
+                return None
+
+            mode_info = f" ({workers} tiến trình)" if workers > 1 else ""
+            reporter.info(f"📂 Tìm thấy {len(csv_files)} file CSV, đang xử lý{mode_info}...")
+
+            all_data = []
+            processed_files = 0
+            error_files = 0
+            parse_timings = {}
+
+            progress = reporter.progress()
+
+            with stage('parse', rows_in=len(csv_files)) as parse_record:
+                for idx, csv_file, (df, raw_columns, error) in iter_parsed_members(z, csv_files, workers):
+                    progress.update((idx + 1) / len(csv_files),
+                                    f"⏳ Đang xử lý file {idx+1}/{len(csv_files)}: {csv_file[:50]}...")
+
+                    if error is not None:
+                        error_files += 1
+                        if idx < 5:  # Chỉ hiển thị lỗi 5 file đầu
+                            reporter.warning(f"⚠️ Lỗi file {csv_file}: {error[:100]}")
+                        continue
+
+                    # Debug: Hiển thị columns của file đầu tiên
+                    if idx == 0 and raw_columns is not None:
+                        reporter.info(f"🔍 Cột trong file mẫu: {', '.join(raw_columns[:10])}")
+
+                    if df is not None:
+                        for step, seconds in df.attrs.pop(PARSE_TIMINGS_ATTR, {}).items():
+                            parse_timings[step] = parse_timings.get(step, 0.0) + seconds
+                        all_data.append(df)
+                        processed_files += 1
+                    else:
+                        error_files += 1
+
+                parse_record.rows_out = sum(len(d) for d in all_data)
+
+            # Tổng thời gian trong các file (cộng dồn qua các tiến trình nếu parse song song)
+            for step, seconds in parse_timings.items():
+                record(f"parse.{step}", seconds, workers=workers)
+
+            progress.close()
+
+            reporter.info(f"📊 Xử lý: {processed_files} thành công, {error_files} lỗi")
+
+            if all_data:
+                reporter.info("🔄 Đang gộp và làm sạch dữ liệu...")
+                with stage('concat', rows_in=len(all_data)) as concat_record:
+                    combined_df = pd.concat(all_data, ignore_index=True)
+                    concat_record.rows_out = len(combined_df)
+
+                reporter.info(f"📦 Tổng bản ghi ban đầu: {len(combined_df):,}")
+
+                # Làm sạch dữ liệu
+                step_labels = {
+                    'dropna': "Sau khi loại NaN",
+                    'ticker': "Sau khi loại ticker rỗng",
+                    'price': "Sau khi loại giá <= 0",
+                    'dedupe': "Sau khi loại trùng",
+                }
+                record_step = step_recorder('clean', len(combined_df))
+
+                def on_clean_step(step, rows):
+                    record_step(step, rows)
+                    if step in step_labels:
+                        reporter.info(f"✓ {step_labels[step]}: {rows:,}")
+
+                combined_df = clean_cafef_frame(combined_df, on_step=on_clean_step)
+
+                unique_tickers = len(combined_df['<Ticker>'].unique())
+                total_records = len(combined_df)
+
+                if total_records > 0:
+                    reporter.success(f"✅ Thành công: {unique_tickers} mã, {total_records:,} bản ghi (ngày {date_info})")
+
+                    # Hiển thị 5 mã đầu tiên
+                    sample_tickers = sorted(combined_df['<Ticker>'].unique())[:5]
+                    reporter.info(f"🔍 Mẫu mã: {', '.join(sample_tickers)}")
+
+                    # Hiển thị date range
+                    min_date = combined_df['<DTYYYYMMDD>'].min()
+                    max_date = combined_df['<DTYYYYMMDD>'].max()
+                    reporter.info(f"📅 Khoảng thời gian: {min_date.strftime('%d/%m/%Y')} - {max_date.strftime('%d/%m/%Y')}")
+
+                    return combined_df
+                else:
+                    reporter.error("❌ Không có dữ liệu sau khi làm sạch")
+                    return None
+            else:
+                reporter.error(f"⚠️ Không có dữ liệu hợp lệ từ {len(csv_files)} files")
+                return None
+
+    except zipfile.BadZipFile:
+        reporter.error("❌ File tải về không phải định dạng ZIP hợp lệ")
+    except Exception as e:
+        reporter.error(f"❌ Lỗi xử lý ZIP: {str(e)}")
+        reporter.exception(e)
+
+    return None
+
+
+def download_and_process_cafef_zip(url, date_info, workers=1, reporter=None):
+    """Tải 1 file ZIP của CafeF vào CAFEF_DOWNLOAD_DIR rồi xử lý. Lỗi mạng được raise cho caller.
+
+    File đã tải được giữ lại: lần sau cùng url chỉ gửi GET có điều kiện, tải dở thì tải tiếp.
+    """
+    from cafef_download import fetch_archive
+
+    reporter = _reporter(reporter)
+    reporter.info("📥 Đang tải dữ liệu...")
+
+    progress = reporter.progress()
+
+    def on_progress(downloaded, total_size):
+        if total_size:
+            progress.update(min(downloaded / total_size, 1.0),
+                            f"⏬ Đã tải: {downloaded/(1024*1024):.1f}/{total_size/(1024*1024):.1f} MB")
+
+    # Ghi thẳng từng chunk xuống đĩa: archive 50-100MB không nằm trong RAM khi tải và giải nén
+    download_start = time.perf_counter()
+    # File được giữ tới hết khối with: lần tải khác (process khác) không dọn nó khi đang xử lý
+    with fetch_archive(url, CAFEF_DOWNLOAD_DIR, on_progress=on_progress) as (zip_path, status, transferred):
+        progress.close()
+        record('download', time.perf_counter() - download_start, bytes=transferred, status=status)
+
+        if status == 'cached':
+            reporter.info("💾 File trên CafeF không đổi, dùng bản đã tải")
+        elif status == 'resumed':
+            reporter.info(f"⏯️ Đã tải tiếp phần còn thiếu ({transferred/(1024*1024):.1f} MB)")
+        reporter.success("✅ Tải thành công! Đang xử lý...")
+
+        # Xử lý file zip (ZipFile đọc trực tiếp từ file, chỉ giải nén từng member khi cần)
+        return process_cafef_zip(zip_path, date_info, workers=workers, reporter=reporter)
+
+
+def _report_probe_result(check_date, result, reporter):
+    """Thông báo kết quả dò 1 ngày (Response hoặc exception từ luồng dò)"""
+    import requests
+
+    if isinstance(result, requests.exceptions.Timeout):
+        reporter.warning(f"⏱️ Timeout khi kiểm tra ngày {check_date.strftime('%d-%m-%Y')}")
+    elif isinstance(result, requests.exceptions.RequestException):
+        reporter.warning(f"🔌 Lỗi kết nối ngày {check_date.strftime('%d-%m-%Y')}: {str(result)[:100]}")
+    else:
+        reporter.info(f"📡 {check_date.strftime('%d-%m-%Y')}: HTTP {result.status_code}")
+
+
+def download_latest_cafef_data(workers=1, after_date=None, reporter=None):
+    """Tự động tìm ngày có dữ liệu gần nhất và tải file ZIP từ CafeF
+
+    after_date: chỉ dò các ngày mới hơn ngày này (ngày của snapshot đã lưu trong kho).
+    """
+    import requests
+    from cafef_download import find_newest_available
+
+    reporter = _reporter(reporter)
+    MAX_DAYS_TO_CHECK = 10
+
+    reporter.info("🔍 Đang tìm dữ liệu CafeF mới nhất...")
+
+    # Danh sách ngày cần dò, từ mới đến cũ
+    candidates = []
+    for i in range(1, MAX_DAYS_TO_CHECK + 1):
+        check_date = datetime.now() - timedelta(days=i)
+        if after_date is not None and check_date.date() <= after_date:
+            break
+        if not is_trading_day(check_date):
+            continue
+        url = CAFEF_UPTO_URL.format(path=check_date.strftime('%Y%m%d'), file=check_date.strftime('%d%m%Y'))
+        candidates.append((check_date, url))
+
+    if not candidates:
+        reporter.info(f"💾 Không có dữ liệu mới hơn ngày {after_date.strftime('%d-%m-%Y')} trong kho")
+        return None
+
+    while candidates:
+        reporter.info(f"🔎 Kiểm tra đồng thời {len(candidates)} ngày: {candidates[-1][0].strftime('%d-%m-%Y')} → {candidates[0][0].strftime('%d-%m-%Y')}...")
+
+        # Dò song song, ngày mới nhất có dữ liệu thắng ngay khi các ngày mới hơn đã trả lời
+        found, probe_results = find_newest_available(candidates)
+        for check_date, url in candidates:
+            if url in probe_results:
+                _report_probe_result(check_date, probe_results[url], reporter)
+
+        if found is None:
+            break
+
+        check_date, url, response = found
+        # Nếu xử lý thất bại thì thử tiếp các ngày cũ hơn
+        candidates = [c for c in candidates if c[0] < check_date]
+
+        reporter.success(f"✅ Tìm thấy dữ liệu ngày: {check_date.strftime('%d-%m-%Y')}")
+
+        # Hiển thị thông tin file
+        if 'content-length' in response.headers:
+            file_size = int(response.headers['content-length']) / (1024 * 1024)
+            reporter.info(f"📦 Kích thước file: {file_size:.2f} MB")
+
+        try:
+            # Tải và xử lý file zip
+            result = download_and_process_cafef_zip(url, check_date.strftime('%d-%m-%Y'), workers=workers,
+                                                    reporter=reporter)
+        except requests.exceptions.Timeout:
+            reporter.warning(f"⏱️ Timeout khi tải dữ liệu ngày {check_date.strftime('%d-%m-%Y')}")
+            continue
+        except requests.exceptions.RequestException as e:
+            reporter.warning(f"🔌 Lỗi kết nối ngày {check_date.strftime('%d-%m-%Y')}: {str(e)[:100]}")
+            continue
+        except Exception as e:
+            reporter.error(f"❌ Lỗi không xác định: {str(e)}")
+            continue
+
+        if result is not None:
+            # Lưu snapshot xuống kho để lần khởi động sau không phải tải lại
+            try:
+                with stage('save_snapshot', rows_in=len(result)):
+                    save_snapshot(result, check_date, source_url=url)
+                reporter.info("💾 Đã lưu dữ liệu vào kho trên đĩa")
+            except Exception as e:
+                reporter.warning(f"⚠️ Không lưu được kho dữ liệu: {str(e)[:100]}")
+            reporter.celebrate()
+            return result
+        else:
+            reporter.error("❌ Xử lý file thất bại, thử ngày khác...")
+
+    if after_date is not None:
+        reporter.info(f"💾 Không có dữ liệu mới hơn ngày {after_date.strftime('%d-%m-%Y')} trên CafeF")
+        return None
+    reporter.error(f"❌ Không tìm thấy dữ liệu trong vòng {MAX_DAYS_TO_CHECK} ngày qua")
+    reporter.info("💡 Gợi ý: Thử sử dụng vnstock3 API hoặc tăng MAX_DAYS_TO_CHECK")
+    return None
+
+
+def update_cafef_incremental(manifest, reporter=None):
+    """Cập nhật tăng dần: chỉ tải file 1 phiên (CafeF.SolieuGD.{ddmmyyyy}.zip) của các ngày
+    sau snapshot đã lưu rồi chèn vào kho. Chỉ chèn các phiên liên tiếp ngay sau snapshot: dừng ở
+    phiên đầu tiên không tải được. Trả về DataFrame đã cập nhật, hoặc None nếu không có phiên mới
+    hoặc còn phiên mới hơn sau chỗ thiếu (caller sẽ quay về tải file Upto để lấp khoảng trống).
+    """
+    import requests
+    from cafef_download import head_many
+
+    reporter = _reporter(reporter)
+    stored_date = manifest_date(manifest)
+    gap_days = (datetime.now().date() - stored_date).days
+    if gap_days > MAX_INCREMENTAL_DAYS:
+        reporter.info(f"💾 Kho đã cũ {gap_days} ngày, tải lại toàn bộ thay vì cập nhật tăng dần")
+        return None
+
+    reporter.info(f"🔁 Cập nhật tăng dần từ ngày {stored_date.strftime('%d-%m-%Y')}...")
+
+    new_frames = []
+    last_date = None
+    last_url = None
+
+    # Dò song song tất cả các ngày sau snapshot
+    candidates = []
+    for i in range(gap_days - 1, 0, -1):
+        check_date = datetime.now() - timedelta(days=i)
+        if not is_trading_day(check_date):
+            continue
+        url = CAFEF_DAILY_URL.format(path=check_date.strftime('%Y%m%d'), file=check_date.strftime('%d%m%Y'))
+        candidates.append((check_date, url))
+    probe_results = head_many([url for _, url in candidates])
+
+    def available(url):
+        response = probe_results[url]
+        return isinstance(response, requests.Response) and response.status_code == 200
+
+    # Đi từ ngày cũ đến ngày mới, dừng ở phiên đầu tiên thiếu / lỗi để không nhảy cóc qua phiên đó
+    missing_idx = None
+    for idx, (check_date, url) in enumerate(candidates):
+        response = probe_results[url]
+        df = None
+        if isinstance(response, Exception):
+            _report_probe_result(check_date, response, reporter)
+        elif response.status_code != 200:
+            reporter.warning(f"⚠️ Không có file phiên {check_date.strftime('%d-%m-%Y')} (HTTP {response.status_code})")
+        else:
+            reporter.info(f"✅ Có dữ liệu phiên {check_date.strftime('%d-%m-%Y')}")
+            try:
+                # File 1 phiên chỉ vài CSV nhỏ: parse tuần tự, không dựng process pool
+                df = download_and_process_cafef_zip(url, check_date.strftime('%d-%m-%Y'), workers=1,
+                                                    reporter=reporter)
+            except requests.exceptions.RequestException as e:
+                reporter.warning(f"🔌 Lỗi kết nối ngày {check_date.strftime('%d-%m-%Y')}: {str(e)[:100]}")
+            except Exception as e:
+                reporter.error(f"❌ Lỗi không xác định ngày {check_date.strftime('%d-%m-%Y')}: {str(e)[:100]}")
+
+        if df is None:
+            missing_idx = idx
+            break
+        new_frames.append(df)
+        last_date = check_date
+        last_url = url
+
+    merged = None
+    if new_frames:
+        new_rows = pd.concat(new_frames, ignore_index=True)
+        with stage('append_snapshot', rows_in=len(new_rows)) as append_record:
+            merged, added = append_snapshot(new_rows, last_date, source_url=last_url)
+            append_record.rows_out = added
+        reporter.success(f"✅ Cập nhật tăng dần: +{added:,} bản ghi (đến ngày {last_date.strftime('%d-%m-%Y')})")
+
+    if missing_idx is not None and any(available(url) for _, url in candidates[missing_idx + 1:]):
+        missing_date = candidates[missing_idx][0]
+        reporter.info(f"🔄 Thiếu phiên {missing_date.strftime('%d-%m-%Y')} nhưng đã có phiên mới hơn, tải file Upto để lấp khoảng trống")
+        return None
+    return merged
+
+
+def load_cafef_market(workers=1, reporter=None):
+    """Dữ liệu toàn thị trường mới nhất: đọc kho nếu đã có phiên mới nhất, nếu không thì
+    cập nhật tăng dần hoặc tải lại file Upto từ CafeF (kết quả luôn được ghi vào kho)"""
+    reporter = _reporter(reporter)
+    manifest = read_manifest()
+    stored_date = manifest_date(manifest) if manifest is not None else None
+
+    # Kho đã có snapshot mới nhất -> đọc từ đĩa, bỏ qua hoàn toàn bước dò mạng
+    if manifest is not None and is_snapshot_current(manifest):
+        reporter.info(f"💾 Đọc dữ liệu ngày {stored_date.strftime('%d-%m-%Y')} từ kho ({manifest['tickers']} mã, {manifest['rows']:,} bản ghi)")
+        with stage('load_snapshot') as load_record:
+            df = load_snapshot(manifest, mmap=True)
+            load_record.rows_out = len(df)
+        return df
+
+    # Kho đã có dữ liệu -> chỉ tải các phiên mới và chèn vào kho
+    if manifest is not None:
+        df = update_cafef_incremental(manifest, reporter=reporter)
+        if df is not None:
+            return df
+        # Có thể đã chèn được vài phiên trước chỗ thiếu: file Upto chỉ cần mới hơn kho hiện tại
+        manifest = read_manifest()
+        stored_date = manifest_date(manifest)
+
+    df = download_latest_cafef_data(workers=workers, after_date=stored_date, reporter=reporter)
+    if df is None and manifest is not None:
+        reporter.info(f"💾 Dùng dữ liệu đã lưu ngày {stored_date.strftime('%d-%m-%Y')}")
+        return load_snapshot(manifest, mmap=True)
+    return compact_market_frame(df) if df is not None else None
+
+
+def load_current_store(root=STORE_DIR):
+    """Snapshot trong kho nếu đã là phiên mới nhất (do ingest_cli.py dựng sẵn), ngược lại None.
+    Các cột là memory-map chỉ đọc."""
+    manifest = read_manifest(root)
+    if manifest is None or not is_snapshot_current(manifest):
+        return None
+    with stage('load_snapshot') as load_record:
+        df = load_snapshot(manifest, root, mmap=True)
+        load_record.rows_out = len(df)
+    return df
+
+
+# === VNSTOCK3 ===
+def fetch_vnstock_single(symbol, days_back=365, reporter=None):
+    """Tải 1 mã từ vnstock3 API"""
+    if not VNSTOCK_AVAILABLE:
+        return None
+
+    try:
+        return fetch_vnstock_history(symbol, days_back)
+    except Exception as e:
+        _reporter(reporter).error(f"❌ Lỗi vnstock3 cho {symbol}: {str(e)}")
+    return None
+
+
+def _load_vnstock_store(symbols, root):
+    """Các mã cần tải lấy từ kho vnstock3 nếu kho có phiên mới nhất và đủ mọi mã"""
+    df = load_current_store(root)
+    if df is None or not set(symbols) <= set(df['<Ticker>'].cat.categories):
+        return None
+    return df[df['<Ticker>'].isin(symbols)].reset_index(drop=True)
+
+
+def fetch_vnstock_market(symbols, days_back=365, max_workers=DEFAULT_MAX_WORKERS, rate=DEFAULT_RATE_PER_SEC,
+                         reporter=None, store_root=None):
+    """Tải nhiều mã song song (giới hạn tốc độ bằng token bucket, thử lại khi lỗi)
+
+    store_root: đọc từ kho vnstock3 (do ingest_cli.py dựng sẵn) trước khi gọi API.
+    """
+    reporter = _reporter(reporter)
+    if not VNSTOCK_AVAILABLE or not symbols:
+        return None
+
+    if store_root is not None:
+        df = _load_vnstock_store(symbols, store_root)
+        if df is not None:
+            reporter.info(f"💾 Đọc {len(symbols)} mã từ kho vnstock3")
+            return df
+
+    all_data = []
+    failed = {}
+    progress = reporter.progress()
+
+    results = fetch_many(symbols, lambda symbol: fetch_vnstock_history(symbol, days_back),
+                         max_workers=max_workers, rate=rate)
+    with stage('fetch', rows_in=len(symbols)) as fetch_record:
+        for done, (symbol, df, error) in enumerate(results, start=1):
+            progress.update(done / len(symbols), f"⏳ Đã tải {done}/{len(symbols)} mã (vừa xong: {symbol})...")
+            if error is not None:
+                failed[symbol] = error
+            elif df is not None:
+                all_data.append(df)
+        fetch_record.rows_out = sum(len(d) for d in all_data)
+
+    progress.close()
+
+    if failed:
+        reporter.warning(f"⚠️ Lỗi {len(failed)} mã: " + ", ".join(f"{s} ({str(e)[:40]})" for s, e in list(failed.items())[:10]))
+
+    if all_data:
+        combined_df = pd.concat(all_data, ignore_index=True)
+        reporter.success(f"✅ Tải thành công {len(all_data)}/{len(symbols)} mã!")
+        return combined_df
+    return None
+
+
+def save_vnstock_store(df, root=VNSTOCK_STORE_DIR):
+    """Ghi danh sách mã đã tải vào kho vnstock3, ngày snapshot = phiên mới nhất trong dữ liệu"""
+    with stage('save_snapshot', rows_in=len(df)):
+        return save_snapshot(df, df['<DTYYYYMMDD>'].max().date(), root=root)
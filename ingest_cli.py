@@ -0,0 +1,97 @@
+# === TẢI DỮ LIỆU KHÔNG CẦN STREAMLIT (CHẠY TỪ CRON) ===
+# Chạy cùng pipeline với nút tải trong app rồi ghi kết quả vào kho trên đĩa; app chỉ việc đọc kho.
+#   python ingest_cli.py cafef --workers 4
+#   python ingest_cli.py vnstock FPT VNM HPG --days 730
+# Thư mục kho: biến môi trường MARKET_STORE_DIR (CafeF) / VNSTOCK_STORE_DIR (vnstock3).
+# Mã thoát khác 0 khi không tải được dữ liệu.
+import sys
+import logging
+import argparse
+
+from cafef_parser import DEFAULT_PARSE_WORKERS
+from vnstock_fetch import DEFAULT_MAX_WORKERS, DEFAULT_RATE_PER_SEC
+from instrumentation import start_trace, stage
+from ingest import (ConsoleReporter, VNSTOCK_AVAILABLE, load_cafef_market, download_latest_cafef_data,
+                    fetch_vnstock_market, save_vnstock_store)
+
+
+def run_cafef(args, reporter):
+    if args.force:
+        # Bỏ qua kho hiện có, tải lại file Upto mới nhất
+        df = download_latest_cafef_data(workers=args.workers, reporter=reporter)
+    else:
+        df = load_cafef_market(workers=args.workers, reporter=reporter)
+    if df is None or df.empty:
+        reporter.error("❌ Không tải được dữ liệu CafeF")
+        return 1
+    reporter.success(f"💾 Kho CafeF: {df['<Ticker>'].nunique()} mã, {len(df):,} bản ghi")
+    return 0
+
+
+def _read_symbols(args):
+    symbols = list(args.symbols)
+    if args.file:
+        with open(args.file, encoding='utf-8') as f:
+            symbols += f.read().replace('\n', ',').split(',')
+    return list(dict.fromkeys(s.strip().upper() for s in symbols if s.strip()))
+
+
+def run_vnstock(args, reporter):
+    if not VNSTOCK_AVAILABLE:
+        reporter.error("❌ vnstock3 chưa cài đặt")
+        return 1
+    symbols = _read_symbols(args)
+    if not symbols:
+        reporter.error("❌ Danh sách mã trống")
+        return 1
+    df = fetch_vnstock_market(symbols, days_back=args.days, max_workers=args.max_workers, rate=args.rate,
+                              reporter=reporter)
+    if df is None or df.empty:
+        reporter.error("❌ Không tải được dữ liệu vnstock3")
+        return 1
+    manifest = save_vnstock_store(df)
+    reporter.success(f"💾 Kho vnstock3 ngày {manifest['date']}: {manifest['tickers']} mã, {manifest['rows']:,} bản ghi")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tải dữ liệu CafeF / vnstock3 và ghi vào kho trên đĩa")
+    parser.add_argument('--trace-json', help="Ghi thời gian từng bước ra file JSON")
+    parser.add_argument('--metrics', help="Ghi thời gian từng bước ra file text Prometheus (node_exporter textfile)")
+    parser.add_argument('--track-memory', action='store_true', help="Đo đỉnh bộ nhớ từng bước bằng tracemalloc")
+    parser.add_argument('-q', '--quiet', action='store_true', help="Chỉ in cảnh báo và lỗi")
+    subparsers = parser.add_subparsers(dest='source', required=True)
+
+    cafef = subparsers.add_parser('cafef', help="Toàn thị trường từ CafeF")
+    cafef.add_argument('--workers', type=int, default=DEFAULT_PARSE_WORKERS, help="Số tiến trình parse CSV")
+    cafef.add_argument('--force', action='store_true', help="Tải lại file Upto dù kho đã có phiên mới nhất")
+    cafef.set_defaults(run=run_cafef)
+
+    vnstock = subparsers.add_parser('vnstock', help="Danh sách mã từ vnstock3")
+    vnstock.add_argument('symbols', nargs='*', help="Các mã cổ phiếu")
+    vnstock.add_argument('--file', help="File danh sách mã (cách nhau bởi dấu phẩy hoặc xuống dòng)")
+    vnstock.add_argument('--days', type=int, default=365, help="Số ngày lịch sử")
+    vnstock.add_argument('--max-workers', type=int, default=DEFAULT_MAX_WORKERS, help="Số request đồng thời")
+    vnstock.add_argument('--rate', type=float, default=DEFAULT_RATE_PER_SEC, help="Giới hạn request/giây")
+    vnstock.set_defaults(run=run_vnstock)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    reporter = ConsoleReporter()
+
+    with start_trace(f"ingest_{args.source}", track_memory=args.track_memory) as trace:
+        with stage('total'):
+            code = args.run(args, reporter)
+
+    if args.trace_json:
+        with open(args.trace_json, 'w', encoding='utf-8') as f:
+            f.write(trace.to_json())
+    if args.metrics:
+        with open(args.metrics, 'w', encoding='utf-8') as f:
+            f.write(trace.to_prometheus())
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+# === ĐO THỜI GIAN / BỘ NHỚ THEO TỪNG BƯỚC (TẢI → INGEST → HIỂN THỊ) ===
+# Mỗi lượt chạy là 1 PipelineTrace; các hàm bên trong chỉ cần `with stage('tên', rows_in=...)`
+# mà không phải truyền trace qua tham số (trace hiện tại nằm trong contextvar của luồng).
+# Khi không có trace nào đang chạy, stage() không làm gì.
+import sys
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROMETHEUS_PREFIX = 'vnstock_pipeline'
+
+_current_trace = ContextVar('pipeline_trace', default=None)
+
+
+def _rss_peak_mb():
+    """Đỉnh RSS của process tới thời điểm hiện tại (MB), None nếu hệ điều hành không hỗ trợ"""
+    if resource is None:
+        return None
+    # Đơn vị của ru_maxrss tùy hệ điều hành: Linux là KB, macOS là byte
+    if sys.platform.startswith('linux'):
+        unit = 1024
+    elif sys.platform == 'darwin':
+        unit = 1
+    else:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / (1024 * 1024)
+
+
+class StageRecord:
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.seconds = None
+        self.offset = None
+        self.rss_peak_mb = None
+        self.py_peak_mb = None
+        self.extra = {}
+
+    def to_dict(self):
+        record = {
+            'stage': self.name,
+            'seconds': self.seconds,
+            'offset': self.offset,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'rss_peak_mb': self.rss_peak_mb,
+            'py_peak_mb': self.py_peak_mb,
+        }
+        record.update(self.extra)
+        return record
+
+
+class PipelineTrace:
+    """Danh sách các bước đã đo của 1 lượt chạy.
+
+    track_memory=True bật tracemalloc để có đỉnh bộ nhớ Python/numpy riêng từng bước
+    (chậm hơn đáng kể); mặc định chỉ ghi đỉnh RSS của cả process sau mỗi bước.
+    """
+
+    def __init__(self, name, track_memory=False):
+        self.name = name
+        self.track_memory = track_memory
+        self.created_at = datetime.now().isoformat(timespec='seconds')
+        self.stages = []
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        record = StageRecord(name, rows_in)
+        if self.track_memory and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.seconds = time.perf_counter() - start
+            record.offset = start - self._start
+            record.rss_peak_mb = _rss_peak_mb()
+            if self.track_memory and tracemalloc.is_tracing():
+                record.py_peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            self.stages.append(record)
+
+    def record(self, name, seconds, rows_in=None, rows_out=None, **extra):
+        """Ghi 1 bước đã đo ở nơi khác (vd. tổng thời gian trong các process con)"""
+        record = StageRecord(name, rows_in)
+        record.rows_out = rows_out
+        record.seconds = seconds
+        record.extra.update(extra)
+        self.stages.append(record)
+        return record
+
+    def step_recorder(self, prefix, rows_in):
+        """Callback on_step(tên bước, số dòng) cho các hàm báo tiến độ theo bước (vd. clean_cafef_frame):
+        mỗi lần gọi ghi 1 bước từ lần gọi trước đến nay"""
+        state = {'last': time.perf_counter(), 'rows': rows_in}
+
+        def on_step(step, rows):
+            now = time.perf_counter()
+            record = self.record(f"{prefix}.{step}", now - state['last'], rows_in=state['rows'], rows_out=rows)
+            record.offset = state['last'] - self._start
+            record.rss_peak_mb = _rss_peak_mb()
+            state['last'] = now
+            state['rows'] = rows
+        return on_step
+
+    @property
+    def total_seconds(self):
+        return time.perf_counter() - self._start
+
+    def to_dict(self):
+        return {
+            'trace': self.name,
+            'created_at': self.created_at,
+            'stages': [s.to_dict() for s in self.stages],
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self):
+        """Định dạng text của Prometheus (gauge theo nhãn trace/stage)"""
+        metrics = [
+            ('stage_seconds', 'Thời gian chạy của bước (giây)', lambda s: s.seconds),
+            ('stage_rows_in', 'Số dòng vào bước', lambda s: s.rows_in),
+            ('stage_rows_out', 'Số dòng ra khỏi bước', lambda s: s.rows_out),
+            ('stage_rss_peak_bytes', 'Đỉnh RSS của process sau bước', lambda s: s.rss_peak_mb and s.rss_peak_mb * 1024 * 1024),
+            ('stage_py_peak_bytes', 'Đỉnh bộ nhớ tracemalloc trong bước', lambda s: s.py_peak_mb and s.py_peak_mb * 1024 * 1024),
+        ]
+        lines = []
+        for metric, help_text, getter in metrics:
+            name = f"{PROMETHEUS_PREFIX}_{metric}"
+            samples = [(s.name, getter(s)) for s in self.stages if getter(s) is not None]
+            if not samples:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for stage_name, value in samples:
+                lines.append(f'{name}{{trace="{self.name}",stage="{stage_name}"}} {float(value):.6g}')
+        return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def start_trace(name, track_memory=False):
+    """Bắt đầu 1 trace và đặt nó làm trace hiện tại cho mọi stage() bên trong"""
+    trace = PipelineTrace(name, track_memory)
+    started_tracemalloc = track_memory and not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        if started_tracemalloc:
+            tracemalloc.stop()
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """Đo 1 bước vào trace hiện tại; đặt record.rows_out bên trong khối with nếu cần"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield StageRecord(name, rows_in)
+        return
+    with trace.stage(name, rows_in) as record:
+        yield record
+
+
+def record(name, seconds, rows_in=None, rows_out=None, **extra):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(name, seconds, rows_in, rows_out, **extra)
+
+
+def step_recorder(prefix, rows_in):
+    """Như PipelineTrace.step_recorder cho trace hiện tại (callback rỗng nếu không có trace)"""
+    trace = _current_trace.get()
+    if trace is None:
+        return lambda step, rows: None
+    return trace.step_recorder(prefix, rows_in)
@@ -0,0 +1,395 @@
+# === KHO DỮ LIỆU THỊ TRƯỜNG TRÊN ĐĨA ===
+# Mỗi snapshot (theo ngày giao dịch) là 1 thư mục, mỗi cột lưu thành 1 file .npy riêng.
+# manifest.json ở thư mục gốc trỏ tới snapshot mới nhất để app không cần tải lại CafeF
+# sau mỗi lần restart / deploy / hết hạn cache.
+# Snapshot đã sắp xếp sẵn theo (<Ticker>, <DTYYYYMMDD>) kèm chỉ mục mã, nên open_snapshot chỉ cần
+# memory-map các file cột (chỉ đọc): mọi process mở cùng snapshot dùng chung page cache của hệ điều
+# hành thay vì mỗi process 1 bản trong RAM. Snapshot không bao giờ bị ghi đè tại chỗ (ghi thư mục
+# mới rồi đổi manifest), nên process đang map snapshot cũ vẫn đọc được cho tới khi mở snapshot mới.
+import os
+import json
+import shutil
+from datetime import datetime, date
+
+import numpy as np
+import pandas as pd
+
+import trading_calendar
+from indicators import StreamingIndicatorSet, seed_indicator_states, advance_indicator_states
+
+STORE_DIR = os.environ.get(
+    'MARKET_STORE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'market_store')
+)
+MANIFEST_FILE = 'manifest.json'
+# Số snapshot cũ giữ lại trên đĩa (ngoài snapshot hiện tại)
+KEEP_OLD_SNAPSHOTS = 1
+
+STORE_COLUMNS = ['<Ticker>', '<DTYYYYMMDD>', '<Open>', '<High>', '<Low>', '<Close>', '<Volume>']
+PRICE_COLUMNS = ['<Open>', '<High>', '<Low>', '<Close>']
+# <Ticker> lưu dạng mã hóa từ điển: codes (int) + danh sách mã
+TICKER_CODES_FILE = 'Ticker.codes.npy'
+TICKER_CATEGORIES_FILE = 'Ticker.categories.npy'
+# (start, stop) của từng mã theo thứ tự categories (start == stop: mã không có dòng nào)
+TICKER_BOUNDS_FILE = 'Ticker.bounds.npy'
+# Trạng thái chỉ báo dạng luồng (tham số mặc định), lưu cùng snapshot
+INDICATOR_STATE_FILE = 'indicator_state.json'
+
+
+def _column_file(col):
+    """'<Close>' -> 'Close.npy'"""
+    return col.strip('<>') + '.npy'
+
+
+def _as_date(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _to_column_array(series):
+    if series.name == '<DTYYYYMMDD>':
+        return series.to_numpy(dtype='datetime64[ns]')
+    values = series.to_numpy()
+    if values.dtype == object:
+        values = pd.to_numeric(series, errors='coerce').to_numpy()
+    return values
+
+
+def _compact_volume(series):
+    """<Volume> -> số nguyên không dấu nhỏ nhất đủ chứa (giữ nguyên nếu có NaN / số âm / số lẻ)"""
+    values = series.to_numpy()
+    if not np.issubdtype(values.dtype, np.number) or len(values) == 0:
+        return series
+    if np.issubdtype(values.dtype, np.floating):
+        if np.isnan(values).any() or (values != np.floor(values)).any():
+            return series
+    if values.min() < 0:
+        return series
+    dtype = np.uint32 if values.max() <= np.iinfo(np.uint32).max else np.uint64
+    return series.astype(dtype, copy=False)
+
+
+def compact_market_frame(df):
+    """Chuyển df về dạng gọn trong RAM mà các hàm chỉ báo / outlier / biểu đồ vẫn dùng nguyên vẹn.
+
+    <Ticker> -> categorical (categories đã sắp xếp nên thứ tự codes trùng thứ tự chữ cái),
+    giá -> float32, <Volume> -> uint32/uint64. <DTYYYYMMDD> giữ datetime64 vì pandas không có
+    đơn vị ngày.
+    """
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if col == '<Ticker>':
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                series = series.astype('category')
+            if not series.cat.categories.is_monotonic_increasing:
+                series = series.cat.reorder_categories(series.cat.categories.sort_values())
+        elif col in PRICE_COLUMNS and pd.api.types.is_numeric_dtype(series):
+            series = series.astype(np.float32, copy=False)
+        elif col == '<Volume>':
+            series = _compact_volume(series)
+        columns[col] = series
+    return pd.DataFrame(columns, index=df.index, copy=False)
+
+
+def _ticker_codes(series):
+    """Khóa số nguyên của cột <Ticker> (codes nếu là categorical) để so sánh nhanh"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy()
+    return series.to_numpy()
+
+
+def _write_json_atomic(path, payload):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_manifest(root=STORE_DIR):
+    """Đọc manifest của kho. Trả về None nếu chưa có snapshot nào hoặc manifest hỏng."""
+    path = os.path.join(root, MANIFEST_FILE)
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not os.path.isdir(os.path.join(root, manifest.get('snapshot', ''))):
+        return None
+    return manifest
+
+
+def manifest_date(manifest):
+    """Ngày giao dịch của snapshot (datetime.date)"""
+    return datetime.strptime(manifest['date'], '%Y-%m-%d').date()
+
+
+def save_snapshot(df, trading_date, source_url=None, root=STORE_DIR):
+    """Ghi DataFrame đã làm sạch thành snapshot mới và cập nhật manifest.
+
+    Snapshot được ghi vào thư mục tạm rồi đổi tên, manifest được thay thế nguyên tử,
+    nên process khác đang đọc kho không bao giờ thấy snapshot ghi dở.
+    """
+    trading_date = _as_date(trading_date)
+    snapshot = trading_date.strftime('%Y%m%d')
+    os.makedirs(root, exist_ok=True)
+
+    final_dir = os.path.join(root, snapshot)
+    tmp_dir = os.path.join(root, f".{snapshot}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    df, _ = prepare_market_frame(compact_market_frame(df[STORE_COLUMNS]))
+    tickers = df['<Ticker>'].cat
+    codes = tickers.codes.to_numpy()
+    np.save(os.path.join(tmp_dir, TICKER_CODES_FILE), codes, allow_pickle=False)
+    np.save(os.path.join(tmp_dir, TICKER_CATEGORIES_FILE), tickers.categories.to_numpy(dtype=str), allow_pickle=False)
+    positions = np.arange(len(tickers.categories))
+    bounds = np.stack([np.searchsorted(codes, positions, side='left'),
+                       np.searchsorted(codes, positions, side='right')], axis=1).astype(np.int64)
+    np.save(os.path.join(tmp_dir, TICKER_BOUNDS_FILE), bounds, allow_pickle=False)
+    dtypes = {'<Ticker>': 'category'}
+    for col in STORE_COLUMNS[1:]:
+        values = _to_column_array(df[col])
+        np.save(os.path.join(tmp_dir, _column_file(col)), values, allow_pickle=False)
+        dtypes[col] = str(values.dtype)
+
+    if os.path.isdir(final_dir):
+        old_dir = os.path.join(root, f".{snapshot}.old-{os.getpid()}")
+        os.replace(final_dir, old_dir)
+        os.replace(tmp_dir, final_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+    else:
+        os.replace(tmp_dir, final_dir)
+
+    manifest = {
+        'snapshot': snapshot,
+        'date': trading_date.isoformat(),
+        'source_url': source_url,
+        'rows': int(len(df)),
+        'tickers': int(len(tickers.categories)),
+        'columns': dtypes,
+        'created_at': datetime.now().isoformat(timespec='milliseconds'),
+    }
+    _write_json_atomic(os.path.join(root, MANIFEST_FILE), manifest)
+    _prune_snapshots(root, keep=snapshot)
+    return manifest
+
+
+def _prune_snapshots(root, keep):
+    snapshots = sorted(
+        name for name in os.listdir(root)
+        if name.isdigit() and os.path.isdir(os.path.join(root, name)) and name != keep
+    )
+    for name in snapshots[:max(0, len(snapshots) - KEEP_OLD_SNAPSHOTS)]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def _load_columns(snapshot_dir, mmap_mode):
+    columns = {}
+    codes_path = os.path.join(snapshot_dir, TICKER_CODES_FILE)
+    if os.path.exists(codes_path):
+        categories = np.load(os.path.join(snapshot_dir, TICKER_CATEGORIES_FILE), allow_pickle=False)
+        codes = np.load(codes_path, mmap_mode=mmap_mode, allow_pickle=False)
+        # codes đã đúng kiểu int nhỏ nhất pandas chọn cho số categories nên không bị sao chép
+        columns['<Ticker>'] = pd.Categorical.from_codes(codes, dtype=pd.CategoricalDtype(categories))
+    else:
+        # Snapshot định dạng cũ: <Ticker> lưu dạng chuỗi
+        columns['<Ticker>'] = np.load(os.path.join(snapshot_dir, _column_file('<Ticker>')), allow_pickle=False)
+    for col in STORE_COLUMNS[1:]:
+        columns[col] = np.load(os.path.join(snapshot_dir, _column_file(col)), mmap_mode=mmap_mode, allow_pickle=False)
+    return columns
+
+
+def load_snapshot(manifest=None, root=STORE_DIR, mmap=False):
+    """Đọc snapshot (mặc định: snapshot trong manifest) thành DataFrame. None nếu kho trống.
+
+    mmap=True: các cột số là memory-map chỉ đọc của file .npy (không đọc cả file vào RAM).
+    """
+    if manifest is None:
+        manifest = read_manifest(root)
+        if manifest is None:
+            return None
+    columns = _load_columns(os.path.join(root, manifest['snapshot']), 'r' if mmap else None)
+    return compact_market_frame(pd.DataFrame(columns, copy=False))
+
+
+def open_snapshot(manifest=None, root=STORE_DIR):
+    """Memory-map snapshot thành (df, ticker_index) sẵn sàng dùng, không sao chép và không quét dữ liệu.
+
+    Snapshot định dạng cũ (chưa có chỉ mục mã) được kiểm tra / sắp xếp như prepare_market_frame.
+    Trả về None nếu kho trống.
+    """
+    if manifest is None:
+        manifest = read_manifest(root)
+        if manifest is None:
+            return None
+    snapshot_dir = os.path.join(root, manifest['snapshot'])
+    bounds_path = os.path.join(snapshot_dir, TICKER_BOUNDS_FILE)
+    if not os.path.exists(bounds_path):
+        return prepare_market_frame(load_snapshot(manifest, root, mmap=True))
+    columns = _load_columns(snapshot_dir, 'r')
+    df = pd.DataFrame(columns, copy=False)
+    bounds = np.load(bounds_path, allow_pickle=False)
+    categories = columns['<Ticker>'].categories
+    ticker_index = {str(name): (int(start), int(stop))
+                    for name, (start, stop) in zip(categories, bounds) if stop > start}
+    return df, ticker_index
+
+
+def snapshot_version(manifest):
+    """Định danh của 1 snapshot: đổi mỗi khi manifest trỏ tới snapshot mới (kể cả ghi lại cùng ngày)"""
+    return f"store:{manifest['snapshot']}:{manifest.get('created_at')}"
+
+
+def is_snapshot_current(manifest, today=None):
+    """Snapshot đã là phiên mới nhất mà CafeF có thể có thì không cần dò mạng: không có phiên giao dịch
+    nào từ sau ngày snapshot tới trước hôm nay (snapshot thứ 6 vẫn mới vào T7, CN, T2 và qua Tết)."""
+    today = today or date.today()
+    start = np.datetime64(manifest_date(manifest), 'D') + 1
+    end = np.datetime64(today, 'D')
+    return start >= end or int(np.busday_count(start, end, busdaycal=trading_calendar.CALENDAR)) == 0
+
+
+def _rows_to_insert(base, new):
+    """Các dòng mới thực sự cần chèn (đã sắp xếp, bỏ trùng) và vị trí chèn trong base"""
+    new = new[STORE_COLUMNS].sort_values(['<Ticker>', '<DTYYYYMMDD>'], kind='mergesort')
+    new = new.drop_duplicates(subset=['<Ticker>', '<DTYYYYMMDD>'], keep='last')
+    if len(base) == 0:
+        return np.zeros(len(new), dtype=np.intp), new
+
+    base_tickers = base['<Ticker>'].to_numpy()
+    new_tickers = new['<Ticker>'].to_numpy()
+    positions = np.searchsorted(base_tickers, new_tickers, side='right')
+
+    # Ngày cuối cùng của mỗi mã trong base nằm ngay trước vị trí chèn
+    prev = np.maximum(positions - 1, 0)
+    has_prev = (positions > 0) & (base_tickers[prev] == new_tickers)
+    last_dates = base['<DTYYYYMMDD>'].to_numpy()[prev]
+    keep = ~has_prev | (new['<DTYYYYMMDD>'].to_numpy() > last_dates)
+    return positions[keep], new[keep]
+
+
+def merge_new_rows(base, new):
+    """Chèn các phiên mới vào base (đã sắp xếp theo <Ticker>, <DTYYYYMMDD>) mà không sort lại toàn bộ.
+
+    Mỗi dòng mới được chèn vào cuối đoạn của mã tương ứng (hoặc đúng vị trí theo thứ tự
+    alphabet nếu là mã mới). Dòng có ngày <= ngày cuối cùng của mã trong base bị bỏ qua
+    nên (<Ticker>, <DTYYYYMMDD>) vẫn duy nhất. Trả về (DataFrame đã gộp, số dòng thêm vào).
+    """
+    positions, new = _rows_to_insert(base, new)
+    return _insert_rows(base, positions, new)
+
+
+def _insert_rows(base, positions, new):
+    if len(base) == 0:
+        return new.reset_index(drop=True), len(new)
+    if len(new) == 0:
+        return base, 0
+
+    merged = {}
+    for col in STORE_COLUMNS:
+        base_values = base[col].to_numpy()
+        new_values = new[col].to_numpy()
+        dtype = np.result_type(base_values, new_values)
+        merged[col] = np.insert(base_values.astype(dtype, copy=False), positions, new_values.astype(dtype, copy=False))
+    return compact_market_frame(pd.DataFrame(merged)), len(new)
+
+
+def append_snapshot(new_df, trading_date, source_url=None, root=STORE_DIR):
+    """Cập nhật tăng dần: gộp các phiên mới vào snapshot hiện tại và ghi thành snapshot ngày mới.
+
+    Trả về (DataFrame đã gộp, số dòng thêm vào), hoặc (None, 0) nếu kho chưa có snapshot.
+    """
+    manifest = read_manifest(root)
+    if manifest is None:
+        return None, 0
+    base = load_snapshot(manifest, root)
+    positions, inserted = _rows_to_insert(base, new_df)
+    merged, added = _insert_rows(base, positions, inserted)
+    if added > 0 or manifest_date(manifest) < _as_date(trading_date):
+        states = load_indicator_states(manifest, root)
+        if states is None:
+            states = seed_indicator_states(base, build_ticker_index(base))
+        new_manifest = save_snapshot(merged, trading_date, source_url=source_url, root=root)
+        save_indicator_states(advance_indicator_states(states, inserted), new_manifest, root)
+    return merged, added
+
+
+def save_indicator_states(states, manifest=None, root=STORE_DIR):
+    """Ghi trạng thái chỉ báo dạng luồng (dict mã -> StreamingIndicatorSet) vào thư mục snapshot"""
+    if manifest is None:
+        manifest = read_manifest(root)
+        if manifest is None:
+            return
+    payload = {
+        'date': manifest['date'],
+        'params': StreamingIndicatorSet().params,
+        'tickers': {ticker: state.state_dict() for ticker, state in states.items()},
+    }
+    _write_json_atomic(os.path.join(root, manifest['snapshot'], INDICATOR_STATE_FILE), payload)
+
+
+def load_indicator_states(manifest=None, root=STORE_DIR):
+    """Khôi phục trạng thái chỉ báo của snapshot. None nếu chưa có, hỏng hoặc khác tham số."""
+    if manifest is None:
+        manifest = read_manifest(root)
+        if manifest is None:
+            return None
+    path = os.path.join(root, manifest['snapshot'], INDICATOR_STATE_FILE)
+    try:
+        with open(path, encoding='utf-8') as f:
+            payload = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if payload.get('date') != manifest['date'] or payload.get('params') != StreamingIndicatorSet().params:
+        return None
+    return {ticker: StreamingIndicatorSet.from_state(state) for ticker, state in payload['tickers'].items()}
+
+
+def build_ticker_index(df):
+    """Chỉ mục mã -> (start, stop) cho df đã sắp xếp theo (<Ticker>, <DTYYYYMMDD>) với RangeIndex.
+
+    Mỗi mã là 1 đoạn liên tục nên lấy dữ liệu 1 mã chỉ là df.iloc[start:stop],
+    không phải so sánh chuỗi trên toàn bộ cột.
+    """
+    keys = _ticker_codes(df['<Ticker>'])
+    if len(keys) == 0:
+        return {}
+    boundaries = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+    starts = np.concatenate(([0], boundaries))
+    stops = np.concatenate((boundaries, [len(keys)]))
+    names = df['<Ticker>'].iloc[starts].astype(str).to_numpy()
+    return {name: (int(start), int(stop)) for name, start, stop in zip(names, starts, stops)}
+
+
+def prepare_market_frame(df):
+    """Đảm bảo df sắp xếp theo (<Ticker>, <DTYYYYMMDD>) với RangeIndex rồi dựng chỉ mục mã.
+
+    Dữ liệu từ CafeF / kho đã đúng thứ tự nên chỉ kiểm tra (O(n) một lần), không sort lại.
+    Trả về (df, ticker_index).
+    """
+    keys = _ticker_codes(df['<Ticker>'])
+    dates = df['<DTYYYYMMDD>'].to_numpy()
+    same_ticker = keys[1:] == keys[:-1]
+    is_sorted = bool((keys[1:] >= keys[:-1]).all()) and not (same_ticker & (dates[1:] < dates[:-1])).any()
+    if not is_sorted:
+        df = df.sort_values(['<Ticker>', '<DTYYYYMMDD>'], kind='mergesort')
+    if not isinstance(df.index, pd.RangeIndex) or df.index.start != 0 or df.index.step != 1:
+        df = df.reset_index(drop=True)
+    return df, build_ticker_index(df)
+
+
+def tail_rows(df, ticker_index, sessions):
+    """`sessions` phiên cuối của mọi mã trong 1 DataFrame (vẫn sắp xếp theo mã, ngày; RangeIndex)
+    kèm số dòng của từng mã theo thứ tự ticker_index"""
+    bounds = np.array(list(ticker_index.values()), dtype=np.int64).reshape(-1, 2)
+    lengths = np.minimum(bounds[:, 1] - bounds[:, 0], sessions)
+    offsets = np.cumsum(lengths) - lengths
+    positions = np.repeat(bounds[:, 1] - lengths - offsets, lengths) + np.arange(lengths.sum())
+    return df.iloc[positions].reset_index(drop=True), lengths
+
+
+def slice_ticker(df, ticker_index, ticker):
+    """Dữ liệu của 1 mã (đã sắp xếp theo ngày) dưới dạng lát cắt liên tục."""
+    start, stop = ticker_index.get(ticker, (0, 0))
+    return df.iloc[start:stop]
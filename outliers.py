@@ -0,0 +1,135 @@
+# === XỬ LÝ OUTLIERS ===
+import numpy as np
+import pandas as pd
+
+from indicators import grouped_rolling, ticker_group_keys
+from market_store import tail_rows
+
+# Cửa sổ mặc định (số phiên) của chế độ trượt
+DEFAULT_ROLLING_WINDOW = 60
+# Cột ảo: % thay đổi giá so với phiên trước của cùng mã
+RETURN_COLUMN = 'Return'
+
+
+def detect_outliers_iqr(data, column, multiplier=1.5):
+    Q1 = data[column].quantile(0.25)
+    Q3 = data[column].quantile(0.75)
+    IQR = Q3 - Q1
+    lower = Q1 - multiplier * IQR
+    upper = Q3 + multiplier * IQR
+    return data[(data[column] < lower) | (data[column] > upper)], lower, upper
+
+def detect_outliers_zscore(data, column, threshold=3):
+    z_scores = np.abs((data[column] - data[column].mean()) / data[column].std())
+    return data[z_scores > threshold]
+
+def remove_outliers(data, column, method='iqr', window=None, **kwargs):
+    """Bỏ outliers theo ngưỡng toàn lịch sử, hoặc theo ngưỡng trượt nếu có `window`"""
+    if window is not None:
+        bounds = rolling_outlier_bounds(data, column, method, window, **kwargs)
+        is_outlier = _outside(data[column].to_numpy(dtype=np.float64), bounds)
+        return data[~is_outlier], data[is_outlier]
+    if method == 'iqr':
+        outliers, lower, upper = detect_outliers_iqr(data, column, **kwargs)
+        cleaned = data[(data[column] >= lower) & (data[column] <= upper)]
+    else:
+        outliers = detect_outliers_zscore(data, column, **kwargs)
+        cleaned = data[~data.index.isin(outliers.index)]
+    return cleaned, outliers
+
+
+# === OUTLIERS THEO CỬA SỔ TRƯỢT ===
+# Ngưỡng của mỗi phiên chỉ tính từ `window` phiên liền trước của cùng mã (không gồm chính nó):
+# xu hướng dài hạn không kéo lệch ngưỡng, và 1 phiên bất thường không tự nới ngưỡng của nó.
+# Tứ phân vị trượt dùng rolling.quantile của pandas (cửa sổ sắp xếp cập nhật dần), trung bình /
+# độ lệch chuẩn dùng tổng chạy, cùng cửa sổ cắt tại ranh giới mã như indicators.compute_market_indicators.
+
+def _previous_session(values, keys):
+    """Giá trị của phiên liền trước cùng mã (NaN ở phiên đầu tiên của mỗi mã)"""
+    shifted = np.empty(len(values), dtype=np.float64)
+    shifted[:1] = np.nan
+    shifted[1:] = values[:-1]
+    if len(keys) > 1:
+        shifted[1:][keys[1:] != keys[:-1]] = np.nan
+    return shifted
+
+
+def _rolling_frame(values, keys, method, window, multiplier=1.5, threshold=3):
+    """lower / upper / score cho từng dòng từ `window` phiên trước đó (NaN khi chưa đủ phiên).
+
+    score: độ lệch chuẩn hóa của phiên so với cửa sổ - z-score (method='zscore') hoặc
+    (giá trị - trung vị) / IQR (method='iqr').
+    """
+    rolling = grouped_rolling(pd.Series(values), window, keys)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if method == 'iqr':
+            q1 = _previous_session(rolling.quantile(0.25).to_numpy(), keys)
+            q3 = _previous_session(rolling.quantile(0.75).to_numpy(), keys)
+            median = _previous_session(rolling.median().to_numpy(), keys)
+            iqr = q3 - q1
+            lower = q1 - multiplier * iqr
+            upper = q3 + multiplier * iqr
+            score = (values - median) / iqr
+        else:
+            mean = _previous_session(rolling.mean().to_numpy(), keys)
+            std = _previous_session(rolling.std().to_numpy(), keys)
+            lower = mean - threshold * std
+            upper = mean + threshold * std
+            score = (values - mean) / std
+    return pd.DataFrame({'lower': lower, 'upper': upper, 'score': score})
+
+
+def _outside(values, bounds):
+    with np.errstate(invalid='ignore'):
+        return (values < bounds['lower'].to_numpy()) | (values > bounds['upper'].to_numpy())
+
+
+def rolling_outlier_bounds(data, column, method='iqr', window=DEFAULT_ROLLING_WINDOW, multiplier=1.5, threshold=3):
+    """Ngưỡng trượt của 1 mã (data sắp xếp theo ngày): DataFrame cùng index, cột lower/upper/score"""
+    values = data[column].to_numpy(dtype=np.float64)
+    bounds = _rolling_frame(values, np.zeros(len(values), dtype=np.int64), method, window, multiplier, threshold)
+    bounds.index = data.index
+    return bounds
+
+
+def detect_outliers_rolling(data, column, method='iqr', window=DEFAULT_ROLLING_WINDOW, **kwargs):
+    """Như detect_outliers_iqr / detect_outliers_zscore nhưng ngưỡng trượt. Trả về (outliers, bounds)."""
+    bounds = rolling_outlier_bounds(data, column, method, window, **kwargs)
+    return data[_outside(data[column].to_numpy(dtype=np.float64), bounds)], bounds
+
+
+def market_anomalies(df, ticker_index, column='<Close>', method='iqr', window=DEFAULT_ROLLING_WINDOW,
+                     multiplier=1.5, threshold=3, latest_session_only=True):
+    """Các mã có phiên cuối nằm ngoài ngưỡng trượt của chính nó, tính cho mọi mã trong 1 lượt.
+
+    Chỉ dùng `window` + 2 phiên cuối của mỗi mã. column: cột của df hoặc RETURN_COLUMN
+    (% thay đổi giá). Trả về DataFrame index = mã, cột Date/value/lower/upper/score,
+    sắp theo |score| giảm dần.
+    """
+    columns = ['Date', 'value', 'lower', 'upper', 'score']
+    if not ticker_index:
+        return pd.DataFrame(columns=columns)
+    recent, lengths = tail_rows(df, ticker_index, window + 2)
+    keys = ticker_group_keys(recent)
+    if column == RETURN_COLUMN:
+        close = recent['<Close>'].to_numpy(dtype=np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = (close / _previous_session(close, keys) - 1) * 100
+    else:
+        values = recent[column].to_numpy(dtype=np.float64)
+
+    bounds = _rolling_frame(values, keys, method, window, multiplier, threshold)
+    last = np.cumsum(lengths)[lengths > 0] - 1
+    table = pd.DataFrame({
+        'Date': recent['<DTYYYYMMDD>'].to_numpy()[last],
+        'value': values[last],
+        'lower': bounds['lower'].to_numpy()[last],
+        'upper': bounds['upper'].to_numpy()[last],
+        'score': bounds['score'].to_numpy()[last],
+    }, index=pd.Index(np.asarray(list(ticker_index), dtype=object)[lengths > 0], name='Mã'))
+
+    mask = _outside(table['value'].to_numpy(), table)
+    if latest_session_only:
+        mask &= (table['Date'] == table['Date'].max()).to_numpy()
+    table = table[mask]
+    return table.iloc[np.argsort(-np.abs(table['score'].to_numpy()), kind='stable')]
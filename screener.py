@@ -0,0 +1,159 @@
+# === BỘ LỌC TOÀN THỊ TRƯỜNG ===
+# Dựng 1 lần ma trận chỉ báo của phiên cuối (và phiên liền trước, cho điều kiện "cắt lên /
+# cắt xuống") cho mọi mã, rồi đánh giá điều kiện bằng phép so sánh numpy trên cả cột:
+# không lặp theo mã, ~1.600 mã chỉ là vài mảng 1.600 phần tử.
+import operator
+
+import numpy as np
+import pandas as pd
+
+from indicators import compute_market_indicators
+from market_store import tail_rows
+
+# Cột dùng được trong điều kiện -> nhãn hiển thị
+FIELDS = {
+    'Close': 'Giá đóng',
+    'Open': 'Giá mở',
+    'High': 'Giá cao',
+    'Low': 'Giá thấp',
+    'ChangePct': '% thay đổi',
+    'Volume': 'Khối lượng',
+    'VolAvg': 'KL trung bình',
+    'MA': 'MA',
+    'EMA': 'EMA',
+    'BB_MA': 'BB giữa',
+    'BB_Upper': 'BB trên',
+    'BB_Lower': 'BB dưới',
+    'RSI': 'RSI',
+}
+
+CROSS_ABOVE = 'cắt lên'
+CROSS_BELOW = 'cắt xuống'
+COMPARISONS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+OPERATORS = list(COMPARISONS) + [CROSS_ABOVE, CROSS_BELOW]
+
+# Điều kiện: (cột, toán tử, vế phải, hệ số). Vế phải là tên cột (nhân với hệ số) hoặc 1 số.
+PRESETS = {
+    'RSI quá bán + khối lượng đột biến': [('RSI', '<', 30, 1.0), ('Volume', '>', 'VolAvg', 2.0)],
+    'Giá cắt lên MA': [('Close', CROSS_ABOVE, 'MA', 1.0)],
+    'Giá cắt xuống MA': [('Close', CROSS_BELOW, 'MA', 1.0)],
+    'RSI quá mua': [('RSI', '>', 70, 1.0)],
+    'Giá dưới dải Bollinger dưới': [('Close', '<', 'BB_Lower', 1.0)],
+    'Giá trên dải Bollinger trên': [('Close', '>', 'BB_Upper', 1.0)],
+}
+
+# EMA (adjust=False) phụ thuộc toàn bộ lịch sử nhưng trọng số của giá cũ giảm theo cấp số nhân:
+# sau 20 lần span phiên, phần sai khác so với tính trên toàn lịch sử đã nhỏ hơn 1e-7 (tương đối)
+EMA_WARMUP_SPANS = 20
+
+
+def _rolling_mean_at(values, ends, seg_starts, period):
+    """Trung bình `period` giá trị kết thúc (không gồm) tại ends, NaN nếu đoạn của mã ngắn hơn"""
+    cumsum = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    enough = ends - seg_starts >= period
+    begins = np.where(enough, ends - period, 0)
+    return np.where(enough, (cumsum[ends] - cumsum[begins]) / period, np.nan)
+
+
+def latest_indicator_matrix(df, ticker_index, ma_period=20, ema_period=12, bb_period=20, bb_std=2,
+                            rsi_period=14, volume_period=20):
+    """Giá trị chỉ báo của phiên cuối và phiên liền trước cho mọi mã.
+
+    df / ticker_index như market_store.prepare_market_frame. Chỉ tính trên đoạn cuối đủ dài của
+    mỗi mã (MA/BB/RSI chính xác, EMA đã hội tụ) thay vì toàn bộ lịch sử.
+    Trả về (latest, previous): DataFrame index = mã, cột FIELDS + 'Date'.
+    """
+    tickers = np.array(list(ticker_index), dtype=object)
+    tail = max(ma_period, bb_period, rsi_period + 1, volume_period) + 1 + EMA_WARMUP_SPANS * ema_period
+    recent, lengths = tail_rows(df, ticker_index, tail)
+    indicators = compute_market_indicators(recent, ma_period, ema_period, bb_period, bb_std, rsi_period)
+
+    seg_stops = np.cumsum(lengths)
+    seg_starts = seg_stops - lengths
+    volume = recent['<Volume>'].to_numpy(dtype=np.float64)
+    close = recent['<Close>'].to_numpy(dtype=np.float64)
+
+    columns = {
+        'Date': recent['<DTYYYYMMDD>'].to_numpy(),
+        'Close': close,
+        'Open': recent['<Open>'].to_numpy(dtype=np.float64),
+        'High': recent['<High>'].to_numpy(dtype=np.float64),
+        'Low': recent['<Low>'].to_numpy(dtype=np.float64),
+        'Volume': volume,
+    }
+    for col in ['MA', 'EMA', 'BB_MA', 'BB_Upper', 'BB_Lower', 'RSI']:
+        columns[col] = indicators[col].to_numpy(dtype=np.float64)
+
+    def frame_at(rows, valid):
+        """Dòng `rows` của mỗi mã (NaN / NaT với mã không có dòng đó)"""
+        safe = np.where(valid, rows, 0)
+        data = {}
+        for col, values in columns.items():
+            taken = values[safe]
+            if col == 'Date':
+                taken = np.where(valid, taken, np.datetime64('NaT'))
+            else:
+                taken = np.where(valid, taken, np.nan)
+            data[col] = taken
+        ends = np.where(valid, rows + 1, seg_starts)
+        data['VolAvg'] = _rolling_mean_at(volume, ends, seg_starts, volume_period)
+        prev_close = close[np.maximum(safe - 1, 0)]
+        has_prev = valid & (rows > seg_starts)
+        data['ChangePct'] = np.where(has_prev, (data['Close'] - prev_close) / prev_close * 100, np.nan)
+        return pd.DataFrame(data, index=pd.Index(tickers, name='Mã'))
+
+    latest = frame_at(seg_stops - 1, lengths > 0)
+    previous = frame_at(seg_stops - 2, lengths > 1)
+    return latest, previous
+
+
+def _operand(frame, operand, factor):
+    if isinstance(operand, str):
+        if operand in FIELDS:
+            return frame[operand].to_numpy() * factor
+        operand = operand.strip().replace(',', '.')
+    try:
+        return float(operand)
+    except (TypeError, ValueError):
+        raise ValueError(f"Vế phải không hợp lệ: {operand!r} (cần số hoặc 1 trong {', '.join(FIELDS)})")
+
+
+def evaluate_conditions(latest, previous, conditions):
+    """Mask bool theo mã: mọi điều kiện (AND) đều đúng. So sánh với NaN luôn sai."""
+    mask = np.ones(len(latest), dtype=bool)
+    for field, op, operand, factor in conditions:
+        if field not in FIELDS:
+            raise ValueError(f"Cột không hợp lệ: {field!r}")
+        factor = 1.0 if factor is None or pd.isna(factor) else float(factor)
+        left = latest[field].to_numpy()
+        right = _operand(latest, operand, factor)
+        with np.errstate(invalid='ignore'):
+            if op in COMPARISONS:
+                mask &= COMPARISONS[op](left, right)
+            elif op in (CROSS_ABOVE, CROSS_BELOW):
+                prev_left = previous[field].to_numpy()
+                prev_right = _operand(previous, operand, factor)
+                if op == CROSS_ABOVE:
+                    mask &= (prev_left <= prev_right) & (left > right)
+                else:
+                    mask &= (prev_left >= prev_right) & (left < right)
+            else:
+                raise ValueError(f"Toán tử không hợp lệ: {op!r}")
+    return mask
+
+
+def run_screen(latest, previous, conditions, latest_session_only=True):
+    """Các mã thỏa mọi điều kiện (dòng của `latest`), sắp theo % thay đổi giảm dần.
+
+    latest_session_only: bỏ các mã không có giao dịch ở phiên mới nhất của thị trường
+    (tạm ngừng / hủy niêm yết) để không lọc trên dữ liệu cũ.
+    """
+    mask = evaluate_conditions(latest, previous, conditions)
+    if latest_session_only and len(latest):
+        mask &= (latest['Date'] == latest['Date'].max()).to_numpy()
+    return latest[mask].sort_values('ChangePct', ascending=False)
@@ -0,0 +1,252 @@
+# === KIỂM THỬ TẢI FILE CAFEF VỚI SERVER HTTP GIẢ LẬP ===
+# Server chạy trên luồng phụ, hỗ trợ ETag / Last-Modified, GET có điều kiện, Range / If-Range
+# và cắt kết nối giữa chừng. Chạy: python -m pytest tests
+import io
+import os
+import json
+import sys
+import time
+import random
+import socket
+import hashlib
+import zipfile
+import threading
+import email.utils
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cafef_download import download_archive, fetch_archive, IncompleteDownload, _download_paths  # noqa: E402
+
+SEND_CHUNK = 64 * 1024
+
+
+class StandIn:
+    """Trạng thái của server giả lập (body hiện tại, các request đã nhận)"""
+
+    def __init__(self):
+        self.requests = []
+        self.drop_after = None      # cắt kết nối sau N byte của body (1 lần)
+        self.chunk_delay = 0.0      # nghỉ giữa các chunk để các lần gọi đồng thời chồng lên nhau
+        self.set_body(b'')
+
+    def set_body(self, body):
+        self.body = body
+        self.etag = '"%s"' % hashlib.md5(body).hexdigest()
+        self.last_modified = email.utils.formatdate(time.time(), usegmt=True)
+
+    def gets(self):
+        return [headers for method, headers in self.requests if method == 'GET']
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _validators(self, state):
+        self.send_header('ETag', state.etag)
+        self.send_header('Last-Modified', state.last_modified)
+        self.send_header('Accept-Ranges', 'bytes')
+
+    def do_GET(self):
+        state = self.server.state
+        state.requests.append(('GET', dict(self.headers)))
+        body = state.body
+        if self.headers.get('If-None-Match') == state.etag:
+            self.send_response(304)
+            self._validators(state)
+            self.end_headers()
+            return
+
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header and self.headers.get('If-Range', state.etag) in (state.etag, state.last_modified):
+            start = int(range_header.split('=')[1].split('-')[0])
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{len(body)}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        self._validators(state)
+        self.send_header('Content-Length', str(len(body) - start))
+        self.end_headers()
+
+        stop = len(body)
+        drop = state.drop_after is not None and state.drop_after > start
+        if drop:
+            stop = state.drop_after
+            state.drop_after = None
+        for pos in range(start, stop, SEND_CHUNK):
+            self.wfile.write(body[pos:min(pos + SEND_CHUNK, stop)])
+            if state.chunk_delay:
+                time.sleep(state.chunk_delay)
+        if drop:
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+
+
+def make_zip(n_members=4, member_size=256 * 1024, seed=0):
+    rng = random.Random(seed)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as z:
+        for i in range(n_members):
+            z.writestr(f"{i}.csv", rng.randbytes(member_size))
+    return buf.getvalue()
+
+
+@pytest.fixture
+def server():
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    srv.state = StandIn()
+    srv.state.set_body(make_zip())
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def url(server):
+    return f"http://127.0.0.1:{server.server_port}/data/CafeF.SolieuGD.Upto16102026.zip"
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_second_call_reuses_archive_on_304(server, url, tmp_path):
+    path, status, transferred = download_archive(url, str(tmp_path))
+    assert status == 'downloaded'
+    assert transferred == len(server.state.body)
+    assert read(path) == server.state.body
+
+    path, status, transferred = download_archive(url, str(tmp_path))
+    assert status == 'cached'
+    assert transferred == 0
+    assert server.state.gets()[-1].get('If-None-Match') == server.state.etag
+
+
+def test_resume_after_dropped_connection(server, url, tmp_path):
+    body = server.state.body
+    server.state.drop_after = len(body) // 3
+
+    # Lần gọi đầu không được tải tiếp: phần tải dở được giữ lại
+    with pytest.raises(IncompleteDownload):
+        download_archive(url, str(tmp_path), max_resumes=0)
+    _, part_path, _, _ = _download_paths(url, str(tmp_path))
+    assert os.path.getsize(part_path) == len(body) // 3
+
+    path, status, transferred = download_archive(url, str(tmp_path))
+    assert status == 'resumed'
+    assert transferred == len(body) - len(body) // 3
+    assert server.state.gets()[-1]['Range'] == f"bytes={len(body) // 3}-"
+    assert read(path) == body
+
+
+def test_resume_within_one_call(server, url, tmp_path):
+    body = server.state.body
+    server.state.drop_after = len(body) // 2
+
+    path, status, transferred = download_archive(url, str(tmp_path))
+    assert status == 'resumed'
+    assert transferred == len(body)
+    assert read(path) == body
+
+
+def test_changed_etag_restarts_download(server, url, tmp_path):
+    server.state.drop_after = len(server.state.body) // 2
+    with pytest.raises(IncompleteDownload):
+        download_archive(url, str(tmp_path), max_resumes=0)
+
+    # File trên server đổi: If-Range không khớp, server trả cả file mới (200)
+    server.state.set_body(make_zip(seed=1))
+    path, status, transferred = download_archive(url, str(tmp_path))
+    assert status == 'downloaded'
+    assert transferred == len(server.state.body)
+    assert read(path) == server.state.body
+
+
+def test_416_restarts_download(server, url, tmp_path):
+    body = server.state.body
+    path, part_path, meta_path, _ = _download_paths(url, str(tmp_path))
+    # Phần tải dở dài bằng cả file nhưng chưa được đánh dấu hoàn chỉnh: Range vượt quá file
+    with open(part_path, 'wb') as f:
+        f.write(b'\0' * len(body))
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump({'url': url, 'etag': server.state.etag, 'length': len(body), 'complete': False}, f)
+
+    path, status, _ = download_archive(url, str(tmp_path))
+    assert status == 'downloaded'
+    assert read(path) == body
+    assert [headers.get('Range') for headers in server.state.gets()] == [f"bytes={len(body)}-", None]
+
+
+def test_non_zip_body_is_rejected(server, url, tmp_path):
+    server.state.set_body(b'<html>Not found</html>')
+    with pytest.raises(IncompleteDownload):
+        download_archive(url, str(tmp_path))
+    path, part_path, _, _ = _download_paths(url, str(tmp_path))
+    assert not os.path.exists(path)
+    assert not os.path.exists(part_path)
+
+
+def test_concurrent_callers_get_one_intact_archive(server, url, tmp_path):
+    body = server.state.body
+    # Gửi chậm để các lần gọi chắc chắn chồng lên nhau
+    server.state.chunk_delay = 0.02
+    results = []
+
+    def call():
+        try:
+            results.append(download_archive(url, str(tmp_path)))
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not [r for r in results if isinstance(r, Exception)]
+    assert sorted(status for _, status, _ in results) == ['cached', 'cached', 'downloaded']
+    path = results[0][0]
+    assert read(path) == body
+    with zipfile.ZipFile(path) as z:
+        assert z.testzip() is None
+
+    # Lần sau vẫn dùng lại đúng file
+    _, status, transferred = download_archive(url, str(tmp_path))
+    assert (status, transferred) == ('cached', 0)
+
+
+def test_archive_in_use_is_not_pruned(server, url, tmp_path):
+    base_url = url.rsplit('/', 1)[0]
+    others = [f"{base_url}/CafeF.SolieuGD.{day}.zip" for day in ('17102026', '18102026')]
+
+    with fetch_archive(url, str(tmp_path), keep=1) as (path, _, _):
+        # Lần tải khác (luồng khác, khóa file như process khác) dọn thư mục khi file đang được xử lý
+        thread = threading.Thread(target=lambda: [download_archive(u, str(tmp_path), keep=1) for u in others])
+        thread.start()
+        thread.join()
+        assert os.path.exists(path + '.json')
+        with zipfile.ZipFile(path) as z:
+            assert z.testzip() is None
+
+    # Hết khối with thì file lại được dọn như bình thường
+    download_archive(others[0], str(tmp_path), keep=1)
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + '.json')
@@ -0,0 +1,79 @@
+# === LỊCH GIAO DỊCH HOSE / HNX / UPCOM ===
+# Nghỉ T7, CN + bảng ngày lễ tính sẵn (dựng 1 lần khi import). Bảng ngày lễ chỉ ghi những ngày
+# chắc chắn nghỉ theo luật (Tết Dương lịch, giao thừa + mùng 1-3 Tết, Giỗ Tổ, 30/4, 1/5, 2/9):
+# lịch dùng để bỏ qua ngày khi dò CafeF, ghi thiếu ngày nghỉ chỉ tốn thêm 1 request,
+# còn ghi thừa sẽ bỏ sót 1 phiên có thật.
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+FIRST_YEAR = 2015
+LAST_YEAR = 2027
+
+# Mùng 1 Tết Nguyên đán
+LUNAR_NEW_YEAR = {
+    2015: (2, 19), 2016: (2, 8), 2017: (1, 28), 2018: (2, 16), 2019: (2, 5),
+    2020: (1, 25), 2021: (2, 12), 2022: (2, 1), 2023: (1, 22), 2024: (2, 10),
+    2025: (1, 29), 2026: (2, 17), 2027: (2, 6),
+}
+
+# Giỗ Tổ Hùng Vương (10/3 âm lịch)
+HUNG_KINGS = {
+    2015: (4, 28), 2016: (4, 16), 2017: (4, 6), 2018: (4, 25), 2019: (4, 14),
+    2020: (4, 2), 2021: (4, 21), 2022: (4, 10), 2023: (4, 29), 2024: (4, 18),
+    2025: (4, 7), 2026: (4, 26), 2027: (4, 16),
+}
+
+FIXED_HOLIDAYS = [(1, 1), (4, 30), (5, 1), (9, 2)]
+
+WEEKMASK = '1111100'
+
+
+def _build_holidays():
+    holidays = set()
+    for year in range(FIRST_YEAR, LAST_YEAR + 1):
+        for month, day in FIXED_HOLIDAYS:
+            holidays.add(date(year, month, day))
+        tet = date(year, *LUNAR_NEW_YEAR[year])
+        # Giao thừa + mùng 1-3; các ngày nghỉ bù thêm đổi theo từng năm nên không ghi
+        for offset in range(-1, 3):
+            holidays.add(tet + timedelta(days=offset))
+        holidays.add(date(year, *HUNG_KINGS[year]))
+    return np.array(sorted(holidays), dtype='datetime64[D]')
+
+
+HOLIDAYS = _build_holidays()
+CALENDAR = np.busdaycalendar(weekmask=WEEKMASK, holidays=HOLIDAYS)
+
+
+def _as_day(value):
+    if isinstance(value, datetime):
+        value = value.date()
+    return np.datetime64(value, 'D')
+
+
+def is_trading_day(day):
+    """True nếu sàn mở cửa ngày `day` (date/datetime)"""
+    return bool(np.is_busday(_as_day(day), busdaycal=CALENDAR))
+
+
+def session_cutoff(end, sessions):
+    """Ngày của phiên thứ `sessions` tính lùi từ `end` (phiên gần nhất <= end là phiên 1)"""
+    day = np.busday_offset(_as_day(end), -(max(sessions, 1) - 1), roll='backward', busdaycal=CALENDAR)
+    return pd.Timestamp(day)
+
+
+def chart_rangebreaks(dates):
+    """rangebreaks gọn cho trục x: bỏ T7-CN theo mẫu, chỉ liệt kê các ngày thường không có dữ liệu
+    (lễ, tạm ngừng giao dịch) thay vì mọi ngày trống trong khoảng hiển thị"""
+    breaks = [dict(bounds=['sat', 'mon'])]
+    if len(dates) == 0:
+        return breaks
+    present = np.unique(pd.to_datetime(dates).to_numpy().astype('datetime64[D]'))
+    weekdays = np.arange(present[0], present[-1] + 1, dtype='datetime64[D]')
+    weekdays = weekdays[np.is_busday(weekdays, weekmask=WEEKMASK)]
+    missing = np.setdiff1d(weekdays, present, assume_unique=True)
+    if len(missing):
+        breaks.append(dict(values=pd.to_datetime(missing).strftime('%Y-%m-%d').tolist()))
+    return breaks
@@ -0,0 +1,113 @@
+# === TẢI NHIỀU MÃ SONG SONG TỪ VNSTOCK3 ===
+# Không gọi st.* trong file này: các hàm chạy trên luồng phụ, kết quả trả về cho
+# luồng chính của Streamlit hiển thị.
+import time
+import random
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+# Mặc định: tối đa 4 request/giây, 6 request đang chạy cùng lúc, thử lại 3 lần
+DEFAULT_RATE_PER_SEC = 4.0
+DEFAULT_MAX_WORKERS = 6
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+
+
+class TokenBucket:
+    """Giới hạn tốc độ: trung bình `rate` request/giây, dồn tối đa `capacity` request"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Chờ đến khi có token (an toàn khi gọi từ nhiều luồng)"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_token_bucket(rate=DEFAULT_RATE_PER_SEC, burst=None):
+    """TokenBucket dùng chung cho toàn process theo (rate, burst): các session / lần gọi đồng thời
+    cùng chia 1 ngân sách request thay vì mỗi lần gọi 1 ngân sách riêng"""
+    key = (float(rate), burst)
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = _buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+
+def fetch_vnstock_history(symbol, days_back=365):
+    """Tải lịch sử giá 1 mã từ vnstock3 (TCBS) theo schema <Ticker>/<DTYYYYMMDD>/...
+
+    Lỗi được raise cho caller (để thử lại); trả về None nếu API không có dữ liệu.
+    """
+    from vnstock3 import Vnstock
+
+    stock = Vnstock().stock(symbol=symbol, source='TCBS')
+    end_date = datetime.now().strftime('%Y-%m-%d')
+    start_date = (datetime.now() - timedelta(days=days_back)).strftime('%Y-%m-%d')
+
+    df = stock.quote.history(start=start_date, end=end_date, interval='1D')
+    if df is None or df.empty:
+        return None
+
+    df = df.reset_index()
+    df = df.rename(columns={
+        'time': '<DTYYYYMMDD>', 'open': '<Open>',
+        'high': '<High>', 'low': '<Low>',
+        'close': '<Close>', 'volume': '<Volume>'
+    })
+    df['<Ticker>'] = symbol
+
+    if not pd.api.types.is_datetime64_any_dtype(df['<DTYYYYMMDD>']):
+        df['<DTYYYYMMDD>'] = pd.to_datetime(df['<DTYYYYMMDD>'])
+
+    return df[['<Ticker>', '<DTYYYYMMDD>', '<Open>', '<High>', '<Low>', '<Close>', '<Volume>']]
+
+
+def fetch_many(symbols, fetch_fn, max_workers=DEFAULT_MAX_WORKERS, rate=DEFAULT_RATE_PER_SEC,
+               burst=None, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF):
+    """Tải nhiều mã song song, yield (symbol, df, lỗi) theo thứ tự hoàn thành.
+
+    Mỗi lần gọi fetch_fn (kể cả lần thử lại) đều phải lấy token từ TokenBucket dùng chung của
+    process (get_token_bucket), nên tổng tốc độ gọi API không vượt `rate` dù có bao nhiêu luồng
+    hay bao nhiêu lần gọi fetch_many đồng thời. Số request đang chạy tối đa là `max_workers`
+    (mỗi lần gọi). Lỗi được thử lại `retries` lần với backoff lũy thừa + jitter.
+    """
+    bucket = get_token_bucket(rate, burst)
+
+    def task(symbol):
+        for attempt in range(retries + 1):
+            bucket.acquire()
+            try:
+                return symbol, fetch_fn(symbol), None
+            except Exception as e:
+                if attempt == retries:
+                    return symbol, None, e
+                time.sleep(backoff * (2 ** attempt) * (1 + random.random()))
+
+    if not symbols:
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(symbols)))) as executor:
+        futures = [executor.submit(task, symbol) for symbol in symbols]
+        for future in as_completed(futures):
+            yield future.result()